@@ -0,0 +1,55 @@
+"""带内容指纹的静态资源（static/ 目录，挂载于 /static）。
+
+启动时为每个文件计算内容哈希，模板通过 asset_url('app.css') 得到 /static/app.<哈希>.css。
+带指纹的地址内容永不改变，响应 Cache-Control: immutable，浏览器在文件修改（哈希变化）前不再请求；
+不带指纹的原始文件名仍可访问，按普通静态文件协商缓存。
+"""
+import hashlib
+from pathlib import Path
+from typing import Dict
+
+from starlette.staticfiles import StaticFiles
+
+from .config import STATIC_DIR
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def _fingerprint(name: str, digest: str) -> str:
+    stem, dot, ext = name.rpartition(".")
+    return f"{stem}.{digest}.{ext}" if dot else f"{name}.{digest}"
+
+
+def build_manifest(directory: str = STATIC_DIR) -> Dict[str, str]:
+    """{相对路径: 带指纹的相对路径}；目录不存在时为空。"""
+    root = Path(directory)
+    manifest = {}
+    if not root.is_dir():
+        return manifest
+    for path in sorted(p for p in root.rglob("*") if p.is_file()):
+        name = path.relative_to(root).as_posix()
+        digest = hashlib.sha256(path.read_bytes()).hexdigest()[:12]
+        manifest[name] = _fingerprint(name, digest)
+    return manifest
+
+
+_manifest = build_manifest()
+_originals = {v: k for k, v in _manifest.items()}
+
+
+def asset_url(name: str) -> str:
+    """模板全局函数：静态资源的带指纹地址（未知文件退回原始文件名）。"""
+    return f"/static/{_manifest.get(name, name)}"
+
+
+class FingerprintedStaticFiles(StaticFiles):
+    """把带指纹的文件名映射回原文件，并为其设置长期不可变缓存。"""
+
+    async def get_response(self, path: str, scope):
+        original = _originals.get(Path(path).as_posix())
+        if original is None:
+            return await super().get_response(path, scope)
+        response = await super().get_response(original, scope)
+        if response.status_code in (200, 304):
+            response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+        return response
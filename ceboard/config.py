@@ -4,12 +4,59 @@ from datetime import timezone, timedelta
 
 DATA_DIR = os.getenv("DATA_DIR", str(Path("./data").resolve()))
 IMAGE_DIR = os.getenv("IMAGE_DIR", str(Path("./images").resolve()))
+STATIC_DIR = os.getenv("STATIC_DIR", str(Path("./static").resolve()))  # 样式与脚本（带指纹发布，见 assets.py）
 Path(DATA_DIR).mkdir(parents=True, exist_ok=True)
 Path(IMAGE_DIR).mkdir(parents=True, exist_ok=True)
 
-DATABASE_URL = os.getenv("DATABASE_URL", f"sqlite:///{Path(DATA_DIR) / 'ctf_scoring.db'}")
+
+def _database_url(url):
+    """部分托管平台提供 postgres:// 形式的地址，SQLAlchemy 只识别 postgresql://；
+    未指定驱动的 PostgreSQL 地址使用 requirements.txt 中的 psycopg2（SQLAlchemy 2.1 起默认驱动改为 psycopg 3）。
+    """
+    for prefix in ("postgres://", "postgresql://"):
+        if url and url.startswith(prefix):
+            return "postgresql+psycopg2://" + url[len(prefix):]
+    return url
+
+
+DATABASE_URL = _database_url(os.getenv("DATABASE_URL")) or f"sqlite:///{Path(DATA_DIR) / 'ctf_scoring.db'}"
+# SQLite 连接参数：每个新连接执行对应的 PRAGMA；设为空字符串则不设置该项（保持 SQLite 默认值）
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")  # WAL 下读不阻塞写、写不阻塞读
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")  # WAL 下 NORMAL 足以保证数据库一致
+SQLITE_BUSY_TIMEOUT = os.getenv("SQLITE_BUSY_TIMEOUT", "5000")  # 毫秒，写锁被占用时等待而不是立即报 database is locked
+SQLITE_CACHE_SIZE = os.getenv("SQLITE_CACHE_SIZE", "-16000")  # 负数单位为 KiB（约 16MB）
+SQLITE_MMAP_SIZE = os.getenv("SQLITE_MMAP_SIZE", "134217728")  # 字节（128MB）
+SQLITE_TEMP_STORE = os.getenv("SQLITE_TEMP_STORE", "MEMORY")
+# 读写分离：GET 请求使用只读引擎。DATABASE_READ_URL 可指向 PostgreSQL 只读副本；
+# 未设置时 SQLite 文件库以只读方式（mode=ro）另建连接池，其他数据库读写共用主库。DB_READ_SPLIT=0 关闭
+DATABASE_READ_URL = _database_url(os.getenv("DATABASE_READ_URL")) or None
+DB_READ_SPLIT = os.getenv("DB_READ_SPLIT", "1").lower() in ("1", "true", "yes", "on")
+# 连接池（PostgreSQL 等服务端数据库；SQLite 使用 SQLAlchemy 默认设置）
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))  # 秒，等待空闲连接的上限
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # 秒，连接最长复用时间
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1").lower() in ("1", "true", "yes", "on")
+DB_STATEMENT_TIMEOUT = int(os.getenv("DB_STATEMENT_TIMEOUT", "30000"))  # 毫秒，PostgreSQL 单条语句超时，0 表示不限制
+# 写队列（见 writer.py）：开启后接入的写操作由单个写线程批量提交，缓解 SQLite 写锁争用
+WRITE_QUEUE_ENABLED = os.getenv("WRITE_QUEUE", "0").lower() in ("1", "true", "yes", "on")
+WRITE_QUEUE_SIZE = int(os.getenv("WRITE_QUEUE_SIZE", "256"))  # 最多排队的任务数
+WRITE_BATCH_SIZE = int(os.getenv("WRITE_BATCH_SIZE", "32"))  # 每次提交最多合并的任务数
+WRITE_QUEUE_TIMEOUT = float(os.getenv("WRITE_QUEUE_TIMEOUT", "30"))  # 秒，队列已满时的入队等待上限
+MD_CACHE_SIZE = int(os.getenv("MD_CACHE_SIZE", "256"))  # Markdown 渲染结果的进程内缓存条数，0 表示不缓存
+# Markdown 渲染进程池（见 render_pool.py）：默认关闭；开启后超长文本在独立进程中渲染，超时显示转义后的原文
+MD_RENDER_WORKERS = int(os.getenv("MD_RENDER_WORKERS", "0"))
+MD_RENDER_THRESHOLD = int(os.getenv("MD_RENDER_THRESHOLD", "65536"))  # 字符数，不低于该长度的文本交给进程池
+MD_RENDER_TIMEOUT = float(os.getenv("MD_RENDER_TIMEOUT", "10"))  # 秒
+SANITIZER = os.getenv("SANITIZER", "auto").strip().lower()  # Markdown HTML 清洗后端：auto / nh3 / bleach（见 sanitize.py）
+# Jinja2 模板：编译结果的字节码缓存目录（默认 DATA_DIR/template_cache，设为空关闭）；
+# TEMPLATE_AUTO_RELOAD=0 时不再检查模板文件是否修改（生产环境），TEMPLATE_WARMUP=1 时启动时预编译全部模板
+TEMPLATE_CACHE_DIR = os.getenv("TEMPLATE_CACHE_DIR", str(Path(DATA_DIR) / "template_cache"))
+TEMPLATE_AUTO_RELOAD = os.getenv("TEMPLATE_AUTO_RELOAD", "1").lower() in ("1", "true", "yes", "on")
+TEMPLATE_WARMUP = os.getenv("TEMPLATE_WARMUP", "1").lower() in ("1", "true", "yes", "on")
 SESSION_SECRET = os.getenv("SESSION_SECRET", "CloudEver-Team")
 TZ = timezone(timedelta(hours=9))  # 亚洲/东京（UTC+9）
+DB_TIMEZONE = "Asia/Tokyo"  # PostgreSQL 会话时区，与 TZ 一致：不带时区的时间列按东京时间存取
 
 MAX_AVATAR_SIZE = 1 * 1024 * 1024  # 1MB
 
@@ -1,127 +1,111 @@
-from sqlalchemy import create_engine, text
+import re
+from pathlib import Path
+from urllib.parse import quote
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import declarative_base, sessionmaker
-from sqlalchemy import inspect as sa_inspect
 
-from .config import DATABASE_URL
+from .config import (
+    DATABASE_READ_URL, DATABASE_URL, DB_READ_SPLIT, DB_MAX_OVERFLOW, DB_POOL_PRE_PING, DB_POOL_RECYCLE, DB_POOL_SIZE, DB_POOL_TIMEOUT,
+    DB_STATEMENT_TIMEOUT, DB_TIMEZONE, SQLITE_BUSY_TIMEOUT, SQLITE_CACHE_SIZE, SQLITE_JOURNAL_MODE, SQLITE_MMAP_SIZE,
+    SQLITE_SYNCHRONOUS, SQLITE_TEMP_STORE,
+)
+
+
+def engine_options(url) -> dict:
+    """按方言返回 create_engine 的参数：SQLite 允许跨线程使用连接；
+    服务端数据库（PostgreSQL 等）配置连接池，PostgreSQL 另设语句超时与会话时区。
+    """
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend == "sqlite":
+        return {"connect_args": {"check_same_thread": False}}
+    opts = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+    if backend == "postgresql":
+        settings = {"timezone": DB_TIMEZONE}
+        if DB_STATEMENT_TIMEOUT > 0:
+            settings["statement_timeout"] = str(DB_STATEMENT_TIMEOUT)
+        if url.get_driver_name() in ("psycopg2", "psycopg"):
+            opts["connect_args"] = {"options": " ".join(f"-c {k}={v}" for k, v in settings.items())}
+    return opts
+
 
 Base = declarative_base()
-connect_args = {"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
-engine = create_engine(DATABASE_URL, connect_args=connect_args)
+engine = create_engine(DATABASE_URL, **engine_options(DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 顺序有意义：journal_mode 需在其他设置之前切换
+SQLITE_PRAGMAS = [
+    ("journal_mode", SQLITE_JOURNAL_MODE),
+    ("synchronous", SQLITE_SYNCHRONOUS),
+    ("busy_timeout", SQLITE_BUSY_TIMEOUT),
+    ("cache_size", SQLITE_CACHE_SIZE),
+    ("mmap_size", SQLITE_MMAP_SIZE),
+    ("temp_store", SQLITE_TEMP_STORE),
+]
+_PRAGMA_VALUE = re.compile(r"^-?[A-Za-z0-9_]+$")
 
-def init_db_and_migrate():
-    Base.metadata.create_all(bind=engine)
+
+def _apply_sqlite_pragmas(dbapi_conn, connection_record, read_only: bool = False):
+    cur = dbapi_conn.cursor()
     try:
-        inspector = sa_inspect(engine)
-        # users.avatar_filename
-        cols = [c.get('name') or c.get('name_') for c in inspector.get_columns('users')]
-        if 'avatar_filename' not in cols:
-            with engine.connect() as conn:
-                conn.execute(text("ALTER TABLE users ADD COLUMN avatar_filename VARCHAR"))
-                conn.commit()
-        if 'is_deleted' not in cols:
-            with engine.connect() as conn:
-                conn.execute(text("ALTER TABLE users ADD COLUMN is_deleted BOOLEAN DEFAULT 0"))
-                conn.commit()
-        if 'email' not in cols:
-            with engine.connect() as conn:
-                conn.execute(text("ALTER TABLE users ADD COLUMN email VARCHAR"))
-                conn.commit()
-        if 'show_on_leaderboard' not in cols:
-            with engine.connect() as conn:
-                conn.execute(text("ALTER TABLE users ADD COLUMN show_on_leaderboard BOOLEAN DEFAULT 1"))
-                conn.commit()
-
-        # events.allow_wp_only, events.is_deleted
-        evt_cols = [c.get('name') or c.get('name_') for c in inspector.get_columns('events')]
-        with engine.connect() as conn:
-            if 'allow_wp_only' not in evt_cols:
-                conn.execute(text("ALTER TABLE events ADD COLUMN allow_wp_only BOOLEAN DEFAULT 0"))
-                conn.commit()
-            if 'is_deleted' not in evt_cols:
-                conn.execute(text("ALTER TABLE events ADD COLUMN is_deleted BOOLEAN DEFAULT 0"))
-                conn.commit()
-            if 'event_type_id' not in evt_cols:
-                conn.execute(text("ALTER TABLE events ADD COLUMN event_type_id INTEGER"))
-                conn.commit()
-            if 'remark' not in evt_cols:
-                conn.execute(text("ALTER TABLE events ADD COLUMN remark TEXT"))
-                conn.commit()
-
-        # challenges.is_deleted
-        ch_cols = [c.get('name') or c.get('name_') for c in inspector.get_columns('challenges')]
-        if 'is_deleted' not in ch_cols:
-            with engine.connect() as conn:
-                conn.execute(text("ALTER TABLE challenges ADD COLUMN is_deleted BOOLEAN DEFAULT 0"))
-                conn.commit()
-        if 'direction' not in ch_cols:
-            with engine.connect() as conn:
-                conn.execute(text("ALTER TABLE challenges ADD COLUMN direction VARCHAR"))
-                conn.commit()
-
-        # submissions.manual_points
-        sub_cols = [c.get('name') or c.get('name_') for c in inspector.get_columns('submissions')]
-        if 'manual_points' not in sub_cols:
-            with engine.connect() as conn:
-                conn.execute(text("ALTER TABLE submissions ADD COLUMN manual_points FLOAT"))
-                conn.commit()
-        # submissions.is_deleted
-        sub_cols = [c.get('name') or c.get('name_') for c in inspector.get_columns('submissions')]
-        if 'is_deleted' not in sub_cols:
-            with engine.connect() as conn:
-                conn.execute(text("ALTER TABLE submissions ADD COLUMN is_deleted BOOLEAN DEFAULT 0"))
-                conn.commit()
-        # submissions.rejected related
-        sub_cols = [c.get('name') or c.get('name_') for c in inspector.get_columns('submissions')]
-        with engine.connect() as conn:
-            if 'rejected' not in sub_cols:
-                conn.execute(text("ALTER TABLE submissions ADD COLUMN rejected BOOLEAN DEFAULT 0"))
-                conn.commit()
-            if 'rejected_reason' not in sub_cols:
-                conn.execute(text("ALTER TABLE submissions ADD COLUMN rejected_reason TEXT"))
-                conn.commit()
-            if 'rejected_at' not in sub_cols:
-                conn.execute(text("ALTER TABLE submissions ADD COLUMN rejected_at TIMESTAMP"))
-                conn.commit()
-            if 'rejected_by_id' not in sub_cols:
-                conn.execute(text("ALTER TABLE submissions ADD COLUMN rejected_by_id INTEGER"))
-                conn.commit()
-
-        # notifications table (create if missing)
-        try:
-            inspector.get_columns('notifications')
-        except Exception:
-            # Fallback create when inspector fails; ensure id, user_id, type, content, related_id, created_at, read_at, is_deleted
-            with engine.connect() as conn:
-                conn.execute(text(
-                    """
-                    CREATE TABLE IF NOT EXISTS notifications (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        user_id INTEGER NOT NULL,
-                        type VARCHAR NOT NULL,
-                        title VARCHAR,
-                        content TEXT NOT NULL,
-                        related_id INTEGER,
-                        created_at TIMESTAMP,
-                        read_at TIMESTAMP,
-                        is_deleted BOOLEAN DEFAULT 0
-                    )
-                    """
-                ))
-                conn.commit()
-        # add title column if missing (upgrade path)
-        try:
-            notif_cols = [c.get('name') or c.get('name_') for c in inspector.get_columns('notifications')]
-            if 'title' not in notif_cols:
-                with engine.connect() as conn:
-                    conn.execute(text("ALTER TABLE notifications ADD COLUMN title VARCHAR"))
-                    conn.commit()
-            if 'batch_id' not in notif_cols:
-                with engine.connect() as conn:
-                    conn.execute(text("ALTER TABLE notifications ADD COLUMN batch_id VARCHAR"))
-                    conn.commit()
-        except Exception:
-            pass
-    except Exception:
-        pass
+        for name, value in SQLITE_PRAGMAS:
+            value = (value or "").strip()
+            if not value:
+                continue
+            if read_only and name in ("journal_mode", "synchronous"):
+                # 只读连接不能切换日志模式；WAL 由主库连接设置并持久保存在数据库文件中
+                continue
+            if not _PRAGMA_VALUE.match(value):
+                raise ValueError(f"SQLite 参数 {name} 的取值无效：{value!r}")
+            cur.execute(f"PRAGMA {name} = {value}")
+    finally:
+        cur.close()
+
+
+def _apply_sqlite_read_pragmas(dbapi_conn, connection_record):
+    _apply_sqlite_pragmas(dbapi_conn, connection_record, read_only=True)
+
+
+def _listen_sqlite_pragmas(sync_engine) -> None:
+    if sync_engine.dialect.name == "sqlite":
+        read_only = sync_engine.url.query.get("mode") == "ro"
+        event.listen(sync_engine, "connect", _apply_sqlite_read_pragmas if read_only else _apply_sqlite_pragmas)
+
+
+_listen_sqlite_pragmas(engine)
+
+
+def read_database_url():
+    """只读引擎的 URL；返回 None 表示读写共用主库。"""
+    if not DB_READ_SPLIT:
+        return None
+    if DATABASE_READ_URL:
+        return make_url(DATABASE_READ_URL)
+    url = make_url(DATABASE_URL)
+    if url.get_backend_name() != "sqlite" or not url.database or url.database == ":memory:" or url.database.startswith("file:"):
+        return None
+    path = quote(Path(url.database).resolve().as_posix(), safe="/:")
+    return url.set(database=f"file:{path}", query={"mode": "ro", "uri": "true"})
+
+
+_read_url = read_database_url()
+if _read_url is not None:
+    read_engine = create_engine(_read_url, **engine_options(_read_url))
+    _listen_sqlite_pragmas(read_engine)
+    ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+else:
+    read_engine, ReadSessionLocal = engine, SessionLocal
+
+
+def init_db_and_migrate():
+    """建表并执行版本化迁移（见 migrations.py）；已是最新版本时只读取一次 schema_version。"""
+    from .migrations import run_migrations
+    run_migrations()
@@ -3,14 +3,42 @@ from pathlib import Path
 from fastapi import Depends, HTTPException, Request
 from fastapi.responses import HTMLResponse
 from starlette import status
-from jinja2 import Environment, FileSystemLoader, select_autoescape
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, select_autoescape
+from sqlalchemy.orm import object_session
+
+from .assets import asset_url
+from .database import ReadSessionLocal, SessionLocal
+from .models import User
+from .notify import unread_summary
+from .config import IMAGE_DIR, TEMPLATE_AUTO_RELOAD, TEMPLATE_CACHE_DIR
+
+def _bytecode_cache() -> Optional[FileSystemBytecodeCache]:
+    """模板编译结果的持久化缓存：worker 重启或新部署后无需重新解析模板；目录不可写时不启用。"""
+    if not TEMPLATE_CACHE_DIR:
+        return None
+    try:
+        Path(TEMPLATE_CACHE_DIR).mkdir(parents=True, exist_ok=True)
+    except OSError:
+        return None
+    return FileSystemBytecodeCache(TEMPLATE_CACHE_DIR)
 
-from .database import SessionLocal
-from .models import User, Notification
-from .config import IMAGE_DIR
 
 # Jinja2 环境（从 templates/ 加载）
-jinja_env = Environment(loader=FileSystemLoader(str(Path('./templates').resolve())), autoescape=select_autoescape(['html']))
+jinja_env = Environment(
+    loader=FileSystemLoader(str(Path('./templates').resolve())),
+    autoescape=select_autoescape(['html']),
+    bytecode_cache=_bytecode_cache(),
+    auto_reload=TEMPLATE_AUTO_RELOAD,
+)
+jinja_env.globals['asset_url'] = asset_url
+
+
+def precompile_templates() -> int:
+    """加载并编译全部模板（启动时调用），首个请求不再承担编译开销；返回模板数。"""
+    names = jinja_env.list_templates(filter_func=lambda n: n.endswith('.html'))
+    for name in names:
+        jinja_env.get_template(name)
+    return len(names)
 
 
 def render_template(name: str, **ctx) -> HTMLResponse:
@@ -18,18 +46,23 @@ def render_template(name: str, **ctx) -> HTMLResponse:
     status_code = int(ctx.pop('status_code', 200))
     if 'avatar_url' not in ctx:
         ctx['avatar_url'] = _build_avatar_url(ctx.get('current_user'))
-    # 全局未读通知（当前用户）
+    # 全局未读通知（当前用户）：未读数取自 users.unread_notifications 计数列，
+    # 预览复用请求中 current_user 所属的会话并按用户缓存
     cu = ctx.get('current_user')
-    if cu:
+    if cu and ('unread_count' not in ctx or 'notifications' not in ctx):
         try:
-            from .database import SessionLocal
-            with SessionLocal() as db:
-                unread = db.query(Notification).filter(Notification.user_id == cu.id, Notification.is_deleted == False, Notification.read_at == None).order_by(Notification.created_at.desc()).limit(5).all()
-                ctx['notifications'] = unread
-                ctx['unread_count'] = db.query(Notification).filter(Notification.user_id == cu.id, Notification.is_deleted == False, Notification.read_at == None).count()
+            db = object_session(cu)
+            if db is not None:
+                count, preview = unread_summary(db, cu)
+            else:
+                with ReadSessionLocal() as db:
+                    u = db.get(User, cu.id)
+                    count, preview = unread_summary(db, u) if u else (0, [])
+            ctx.setdefault('notifications', preview)
+            ctx.setdefault('unread_count', count)
         except Exception:
-            ctx['notifications'] = []
-            ctx['unread_count'] = 0
+            ctx.setdefault('notifications', [])
+            ctx.setdefault('unread_count', 0)
     html = jinja_env.get_template(name).render(**ctx)
     return HTMLResponse(html, status_code=status_code)
 
@@ -43,7 +76,16 @@ def _build_avatar_url(user: Optional[User]) -> Optional[str]:
     return None
 
 
-def get_db():
+def get_db(request: Request):
+    """GET/HEAD 请求使用只读引擎的会话，其他请求使用主库；GET 路由需要写入时改用 get_write_db。"""
+    db = ReadSessionLocal() if request.method in ("GET", "HEAD") else SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def get_write_db():
     db = SessionLocal()
     try:
         yield db
@@ -1,12 +1,16 @@
 from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.staticfiles import StaticFiles
 from starlette.middleware.sessions import SessionMiddleware
 from fastapi.responses import RedirectResponse
 from fastapi.exception_handlers import http_exception_handler as default_http_exception_handler
 
-from .config import IMAGE_DIR, SESSION_SECRET
-from .deps import render_template
-from .database import init_db_and_migrate, SessionLocal
+from .assets import FingerprintedStaticFiles
+from .config import IMAGE_DIR, SESSION_SECRET, STATIC_DIR, TEMPLATE_WARMUP
+from .deps import precompile_templates, render_template
+from .database import init_db_and_migrate, ReadSessionLocal, SessionLocal
+from .writer import start_writer, stop_writer
+from .render_pool import shutdown_render_pool
 from .models import User
 from passlib.hash import pbkdf2_sha256 as pwdhash
 
@@ -17,12 +21,13 @@ from contextlib import asynccontextmanager
 app = FastAPI(title="CTF 战队考核系统")
 app.add_middleware(SessionMiddleware, secret_key=SESSION_SECRET)
 app.mount("/images", StaticFiles(directory=IMAGE_DIR), name="images")
+app.mount("/static", FingerprintedStaticFiles(directory=STATIC_DIR, check_dir=False), name="static")
 
 
 @asynccontextmanager
 async def lifespan(app):
-    # 初始化数据库和轻量迁移
-    init_db_and_migrate()
+    # 初始化数据库和轻量迁移（迁移可能渲染大量 WP，在线程中执行，进程池只能从线程中同步等待）
+    await run_in_threadpool(init_db_and_migrate)
     # 默认管理员账号（若无用户时）
     with SessionLocal() as db:
         if db.query(User).count() == 0:
@@ -33,7 +38,14 @@ async def lifespan(app):
                 team_type="main",
             ))
             db.commit()
+    # 写队列（WRITE_QUEUE=1 时启动写线程）
+    start_writer()
+    # 预编译模板（TEMPLATE_WARMUP=1）
+    if TEMPLATE_WARMUP:
+        precompile_templates()
     yield
+    stop_writer()
+    shutdown_render_pool()
 
 # 使用 lifespan 替代已弃用的 @app.on_event("startup")
 app.router.lifespan_context = lifespan
@@ -62,7 +74,7 @@ async def not_found_exception_handler(request: Request, exc: HTTPException):
         uid = request.session.get("user_id")
         user = None
         if uid:
-            with SessionLocal() as db:
+            with ReadSessionLocal() as db:
                 user = db.get(User, uid)
     except Exception:
         user = None
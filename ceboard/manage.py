@@ -0,0 +1,214 @@
+"""运维命令行：python -m ceboard.manage <command>"""
+import argparse
+import re
+import sys
+from contextlib import contextmanager
+
+from .database import SessionLocal, engine, init_db_and_migrate
+
+
+def cmd_rebuild_scores(args) -> None:
+    from .scores import rebuild_user_month_scores
+    with SessionLocal() as db:
+        n = rebuild_user_month_scores(db)
+        db.commit()
+    print(f"user_month_scores 已重建：{n} 行")
+
+
+def cmd_repair_unread(args) -> None:
+    from .notify import recount_unread
+    with SessionLocal() as db:
+        recount_unread(db)
+        db.commit()
+    print("users.unread_notifications 已按通知回执重新统计")
+
+
+def cmd_render_markdown(args) -> None:
+    from .utils import prerender_stored_html
+    with SessionLocal() as db:
+        n = prerender_stored_html(db, force=args.force)
+        db.commit()
+    print(f"已写入 {n} 条渲染后的 HTML")
+
+
+# 行数随使用增长的表：对它们的查询不允许全表扫描
+LARGE_TABLES = frozenset([
+    "submissions", "submission_items", "notification_messages", "notification_receipts",
+    "point_adjustments", "user_month_scores",
+])
+# 区分度很低的列：只按这些列定位的索引查找与全表扫描相差无几
+LOW_SELECTIVITY_COLUMNS = frozenset(["is_deleted"])
+
+
+@contextmanager
+def capture_statements():
+    """记录期间在所有引擎上执行的 SQL 及参数：[(statement, parameters)]，executemany 的语句不记录。"""
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if not executemany:
+            statements.append((statement, parameters))
+
+    event.listen(Engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(Engine, "before_cursor_execute", before_cursor_execute)
+
+
+def query_plan(db, statement: str, parameters=()) -> list:
+    """SQLite 的 EXPLAIN QUERY PLAN 明细（每步一行）。"""
+    plan = db.connection().exec_driver_sql("EXPLAIN QUERY PLAN " + statement, tuple(parameters or ())).all()
+    return [row[-1] for row in plan]
+
+
+def plan_problems(details: list) -> list:
+    """执行计划的问题：对大表不走索引的全表扫描，或只按低区分度列（is_deleted）查找的索引。"""
+    problems = []
+    for d in details:
+        m = re.match(r"SCAN (\w+)( AS \w+)?$", d)
+        if m and m.group(1) in LARGE_TABLES:
+            problems.append(f"全表扫描：{d}")
+        m = re.match(r"SEARCH (\w+)(?: AS \w+)? USING (?:COVERING )?INDEX (\w+) \((.*)\)$", d)
+        if m and m.group(1) in LARGE_TABLES:
+            columns = {c.split("=")[0].split(">")[0].split("<")[0].strip() for c in m.group(3).split(" AND ")}
+            if columns <= LOW_SELECTIVITY_COLUMNS:
+                problems.append(f"索引 {m.group(2)} 只按 {', '.join(sorted(columns))} 查找：{d}")
+    return problems
+
+
+def explain_statements(db, statements) -> list:
+    """[(statement, 执行计划, 问题)]，相同语句只检查一次；只检查 SELECT / UPDATE / DELETE / INSERT ... SELECT。"""
+    results, seen = [], set()
+    for statement, parameters in statements:
+        head = statement.lstrip().split(None, 1)[0].upper()
+        if statement in seen or head not in ("SELECT", "UPDATE", "DELETE", "INSERT", "WITH"):
+            continue
+        if head == "INSERT" and "SELECT" not in statement.upper():
+            continue
+        seen.add(statement)
+        details = query_plan(db, statement, parameters)
+        results.append((statement, details, plan_problems(details)))
+    return results
+
+
+def hot_path_samples(db):
+    """（成员, 提交）样本：未读通知最多的未删除成员与第一条未删除提交，库为空时为 None。"""
+    from .models import Submission, User
+    user = db.query(User).filter(User.is_deleted == False).order_by(User.unread_notifications.desc(), User.id).first()
+    sub = db.query(Submission).filter(Submission.is_deleted == False).order_by(Submission.id).first()
+    return user, sub
+
+
+def run_hot_paths(db, user, sub) -> None:
+    """调用排行榜、积分、未读通知与增量重算的实际函数；包含写操作，调用方负责回滚。"""
+    from . import notify
+    from .scores import refresh_for_submissions, user_points
+    from .utils import leaderboard_count_approved, leaderboard_month_and_total, now_tokyo
+    now = now_tokyo()
+    for team in ("main", "sub"):
+        leaderboard_month_and_total(db, now.year, now.month, team)
+        leaderboard_count_approved(db, now.year, now.month, team)
+    if user is not None:
+        user_points(db, user.id, now.year, now.month)
+        notify._unread_cache.pop(user.id, None)
+        notify.unread_summary(db, user)
+    if sub is not None:
+        refresh_for_submissions(db, [sub])
+
+
+def cmd_check_plans(args) -> None:
+    """记录积分、排行榜与通知函数实际执行的 SQL 并逐条 EXPLAIN QUERY PLAN（仅 SQLite），
+    对大表全表扫描或只按 is_deleted 查找索引时以非零状态退出。页面路由的同类检查见 tests/test_query_plans.py。
+    """
+    if engine.dialect.name != "sqlite":
+        print("check-plans 仅支持 SQLite，已跳过")
+        return
+    failed = 0
+    with SessionLocal() as db:
+        try:
+            user, sub = hot_path_samples(db)
+            with capture_statements() as statements:
+                run_hot_paths(db, user, sub)
+            for statement, details, problems in explain_statements(db, statements):
+                failed += bool(problems)
+                print(f"[{'FAIL' if problems else 'ok'}] {' '.join(statement.split())[:120]}")
+                print(f"    {' | '.join(details)}")
+                for p in problems:
+                    print(f"    {p}")
+        finally:
+            db.rollback()
+    if failed:
+        print(f"{failed} 条语句的执行计划不合格")
+        sys.exit(1)
+
+
+def _sample_wp(sections: int = 30) -> str:
+    """接近真实体积的 WP：标题、正文、列表、链接、表格与代码块。"""
+    parts = []
+    for i in range(sections):
+        parts.append(f"## 第 {i} 题 web-{i}\n\n题目给了一个登录页，观察到 **session** 可控，尝试 `SSTI`，参考 [文档](https://example.com/{i})。\n")
+        parts.append("- 信息收集\n- 构造 payload\n- 拿到 flag\n\n| 步骤 | 说明 |\n|---|---|\n| 1 | 扫描 |\n| 2 | 利用 |\n")
+        parts.append("```python\nimport requests\nr = requests.post('http://target/login', data={'u': \"{{7*7}}\"})\nprint(r.text)\n```\n")
+        parts.append("> 注意 <b>过滤</b> 了 <script>alert(1)</script> 与 onerror。\n")
+    return "\n".join(parts)
+
+
+def cmd_check_sanitizer(args) -> None:
+    """用同一组 XSS 样例检查每个已安装的清洗后端，并比较在 WP 体积输入上的吞吐；不合格时以非零状态退出。"""
+    import time
+    import markdown as mdlib
+    from .sanitize import XSS_SAMPLES, available_backends, backend_name, sanitize, unsafe_parts
+    backends = available_backends()
+    if not backends:
+        print("未安装 bleach 或 nh3")
+        sys.exit(1)
+    print(f"当前后端：{backend_name(sanitize)}")
+    render = lambda md: mdlib.markdown(md, extensions=["fenced_code", "tables"]) or ""
+    failed = 0
+    for name, clean in backends.items():
+        bad = [(sample, parts) for sample in XSS_SAMPLES for parts in [unsafe_parts(clean(render(sample)))] if parts]
+        failed += len(bad)
+        print(f"[{'FAIL' if bad else 'ok'}] {name}: {len(XSS_SAMPLES) - len(bad)}/{len(XSS_SAMPLES)} 个样例通过")
+        for sample, parts in bad:
+            print(f"    {sample!r} -> {parts}")
+    html = render(_sample_wp())
+    size_kb = len(html.encode("utf-8")) / 1024
+    rates = {}
+    for name, clean in backends.items():
+        clean(html)
+        start = time.perf_counter()
+        for _ in range(args.rounds):
+            clean(html)
+        per_doc = (time.perf_counter() - start) / args.rounds
+        rates[name] = per_doc
+        print(f"{name}: {per_doc * 1000:.2f} ms/篇（{size_kb:.0f} KB HTML），{size_kb / per_doc / 1024:.1f} MB/s")
+    if len(rates) > 1:
+        fastest = min(rates, key=rates.get)
+        slowest = max(rates, key=rates.get)
+        print(f"{fastest} 比 {slowest} 快 {rates[slowest] / rates[fastest]:.1f} 倍")
+    if failed:
+        sys.exit(1)
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m ceboard.manage", description="CloudEver 积分系统运维命令")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("rebuild-scores", help="从提交与积分调整全量重建 user_month_scores").set_defaults(func=cmd_rebuild_scores)
+    sub.add_parser("repair-unread", help="从通知回执重新统计每位成员的未读通知数").set_defaults(func=cmd_repair_unread)
+    sub.add_parser("check-plans", help="检查积分、排行榜与通知查询的执行计划，出现大表全表扫描时返回非零").set_defaults(func=cmd_check_plans)
+    p = sub.add_parser("render-markdown", help="为 WP、公告与规则写入渲染好的 HTML（默认只补齐缺失的）")
+    p.add_argument("--force", action="store_true", help="全部重新渲染（更换 Markdown 扩展或清洗规则后使用）")
+    p.set_defaults(func=cmd_render_markdown)
+    p = sub.add_parser("check-sanitizer", help="用 XSS 样例检查各 HTML 清洗后端，并比较吞吐")
+    p.add_argument("--rounds", type=int, default=20, help="基准测试的重复次数")
+    p.set_defaults(func=cmd_check_sanitizer)
+    args = parser.parse_args(argv)
+    init_db_and_migrate()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+"""按版本号顺序执行的数据库迁移。
+
+settings 表中的 schema_version 记录已完成的最高步骤：启动时只读取这一行，已是最新版本则直接返回，
+不再逐表检查列。每个步骤在各自的事务内执行并同时写入新版本号；步骤本身是幂等的
+（先检查列/表是否存在），因此中途失败后重新启动会从失败的步骤继续。迁移失败会抛出异常终止启动，
+而不是静默跳过。
+
+新增迁移：在 STEPS 末尾追加 (版本号, 说明, 函数)，函数接收处于事务中的 Connection。
+"""
+from typing import Callable, List, Optional, Tuple
+
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from .config import TZ
+from .database import Base, engine
+from .models import epoch_of
+
+SCHEMA_VERSION_KEY = "schema_version"
+
+
+def _columns(conn: Connection, table: str) -> set:
+    return {c.get('name') for c in sa_inspect(conn).get_columns(table)}
+
+
+def _add_columns(conn: Connection, table: str, specs: List[Tuple[str, str]]) -> List[str]:
+    """补齐缺失的列（specs 为 (列名, 列定义)），返回实际新增的列名。"""
+    existing = _columns(conn, table)
+    added = []
+    for name, ddl in specs:
+        if name not in existing:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+            added.append(name)
+    return added
+
+
+def _bool(conn: Connection, value: bool) -> str:
+    """布尔字面量：SQLite 为 1/0，PostgreSQL 等为 true/false。"""
+    if conn.dialect.name == "sqlite":
+        return "1" if value else "0"
+    return "true" if value else "false"
+
+
+def _reset_sequence(conn: Connection, table: str) -> None:
+    """显式写入 id 后，把 PostgreSQL 的自增序列推进到当前最大 id（SQLite 无需处理）。"""
+    if conn.dialect.name == "postgresql":
+        conn.execute(text(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE((SELECT MAX(id) FROM {table}), 0) + 1, false)"))
+
+
+def ensure_settings(conn: Connection) -> None:
+    """写入运行时只做 UPDATE 的设置行（score_version），已存在时不做修改。"""
+    from .scores import SCORE_VERSION_KEY
+    exists = conn.execute(text("SELECT 1 FROM settings WHERE key = :k"), {"k": SCORE_VERSION_KEY}).first()
+    if not exists:
+        conn.execute(text("INSERT INTO settings (key, value) VALUES (:k, '0')"), {"k": SCORE_VERSION_KEY})
+
+
+def _session(conn: Connection) -> Session:
+    # 加入步骤所在的事务：由步骤统一提交或回滚
+    return Session(bind=conn, autoflush=False)
+
+
+def step_base_columns(conn: Connection) -> None:
+    """早期版本陆续增加的列。"""
+    false, true = _bool(conn, False), _bool(conn, True)
+    _add_columns(conn, "users", [
+        ("avatar_filename", "VARCHAR"),
+        ("is_deleted", f"BOOLEAN DEFAULT {false}"),
+        ("email", "VARCHAR"),
+        ("show_on_leaderboard", f"BOOLEAN DEFAULT {true}"),
+    ])
+    _add_columns(conn, "events", [
+        ("allow_wp_only", f"BOOLEAN DEFAULT {false}"),
+        ("is_deleted", f"BOOLEAN DEFAULT {false}"),
+        ("event_type_id", "INTEGER"),
+        ("remark", "TEXT"),
+    ])
+    _add_columns(conn, "challenges", [
+        ("is_deleted", f"BOOLEAN DEFAULT {false}"),
+        ("direction", "VARCHAR"),
+    ])
+    _add_columns(conn, "submissions", [
+        ("manual_points", "FLOAT"),
+        ("is_deleted", f"BOOLEAN DEFAULT {false}"),
+        ("rejected", f"BOOLEAN DEFAULT {false}"),
+        ("rejected_reason", "TEXT"),
+        ("rejected_at", "TIMESTAMP"),
+        ("rejected_by_id", "INTEGER"),
+    ])
+
+
+def step_submission_stats(conn: Connection) -> None:
+    """提交计分列与 user_month_scores：补列后整体回填并重建月度汇总。"""
+    _add_columns(conn, "submissions", [
+        ("points_cached", "FLOAT DEFAULT 0"),
+        ("ok_count", "INTEGER DEFAULT 0"),
+        ("pending_count", "INTEGER DEFAULT 0"),
+        ("revoked_count", "INTEGER DEFAULT 0"),
+        ("review_state", "VARCHAR DEFAULT 'pending'"),
+    ])
+    from .scores import rebuild_user_month_scores
+    ensure_settings(conn)
+    with _session(conn) as db:
+        rebuild_user_month_scores(db)
+        db.flush()
+
+
+def step_split_notifications(conn: Connection) -> None:
+    """旧版 notifications（每位收件人一份完整正文）拆分为 notification_messages + notification_receipts。
+    同一 batch_id（或单条通知）合并为一条正文，正文 id 取组内最小的旧通知 id，回执沿用旧通知 id，
+    因此 /notifications/<id> 与 single-<id> 链接保持有效。迁移后旧表改名为 notifications_legacy。
+    """
+    if not sa_inspect(conn).has_table("notifications"):
+        return
+    cols = _columns(conn, "notifications")
+    title = "title" if 'title' in cols else "NULL"
+    batch = "batch_id" if 'batch_id' in cols else "NULL"
+    false = _bool(conn, False)
+    deleted = f"COALESCE(n.is_deleted, {false})" if 'is_deleted' in cols else false
+    message_id = "n.id" if batch == "NULL" else "CASE WHEN n.batch_id IS NULL THEN n.id ELSE (SELECT MIN(n2.id) FROM notifications n2 WHERE n2.batch_id = n.batch_id) END"
+    conn.execute(text(
+        f"""
+        INSERT INTO notification_messages (id, type, title, content, related_id, batch_id, created_at)
+        SELECT id, type, {title}, content, related_id, {batch}, created_at FROM notifications
+        WHERE id IN (SELECT MIN(id) FROM notifications GROUP BY COALESCE({batch}, 'single-' || CAST(id AS VARCHAR)))
+        """
+    ))
+    conn.execute(text(
+        f"""
+        INSERT INTO notification_receipts (id, user_id, message_id, read_at, is_deleted)
+        SELECT n.id, n.user_id, {message_id}, n.read_at, {deleted} FROM notifications n
+        """
+    ))
+    _reset_sequence(conn, "notification_messages")
+    _reset_sequence(conn, "notification_receipts")
+    conn.execute(text("ALTER TABLE notifications RENAME TO notifications_legacy"))
+
+
+def step_unread_counter(conn: Connection) -> None:
+    """users.unread_notifications：补列后从回执表统计。"""
+    _add_columns(conn, "users", [("unread_notifications", "INTEGER DEFAULT 0")])
+    from .notify import recount_unread
+    with _session(conn) as db:
+        recount_unread(db)
+        db.flush()
+
+
+def _create_indexes(conn: Connection) -> None:
+    """按模型定义补建二级索引（create_all 不会为已存在的表补建索引）；
+    所需列尚未由后续步骤加入的索引先跳过，由加列的步骤再次调用时建立。
+    """
+    for table in Base.metadata.sorted_tables:
+        existing = _columns(conn, table.name)
+        for index in table.indexes:
+            if all(c.name in existing for c in index.columns):
+                index.create(bind=conn, checkfirst=True)
+
+
+def step_indexes(conn: Connection) -> None:
+    """二级索引。"""
+    _create_indexes(conn)
+
+
+# 需要 created_ts 的表
+_TS_TABLES = ("submissions", "submission_items", "notification_messages", "point_adjustments")
+
+
+def step_created_ts(conn: Connection) -> None:
+    """created_ts（created_at 的 UTC 时间戳）：补列、按 created_at 回填并建立索引。
+    SQLite 中 created_at 以东京本地时间的文本保存，截去小数秒（与 epoch_of 一致）后换算并减去 TZ 偏移；
+    PostgreSQL 的列带时区，直接取 epoch。
+    """
+    offset = int(TZ.utcoffset(None).total_seconds())
+    for table in _TS_TABLES:
+        _add_columns(conn, table, [("created_ts", "BIGINT")])
+        if conn.dialect.name == "sqlite":
+            conn.execute(text(
+                f"UPDATE {table} SET created_ts = CAST(strftime('%s', substr(created_at, 1, 19)) AS INTEGER) - :offset "
+                "WHERE created_ts IS NULL AND created_at IS NOT NULL"
+            ), {"offset": offset})
+        elif conn.dialect.name == "postgresql":
+            conn.execute(text(
+                f"UPDATE {table} SET created_ts = CAST(FLOOR(EXTRACT(EPOCH FROM created_at)) AS BIGINT) "
+                "WHERE created_ts IS NULL AND created_at IS NOT NULL"
+            ))
+        else:
+            rows = conn.execute(text(f"SELECT id, created_at FROM {table} WHERE created_ts IS NULL AND created_at IS NOT NULL")).all()
+            for row_id, created_at in rows:
+                conn.execute(text(f"UPDATE {table} SET created_ts = :ts WHERE id = :id"), {"ts": epoch_of(created_at), "id": row_id})
+    _create_indexes(conn)
+
+
+def step_rendered_html(conn: Connection) -> None:
+    """保存时渲染的 HTML 列（submissions.wp_html、announcements.content_html）：补列并为已有内容渲染。"""
+    _add_columns(conn, "submissions", [("wp_html", "TEXT")])
+    _add_columns(conn, "announcements", [("content_html", "TEXT")])
+    from .utils import prerender_stored_html
+    prerender_stored_html(conn)
+
+
+def step_settings(conn: Connection) -> None:
+    """积分版本号 score_version 的初始行。"""
+    ensure_settings(conn)
+
+
+def _rebuild_indexes(conn: Connection, drop: List[str]) -> None:
+    """删除定义已变更或已废弃的索引，再按模型补建。"""
+    for name in drop:
+        conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+    _create_indexes(conn)
+
+
+def step_submissions_ts_index(conn: Connection) -> None:
+    """以 is_deleted 开头的提交索引改为部分索引（WHERE is_deleted = 0）：
+    ix_submissions_ts 改为 ix_submissions_live_ts(created_ts)，ix_submissions_review / ix_submissions_created 去掉 is_deleted 列。
+    """
+    _rebuild_indexes(conn, ["ix_submissions_ts", "ix_submissions_review", "ix_submissions_created"])
+
+
+def step_submissions_event_index(conn: Connection) -> None:
+    """ix_submissions_event 加上 is_deleted 列，活动下未删除提交的查询不再回表过滤。"""
+    _rebuild_indexes(conn, ["ix_submissions_event"])
+
+
+def step_drop_unused_ts_indexes(conn: Connection) -> None:
+    """删除没有查询使用的 created_ts 索引：按月范围查询只针对 submissions，其他表的 created_ts 列保留。"""
+    _rebuild_indexes(conn, ["ix_submission_items_ts", "ix_notification_messages_ts", "ix_point_adjustments_ts"])
+
+
+STEPS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "早期版本的补充列", step_base_columns),
+    (2, "提交计分列与月度汇总", step_submission_stats),
+    (3, "通知拆分为正文与回执", step_split_notifications),
+    (4, "未读通知计数列", step_unread_counter),
+    (5, "二级索引", step_indexes),
+    (6, "整数时间戳 created_ts", step_created_ts),
+    (7, "预渲染的 Markdown HTML", step_rendered_html),
+    (8, "积分版本号", step_settings),
+    (9, "提交索引改为部分索引", step_submissions_ts_index),
+    (10, "活动提交索引加入 is_deleted", step_submissions_event_index),
+    (11, "删除未使用的时间戳索引", step_drop_unused_ts_indexes),
+]
+LATEST_VERSION = STEPS[-1][0]
+
+
+def get_schema_version(conn: Connection) -> Optional[int]:
+    """读取 schema_version；settings 表不存在（全新数据库）时返回 None，有表无记录时为 0。"""
+    try:
+        v = conn.execute(text("SELECT value FROM settings WHERE key = :k"), {"k": SCHEMA_VERSION_KEY}).scalar()
+    except Exception:
+        conn.rollback()
+        return None
+    try:
+        return int(v or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _set_schema_version(conn: Connection, version: int) -> None:
+    updated = conn.execute(text("UPDATE settings SET value = :v WHERE key = :k"), {"v": str(version), "k": SCHEMA_VERSION_KEY}).rowcount
+    if not updated:
+        conn.execute(text("INSERT INTO settings (key, value) VALUES (:k, :v)"), {"k": SCHEMA_VERSION_KEY, "v": str(version)})
+
+
+def run_migrations() -> int:
+    """把数据库升级到 LATEST_VERSION，返回升级前的版本号。"""
+    from . import models  # noqa: F401  确保全部模型已注册到 Base.metadata（命令行入口不会经过 main）
+    with engine.connect() as conn:
+        current = get_schema_version(conn)
+    if current is not None and current >= LATEST_VERSION:
+        return current
+    fresh = current is None and not sa_inspect(engine).has_table("users")
+    # 新表（及其索引）直接按模型创建；已有表的变更交给各步骤
+    Base.metadata.create_all(bind=engine)
+    if fresh:
+        # 全新数据库：create_all 已是最新结构，无需回放历史步骤
+        with engine.begin() as conn:
+            ensure_settings(conn)
+            _set_schema_version(conn, LATEST_VERSION)
+        return 0
+    current = current or 0
+    for version, name, step in STEPS:
+        if version <= current:
+            continue
+        try:
+            with engine.begin() as conn:
+                step(conn)
+                _set_schema_version(conn, version)
+        except Exception as e:
+            raise RuntimeError(f"数据库迁移失败：第 {version} 步（{name}）：{e}") from e
+    return current
@@ -1,10 +1,27 @@
 from datetime import datetime
-from sqlalchemy import Column, DateTime, Float, ForeignKey, Integer, String, Text, Boolean
-from sqlalchemy.orm import relationship
+from typing import Optional
+
+from sqlalchemy import BigInteger, Column, DateTime, Float, ForeignKey, Index, Integer, String, Text, Boolean, text
+from sqlalchemy.orm import deferred, relationship
 
 from .database import Base
 from .config import TZ
 
+
+def epoch_of(dt: Optional[datetime]) -> Optional[int]:
+    """时间 -> UTC 秒级时间戳；不带时区的时间（SQLite 读回的值）按 TZ 本地时间处理。"""
+    if dt is None:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=TZ)
+    return int(dt.timestamp())
+
+
+def _created_ts_default(context) -> int:
+    # 与同一行的 created_at 保持一致（显式传入的 created_at 也会用到）
+    return epoch_of(context.get_current_parameters().get('created_at') or datetime.now(TZ))
+
+
 class Setting(Base):
     __tablename__ = "settings"
     key = Column(String, primary_key=True)
@@ -23,6 +40,7 @@ class User(Base):
     avatar_filename = Column(String, nullable=True)
     email = Column(String, nullable=True)
     show_on_leaderboard = Column(Boolean, default=True)
+    unread_notifications = Column(Integer, default=0)  # 未读且未删除的通知数（由 notify 模块随写操作维护）
     # disambiguate: Submission has two FKs to users (user_id, rejected_by_id)
     submissions = relationship("Submission", back_populates="user", foreign_keys="Submission.user_id")
 
@@ -65,9 +83,11 @@ class Submission(Base):
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     event_id = Column(Integer, ForeignKey("events.id"), nullable=False)
     created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(TZ))
+    created_ts = Column(BigInteger, default=_created_ts_default)  # created_at 的 UTC 时间戳，用于按月范围查询
 
     wp_url = Column(String, nullable=True)
     wp_md = Column(Text, nullable=True)
+    wp_html = deferred(Column(Text, nullable=True))  # 保存时由 wp_md 渲染的 HTML；为空时按需渲染
     manual_points = Column(Float, nullable=True)  # 管理员在审核时手动设定的总分（优先级高于题目累计）
     is_deleted = Column(Boolean, default=False)
     # 驳回（打回）相关字段：被管理员或审核员整条退回，需成员重新编辑提交
@@ -75,6 +95,12 @@ class Submission(Base):
     rejected_reason = Column(Text, nullable=True)
     rejected_at = Column(DateTime(timezone=True), nullable=True)
     rejected_by_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    # 持久化的计分与审核状态（由 scores.refresh_submission_stats 在每次相关写操作时维护）
+    points_cached = Column(Float, default=0.0)
+    ok_count = Column(Integer, default=0)  # 已通过且未撤销
+    pending_count = Column(Integer, default=0)  # 待审（未通过）
+    revoked_count = Column(Integer, default=0)
+    review_state = Column(String, default="pending")  # 'pending' | 'reviewed' | 'rejected'
 
     #明确关联到提交者
     user = relationship("User", back_populates="submissions", foreign_keys=[user_id])
@@ -83,6 +109,13 @@ class Submission(Base):
     event = relationship("Event", back_populates="submissions")
     items = relationship("SubmissionItem", back_populates="submission", cascade="all,delete-orphan")
 
+    __table_args__ = (
+        # 审核中心：按审核状态过滤后按 (created_at, id) 倒序做键集分页。
+        # 只含未删除提交的部分索引，不以 is_deleted 开头，以免其他 is_deleted = 0 的查询误用
+        Index("ix_submissions_review", "review_state", "created_at", "id", sqlite_where=text("is_deleted = 0"), postgresql_where=text("is_deleted = false")),
+        Index("ix_submissions_created", "created_at", "id", sqlite_where=text("is_deleted = 0"), postgresql_where=text("is_deleted = false")),
+    )
+
 
 class SubmissionItem(Base):
     __tablename__ = "submission_items"
@@ -93,6 +126,7 @@ class SubmissionItem(Base):
     approved = Column(Boolean, default=False)
     revoked = Column(Boolean, default=False)
     created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(TZ))
+    created_ts = Column(BigInteger, default=_created_ts_default)
 
     submission = relationship("Submission", back_populates="items")
     challenge = relationship("Challenge")
@@ -103,6 +137,7 @@ class Announcement(Base):
     id = Column(Integer, primary_key=True)
     title = Column(String, nullable=False)
     content = Column(Text, nullable=False)
+    content_html = deferred(Column(Text, nullable=True))  # 保存时由 content 渲染的 HTML；为空时按需渲染
     visible = Column(Boolean, default=True)
     is_deleted = Column(Boolean, default=False)
     created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(TZ))
@@ -120,6 +155,7 @@ class PointAdjustment(Base):
     is_deleted = Column(Boolean, default=False)
     created_by_id = Column(Integer, ForeignKey("users.id"), nullable=True)
     created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(TZ))
+    created_ts = Column(BigInteger, default=_created_ts_default)
 
 
 class EventType(Base):
@@ -133,16 +169,85 @@ class EventType(Base):
     updated_at = Column(DateTime(timezone=True), default=lambda: datetime.now(TZ))
 
 
-class Notification(Base):
-    """针对用户的站内通知，例如提交被驳回等。"""
-    __tablename__ = "notifications"
+class NotificationMessage(Base):
+    """站内通知正文：同一次发布（batch_id）只保存一份标题与内容，收件人见 NotificationReceipt。"""
+    __tablename__ = "notification_messages"
     id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    type = Column(String, nullable=False)  # 'rejection' | 其他预留
+    type = Column(String, nullable=False)  # 'rejection' | 'system' | 其他预留
     title = Column(String, nullable=True)
     content = Column(Text, nullable=False)
     related_id = Column(Integer, nullable=True)  # 关联的实体，如 submission.id
-    batch_id = Column(String, nullable=True)  # 同一次发布的分组ID，支持聚合显示与批量操作
+    batch_id = Column(String, nullable=True)  # 同一次发布的分组ID，支持聚合显示与批量操作；单条通知为空
     created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(TZ))
+    created_ts = Column(BigInteger, default=_created_ts_default)
+
+    receipts = relationship("NotificationReceipt", back_populates="message", cascade="all,delete-orphan")
+
+
+class NotificationReceipt(Base):
+    """每位收件人一行：已读时间与删除标记。正文字段通过 message 读取，便于模板沿用 n.title / n.content 等写法。"""
+    __tablename__ = "notification_receipts"
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    message_id = Column(Integer, ForeignKey("notification_messages.id"), nullable=False)
     read_at = Column(DateTime(timezone=True), nullable=True)
     is_deleted = Column(Boolean, default=False)
+
+    message = relationship("NotificationMessage", back_populates="receipts", lazy="joined")
+
+    @property
+    def type(self):
+        return self.message.type if self.message else None
+
+    @property
+    def title(self):
+        return self.message.title if self.message else None
+
+    @property
+    def content(self):
+        return self.message.content if self.message else ""
+
+    @property
+    def related_id(self):
+        return self.message.related_id if self.message else None
+
+    @property
+    def batch_id(self):
+        return self.message.batch_id if self.message else None
+
+    @property
+    def created_at(self):
+        return self.message.created_at if self.message else None
+
+
+class UserMonthScore(Base):
+    """按成员、按月物化的积分汇总（由审核等写操作在同一事务内维护，可通过 rebuild 全量重建）。
+    提交部分与积分调整部分分开存放，读取时再按榜单口径（是否隐藏/删除成员）合并。
+    """
+    __tablename__ = "user_month_scores"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    year = Column(Integer, primary_key=True)
+    month = Column(Integer, primary_key=True)
+    points = Column(Float, nullable=False, default=0.0)  # 未删除提交的积分合计
+    approved_count = Column(Integer, nullable=False, default=0)  # 已通过且未撤销的题目数
+    submission_count = Column(Integer, nullable=False, default=0)  # 未删除提交数（决定是否上榜）
+    adjust_points = Column(Float, nullable=False, default=0.0)  # 未删除积分调整合计
+    adjust_count = Column(Integer, nullable=False, default=0)
+
+
+# 二级索引：覆盖各写操作与页面的高频过滤路径；已有数据库由 migrations.step_indexes 补建（CREATE INDEX IF NOT EXISTS）。
+# 只查询未删除数据的路径使用部分索引（WHERE is_deleted = 0）。
+_not_deleted = dict(sqlite_where=text("is_deleted = 0"), postgresql_where=text("is_deleted = false"))
+Index("ix_submissions_user", Submission.user_id, Submission.is_deleted, Submission.created_at)
+Index("ix_submissions_event", Submission.event_id, Submission.is_deleted)
+Index("ix_submission_items_submission", SubmissionItem.submission_id)
+Index("ix_submission_items_challenge", SubmissionItem.challenge_id)
+Index("ix_notification_receipts_user", NotificationReceipt.user_id, NotificationReceipt.read_at, **_not_deleted)
+Index("ix_notification_receipts_message", NotificationReceipt.message_id)
+Index("ix_notification_messages_batch", NotificationMessage.batch_id)
+Index("ix_notification_messages_related", NotificationMessage.type, NotificationMessage.related_id)
+# 按月范围查询使用整数时间戳 created_ts（见 utils.month_ts_range）
+Index("ix_submissions_user_ts", Submission.user_id, Submission.created_ts, **_not_deleted)
+# 只含 created_ts 的部分索引：若以 is_deleted 开头，任何 is_deleted = 0 的查询（如按活动筛选）都可能误用它
+Index("ix_submissions_live_ts", Submission.created_ts, **_not_deleted)
+Index("ix_point_adjustments_month", PointAdjustment.year, PointAdjustment.month, PointAdjustment.user_id, **_not_deleted)
@@ -0,0 +1,250 @@
+"""站内通知的写入与分组查询。
+
+正文存于 notification_messages（每次发布一行），收件状态存于 notification_receipts（每位收件人一行）。
+管理端按“分组”操作通知：有 batch_id 的以 batch_id 标识，单条通知以 single-<message.id> 标识。
+
+未读数以计数列 users.unread_notifications 保存，由本模块的写入函数在同一事务内维护
+（python -m ceboard.manage repair-unread 可从回执表重新统计）。
+最近 5 条未读的预览按用户缓存在进程内，并记下读取时的未读数：未读数变化后该条目作废，
+因此提交前读取、提交后才写回的旧预览不会被沿用。通知的写操作另调用 invalidate_unread，失效在事务提交后生效；
+较短的过期时间兜底多进程部署时其他 worker 写入造成的差异。
+"""
+import threading
+import time
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import String, and_, cast, event, func, insert, literal, select
+from sqlalchemy.orm import contains_eager
+
+from .database import SessionLocal
+from .models import NotificationMessage, NotificationReceipt, User
+
+UNREAD_CACHE_TTL = 30  # 秒
+UNREAD_PREVIEW_SIZE = 5
+
+_unread_cache: Dict[int, Tuple[float, int, List[dict]]] = {}  # user_id -> (写入时间, 读取时的未读数, 预览)
+_unread_lock = threading.Lock()
+_PENDING_KEY = "notify_invalidate"
+_ALL = object()
+
+# 广播对象：全部成员 / 按队伍 / 按角色 / 指定成员
+AUDIENCES = ("all", "main", "sub", "role", "ids")
+ROLES = ("admin", "reviewer", "member")
+
+
+def group_key():
+    """管理端分组标识的 SQL 表达式：coalesce(batch_id, 'single-' || message.id)。"""
+    return func.coalesce(NotificationMessage.batch_id, literal('single-') + cast(NotificationMessage.id, String))
+
+
+def message_group_key(msg: NotificationMessage) -> str:
+    return msg.batch_id or f"single-{msg.id}"
+
+
+def find_message(db, key: str) -> Optional[NotificationMessage]:
+    """按分组标识查找通知正文；不存在时返回 None。"""
+    if not key:
+        return None
+    msg = db.query(NotificationMessage).filter(NotificationMessage.batch_id == key).first()
+    if msg is None and key.startswith("single-"):
+        try:
+            mid = int(key.split("-", 1)[1])
+        except Exception:
+            return None
+        msg = db.get(NotificationMessage, mid)
+    return msg
+
+
+def create_notification(db, user_ids: Iterable[int], type: str, title: Optional[str], content: str,
+                        related_id: Optional[int] = None, batch_id: Optional[str] = None) -> NotificationMessage:
+    """写入一条通知正文及各收件人的回执（不提交事务）。"""
+    msg = NotificationMessage(type=type, title=title, content=content, related_id=related_id, batch_id=batch_id)
+    db.add(msg)
+    db.flush()
+    user_ids = list(user_ids)
+    db.add_all([NotificationReceipt(user_id=uid, message_id=msg.id) for uid in user_ids])
+    for uid, n in Counter(user_ids).items():
+        bump_unread(db, User.id == uid, n)
+    invalidate_unread(db, user_ids)
+    return msg
+
+
+def receipts_of(db, msg: NotificationMessage, deleted: bool = False):
+    """某条通知的回执查询（默认只含未删除的）。"""
+    return db.query(NotificationReceipt).filter(NotificationReceipt.message_id == msg.id, NotificationReceipt.is_deleted == deleted)
+
+
+def set_receipts_deleted(db, msg: NotificationMessage, deleted: bool) -> int:
+    """批量软删除/恢复某条通知的全部回执，一条 UPDATE 完成，返回受影响行数；随后重算这些收件人的未读数。"""
+    n = receipts_of(db, msg, deleted=not deleted).update({NotificationReceipt.is_deleted: deleted}, synchronize_session=False)
+    if n:
+        recount_unread(db, User.id.in_(select(NotificationReceipt.user_id).where(NotificationReceipt.message_id == msg.id)))
+        invalidate_unread(db)
+    return n
+
+
+def delete_related_notices(db, type: str, related_id: int, user_id: int) -> int:
+    """软删除与某实体关联的通知（如提交的驳回通知），返回受影响的回执数。"""
+    message_ids = select(NotificationMessage.id).where(NotificationMessage.type == type, NotificationMessage.related_id == related_id)
+    n = (
+        db.query(NotificationReceipt)
+        .filter(NotificationReceipt.message_id.in_(message_ids), NotificationReceipt.is_deleted == False)
+        .update({NotificationReceipt.is_deleted: True}, synchronize_session=False)
+    )
+    if n:
+        recount_unread(db, User.id == user_id)
+        invalidate_unread(db, [user_id])
+    return n
+
+
+def mark_read(db, receipt: NotificationReceipt, ts) -> None:
+    """将单条未读通知标记为已读并同步未读数。"""
+    if receipt.read_at is not None:
+        return
+    receipt.read_at = ts
+    if not receipt.is_deleted:
+        bump_unread(db, User.id == receipt.user_id, -1)
+    invalidate_unread(db, [receipt.user_id])
+
+
+def mark_all_read(db, user_id: int, ts) -> int:
+    """将某用户全部未读通知标记为已读，返回标记的条数。"""
+    n = (
+        db.query(NotificationReceipt)
+        .filter(NotificationReceipt.user_id == user_id, NotificationReceipt.is_deleted == False, NotificationReceipt.read_at == None)
+        .update({NotificationReceipt.read_at: ts}, synchronize_session=False)
+    )
+    db.query(User).filter(User.id == user_id).update({User.unread_notifications: 0}, synchronize_session=False)
+    _expire_unread_column(db)
+    invalidate_unread(db, [user_id])
+    return n
+
+
+def _expire_unread_column(db) -> None:
+    # 计数列由 UPDATE 直接修改，会话中已加载的用户对象需重新读取
+    for obj in list(db.identity_map.values()):
+        if isinstance(obj, User):
+            db.expire(obj, ['unread_notifications'])
+
+
+def bump_unread(db, where, delta: int) -> None:
+    """users.unread_notifications += delta（where 为 User 条件）。"""
+    db.query(User).filter(where).update(
+        {User.unread_notifications: func.coalesce(User.unread_notifications, 0) + delta}, synchronize_session=False
+    )
+    _expire_unread_column(db)
+
+
+def recount_unread(db, where=None) -> None:
+    """从回执表重新统计未读数；where 为空时重算全部用户（修复命令与迁移使用）。"""
+    db.flush()
+    unread = (
+        select(func.count(NotificationReceipt.id))
+        .where(NotificationReceipt.user_id == User.id, NotificationReceipt.is_deleted == False, NotificationReceipt.read_at == None)
+        .scalar_subquery()
+    )
+    q = db.query(User)
+    if where is not None:
+        q = q.filter(where)
+    q.update({User.unread_notifications: unread}, synchronize_session=False)
+    _expire_unread_column(db)
+
+
+def audience_filter(audience: str, role: Optional[str] = None, user_ids: Optional[Sequence[int]] = None) -> list:
+    """返回筛选广播对象的 User 条件列表（只含未删除且启用的账号）；参数无效时抛出 ValueError。"""
+    conds = [User.is_deleted == False, User.is_active == True]
+    if audience == "all":
+        pass
+    elif audience in ("main", "sub"):
+        conds.append(User.team_type == audience)
+    elif audience == "role":
+        if role not in ROLES:
+            raise ValueError("角色无效")
+        conds.append(User.role == role)
+    elif audience == "ids":
+        if not user_ids:
+            raise ValueError("未选择成员")
+        conds.append(User.id.in_(list(user_ids)))
+    else:
+        raise ValueError("发送范围无效")
+    return conds
+
+
+def broadcast_notification(db, conds: list, type: str, title: Optional[str], content: str,
+                           batch_id: Optional[str] = None, related_id: Optional[int] = None) -> Tuple[Optional[NotificationMessage], int]:
+    """按 audience_filter 的条件广播：正文一行，回执用一条 INSERT ... SELECT 写入，不在 Python 中逐个构造对象。
+    返回（正文, 收件人数）；没有匹配的收件人时不写入任何数据。
+    """
+    if not db.execute(select(User.id).where(*conds).limit(1)).first():
+        return None, 0
+    msg = NotificationMessage(type=type, title=title, content=content, related_id=related_id, batch_id=batch_id)
+    db.add(msg)
+    db.flush()
+    stmt = insert(NotificationReceipt).from_select(
+        ["user_id", "message_id", "is_deleted"],
+        select(User.id, literal(msg.id), literal(False)).where(*conds),
+    )
+    result = db.execute(stmt)
+    bump_unread(db, and_(*conds), 1)
+    invalidate_unread(db)
+    return msg, int(result.rowcount or 0)
+
+
+def invalidate_unread(db, user_ids: Optional[Iterable[int]] = None) -> None:
+    """登记未读角标缓存的失效（user_ids 为空表示全部用户），在 db 的事务提交后执行。"""
+    pending = db.info.setdefault(_PENDING_KEY, set())
+    if user_ids is None:
+        pending.add(_ALL)
+    else:
+        pending.update(int(uid) for uid in user_ids)
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _apply_unread_invalidation(session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+    with _unread_lock:
+        if _ALL in pending:
+            _unread_cache.clear()
+        else:
+            for uid in pending:
+                _unread_cache.pop(uid, None)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _discard_unread_invalidation(session):
+    session.info.pop(_PENDING_KEY, None)
+
+
+def unread_summary(db, user: User) -> Tuple[int, List[dict]]:
+    """（未读数, 最近未读预览）；未读数直接读计数列，预览为普通字典，可跨会话缓存。"""
+    count = int(user.unread_notifications or 0)
+    if not count:
+        return 0, []
+    now = time.monotonic()
+    with _unread_lock:
+        hit = _unread_cache.get(user.id)
+        if hit and hit[1] != count:
+            # 未读数已变化：预览读取于另一版本的数据
+            _unread_cache.pop(user.id, None)
+            hit = None
+    if hit and now - hit[0] < UNREAD_CACHE_TTL:
+        return count, hit[2]
+    rows = (
+        db.query(NotificationReceipt)
+        .filter(NotificationReceipt.user_id == user.id, NotificationReceipt.is_deleted == False, NotificationReceipt.read_at == None)
+        .join(NotificationMessage, NotificationMessage.id == NotificationReceipt.message_id)
+        .options(contains_eager(NotificationReceipt.message))
+        .order_by(NotificationMessage.created_at.desc())
+        .limit(UNREAD_PREVIEW_SIZE)
+        .all()
+    )
+    preview = [
+        {'id': n.id, 'title': n.title or '通知', 'type': n.type, 'related_id': n.related_id, 'created_at': n.created_at}
+        for n in rows
+    ]
+    with _unread_lock:
+        _unread_cache[user.id] = (now, count, preview)
+    return count, preview
@@ -0,0 +1,167 @@
+"""垃圾箱的彻底删除。
+
+每种删除都是一组按依赖顺序（先子表后父表）执行的 DELETE ... WHERE ... IN (子查询) / UPDATE ... SET NULL，
+不把行加载到会话中，全部在调用方的同一个事务内完成并由调用方提交。
+purge_* 返回 {表名: 行数}；dry_run=True 时只统计将受影响的行数，不做任何修改。
+实际删除时同步维护提交计分列、月度汇总与积分版本号（见 scores.py）。
+
+引用被删除题目的条目一并删除，即使所属提交保留：submission_items.challenge_id 是非空外键，
+保留这些条目会在 PostgreSQL 上违反外键约束，在 SQLite 上留下指向不存在题目的条目。
+它们本就不计分（见 utils.approved_base_scalar），删除后相关提交的积分不变，只是详情页不再列出这些条目。
+"""
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import delete, func, select, update
+
+from .models import (
+    Challenge, Event, NotificationMessage, NotificationReceipt, PointAdjustment, Submission, SubmissionItem, User, UserMonthScore,
+)
+from .scores import MonthKey, bump_score_version, query_keys, refresh_keys, refresh_submission_stats
+
+Counts = Dict[str, int]
+
+LABELS = {
+    "submission_items": "提交条目",
+    "submissions": "提交",
+    "challenges": "题目",
+    "events": "活动",
+    "point_adjustments": "积分调整",
+    "notification_receipts": "通知回执",
+    "notification_messages": "通知正文",
+    "user_month_scores": "月度汇总",
+    "users": "成员",
+    "submissions.rejected_by_id": "驳回人置空的提交",
+    "point_adjustments.created_by_id": "创建者置空的积分调整",
+}
+
+
+def describe(counts: Counts) -> str:
+    """把行数统计写成一句中文，如“提交 3、提交条目 12”。"""
+    return "、".join(f"{LABELS.get(k, k)} {n}" for k, n in counts.items() if n) or "无"
+
+
+# 操作：(统计键, 模型, 条件, 置空的列)；列为 None 表示删除
+_Op = Tuple[str, type, object, Optional[object]]
+
+
+def _delete(model, where) -> _Op:
+    return (model.__tablename__, model, where, None)
+
+
+def _nullify(model, column, where) -> _Op:
+    return (f"{model.__tablename__}.{column.key}", model, where, column)
+
+
+def _run(db, ops: List[_Op], dry_run: bool) -> Counts:
+    db.flush()
+    counts: Counts = {}
+    for key, model, where, column in ops:
+        if dry_run:
+            # 各条件只引用尚未删除的父表行，因此删除前统计即为实际影响的行数
+            n = db.execute(select(func.count()).select_from(model).where(where)).scalar()
+        elif column is None:
+            n = db.execute(delete(model).where(where).execution_options(synchronize_session=False)).rowcount
+        else:
+            n = db.execute(update(model).where(where).values({column: None}).execution_options(synchronize_session=False)).rowcount
+        counts[key] = counts.get(key, 0) + int(n or 0)
+    if not dry_run:
+        db.expire_all()
+    return counts
+
+
+def _referencing(challenge_ids, exclude_submissions=None):
+    """引用这些题目的其他提交（删除题目后需要重新计分）。"""
+    q = select(SubmissionItem.submission_id).where(SubmissionItem.challenge_id.in_(challenge_ids))
+    if exclude_submissions is not None:
+        q = q.where(SubmissionItem.submission_id.not_in(exclude_submissions))
+    return q
+
+
+def _refresh_after(db, submission_ids: List[int], keys: Set[MonthKey]) -> None:
+    if submission_ids:
+        refresh_submission_stats(db, Submission.id.in_(submission_ids))
+    refresh_keys(db, keys)
+
+
+def purge_event(db, event_id: int, dry_run: bool = False) -> Counts:
+    """活动及其题目、提交与条目；其他提交中引用这些题目的条目也一并删除，这些提交随后重新计分。"""
+    subs = select(Submission.id).where(Submission.event_id == event_id)
+    chs = select(Challenge.id).where(Challenge.event_id == event_id)
+    others = _referencing(chs, exclude_submissions=subs)
+    if not dry_run:
+        keys = query_keys(db.query(Submission).filter(Submission.event_id == event_id))
+        other_ids = [i for (i,) in db.execute(others.distinct())]
+        keys |= query_keys(db.query(Submission).filter(Submission.id.in_(other_ids)))
+    counts = _run(db, [
+        _delete(SubmissionItem, SubmissionItem.submission_id.in_(subs) | SubmissionItem.challenge_id.in_(chs)),
+        _delete(Submission, Submission.event_id == event_id),
+        _delete(Challenge, Challenge.event_id == event_id),
+        _delete(Event, Event.id == event_id),
+    ], dry_run)
+    if not dry_run:
+        _refresh_after(db, other_ids, keys)
+    return counts
+
+
+def purge_challenge(db, ch_id: int, dry_run: bool = False) -> Counts:
+    """题目及引用它的全部条目（所属提交保留，不随题目删除）；相关提交随后重新计分。"""
+    if not dry_run:
+        sub_ids = [i for (i,) in db.execute(_referencing([ch_id]).distinct())]
+        keys = query_keys(db.query(Submission).filter(Submission.id.in_(sub_ids)))
+    counts = _run(db, [
+        _delete(SubmissionItem, SubmissionItem.challenge_id == ch_id),
+        _delete(Challenge, Challenge.id == ch_id),
+    ], dry_run)
+    if not dry_run:
+        _refresh_after(db, sub_ids, keys)
+    return counts
+
+
+def purge_submission(db, sub_id: int, dry_run: bool = False) -> Counts:
+    """提交及其条目。"""
+    if not dry_run:
+        keys = query_keys(db.query(Submission).filter(Submission.id == sub_id))
+    counts = _run(db, [
+        _delete(SubmissionItem, SubmissionItem.submission_id == sub_id),
+        _delete(Submission, Submission.id == sub_id),
+    ], dry_run)
+    if not dry_run:
+        refresh_keys(db, keys)
+    return counts
+
+
+def purge_user(db, user_id: int, dry_run: bool = False) -> Counts:
+    """成员及其提交、条目、积分调整、通知回执与月度汇总；其他记录中对该成员的引用置空。"""
+    subs = select(Submission.id).where(Submission.user_id == user_id)
+    counts = _run(db, [
+        _delete(SubmissionItem, SubmissionItem.submission_id.in_(subs)),
+        _nullify(Submission, Submission.rejected_by_id, (Submission.rejected_by_id == user_id) & (Submission.user_id != user_id)),
+        _delete(Submission, Submission.user_id == user_id),
+        _delete(PointAdjustment, PointAdjustment.user_id == user_id),
+        _nullify(PointAdjustment, PointAdjustment.created_by_id, PointAdjustment.created_by_id == user_id),
+        _delete(NotificationReceipt, NotificationReceipt.user_id == user_id),
+        _delete(UserMonthScore, UserMonthScore.user_id == user_id),
+        _delete(User, User.id == user_id),
+    ], dry_run)
+    if not dry_run:
+        bump_score_version(db)
+    return counts
+
+
+def purge_notification(db, message_id: int, dry_run: bool = False) -> Counts:
+    """通知组中已删除的回执；没有剩余收件人时连同正文一起删除。
+    只删除已软删除的回执，它们不计入未读数，因此无需重算 users.unread_notifications。
+    """
+    trashed = (NotificationReceipt.message_id == message_id) & (NotificationReceipt.is_deleted == True)
+    if dry_run:
+        counts = _run(db, [_delete(NotificationReceipt, trashed)], True)
+        remaining = db.execute(
+            select(func.count()).select_from(NotificationReceipt)
+            .where(NotificationReceipt.message_id == message_id, NotificationReceipt.is_deleted == False)
+        ).scalar()
+        counts["notification_messages"] = int(counts["notification_receipts"] > 0 and not remaining)
+        return counts
+    return _run(db, [
+        _delete(NotificationReceipt, trashed),
+        _delete(NotificationMessage, (NotificationMessage.id == message_id) & ~select(NotificationReceipt.id).where(NotificationReceipt.message_id == message_id).exists()),
+    ], False)
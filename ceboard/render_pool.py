@@ -0,0 +1,98 @@
+"""可选的 Markdown 渲染进程池（MD_RENDER_WORKERS 大于 0 时开启）。
+
+几百 KB 的 WP 渲染与清洗要占用 GIL 数秒，在线程池中执行会拖慢同一进程内的所有同步路由。
+开启后，长度不低于 MD_RENDER_THRESHOLD 的文本交给独立的工作进程渲染，请求线程等待结果时不持有 GIL；
+超过 MD_RENDER_TIMEOUT 秒或进程池异常时返回 None，由 md_to_html 改为显示转义后的原文。
+render_in_pool 会阻塞调用线程直到结果返回，只能在线程池中的同步路由里调用；async 路由使用 render_in_pool_async。
+工作进程以 spawn 方式启动，首次使用时创建，应用关闭时随 shutdown_render_pool 结束。
+"""
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from .config import MD_RENDER_THRESHOLD, MD_RENDER_TIMEOUT, MD_RENDER_WORKERS
+
+_executor: Optional[ProcessPoolExecutor] = None
+_lock = threading.Lock()
+
+
+def use_render_pool(md_text: str) -> bool:
+    return MD_RENDER_WORKERS > 0 and len(md_text) >= MD_RENDER_THRESHOLD
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=MD_RENDER_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _executor
+
+
+def _discard_executor(executor: ProcessPoolExecutor) -> None:
+    global _executor
+    with _lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _submit(md_text: str):
+    """(执行器, Future)；进程池不可用时 Future 为 None。"""
+    from .utils import render_markdown
+    executor = _get_executor()
+    try:
+        return executor, executor.submit(render_markdown, md_text)
+    except (BrokenProcessPool, RuntimeError):
+        _discard_executor(executor)
+        return executor, None
+
+
+def _on_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def render_in_pool(md_text: str) -> Optional[str]:
+    """在工作进程中执行 render_markdown，阻塞等待结果；超时或进程池不可用时返回 None。"""
+    if _on_event_loop():
+        raise RuntimeError("render_in_pool 会阻塞事件循环，async 代码中请使用 render_in_pool_async")
+    executor, fut = _submit(md_text)
+    if fut is None:
+        return None
+    try:
+        return fut.result(timeout=MD_RENDER_TIMEOUT)
+    except TimeoutError:
+        # 已开始执行的任务无法取消，工作进程完成后继续处理后续任务
+        fut.cancel()
+        return None
+    except BrokenProcessPool:
+        _discard_executor(executor)
+        return None
+
+
+async def render_in_pool_async(md_text: str) -> Optional[str]:
+    """render_in_pool 的 async 版本：等待期间让出事件循环，不占用线程。"""
+    executor, fut = _submit(md_text)
+    if fut is None:
+        return None
+    try:
+        return await asyncio.wait_for(asyncio.wrap_future(fut), MD_RENDER_TIMEOUT)
+    except asyncio.TimeoutError:
+        return None
+    except BrokenProcessPool:
+        _discard_executor(executor)
+        return None
+
+
+def shutdown_render_pool() -> None:
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -1,15 +1,22 @@
 from datetime import datetime
+from typing import Optional
 
 from fastapi import APIRouter, Depends, Form, HTTPException, Request, UploadFile, File, BackgroundTasks
 from fastapi.responses import RedirectResponse, HTMLResponse
+from sqlalchemy import and_, case, func, or_
+from sqlalchemy.orm import selectinload
 
 from ..deps import get_db, get_current_user, require_admin, render_template, require_admin_or_reviewer
 from ..models import Event, Challenge, Submission, SubmissionItem, User, Announcement, PointAdjustment, EventType, Setting
 from ..models import Setting
-from ..models import Notification
+from ..models import NotificationMessage, NotificationReceipt
 import uuid
 from ..config import TZ, CATEGORIES
-from ..utils import compute_submission_points, now_tokyo, send_email_sync
+from ..utils import RULES_HTML_KEY, month_ts_range, now_tokyo, prerender_html, send_email_sync, with_submission_relations
+from ..notify import audience_filter, broadcast_notification, create_notification, delete_related_notices, find_message, invalidate_unread, message_group_key, receipts_of, set_receipts_deleted
+from ..purge import describe, purge_challenge, purge_event, purge_notification, purge_submission, purge_user
+from ..writer import run_write, write_queue_metrics
+from ..scores import cached_count, refresh_for_submissions, refresh_for_query, refresh_for_adjustment, bump_score_version
 
 
 router = APIRouter()
@@ -30,18 +37,16 @@ def admin_advanced_dashboard(request: Request, db = Depends(get_db), current_use
     require_admin(current_user)
     # Simple KPIs
     active_events = db.query(Event).filter(Event.is_active == True, Event.is_deleted == False).count()
-    recent_subs = db.query(Submission).filter(Submission.is_deleted == False).order_by(Submission.created_at.desc()).limit(5).all()
+    recent_subs = with_submission_relations(db.query(Submission).filter(Submission.is_deleted == False)).order_by(Submission.created_at.desc()).limit(5).all()
     now = datetime.now(TZ)
     year, month = now.year, now.month
     # 本月提交次数
-    from_date = datetime(year, month, 1, tzinfo=TZ)
-    to_date = datetime(year + 1, 1, 1, tzinfo=TZ) if month == 12 else datetime(year, month + 1, 1, tzinfo=TZ)
-    month_submissions = db.query(Submission).filter(Submission.is_deleted == False, Submission.created_at >= from_date, Submission.created_at < to_date).count()
+    from_ts, to_ts = month_ts_range(year, month)
+    month_submissions = db.query(Submission).filter(Submission.is_deleted == False, Submission.created_ts >= from_ts, Submission.created_ts < to_ts).count()
     # 本月获得积分数 = 本月提交积分总和 + 本月积分调整总和
-    subs_month = db.query(Submission).filter(Submission.is_deleted == False, Submission.created_at >= from_date, Submission.created_at < to_date).all()
-    month_points_from_subs = sum(compute_submission_points(s) for s in subs_month)
-    month_adjusts = db.query(PointAdjustment).filter(PointAdjustment.year == year, PointAdjustment.month == month, PointAdjustment.is_deleted == False).all()
-    month_points_total = month_points_from_subs + sum(float(a.amount) for a in month_adjusts)
+    month_points_from_subs = db.query(func.sum(Submission.points_cached)).filter(Submission.is_deleted == False, Submission.created_ts >= from_ts, Submission.created_ts < to_ts).scalar()
+    month_adjusts = db.query(func.sum(PointAdjustment.amount)).filter(PointAdjustment.year == year, PointAdjustment.month == month, PointAdjustment.is_deleted == False).scalar()
+    month_points_total = float(month_points_from_subs or 0.0) + float(month_adjusts or 0.0)
     # 主队/子队人数（仅统计活跃且未删除成员）
     main_count = db.query(User).filter(User.team_type == 'main', User.is_active == True, User.is_deleted == False).count()
     sub_count = db.query(User).filter(User.team_type == 'sub', User.is_active == True, User.is_deleted == False).count()
@@ -57,6 +62,7 @@ def admin_advanced_dashboard(request: Request, db = Depends(get_db), current_use
         month_points_total=month_points_total,
         main_count=main_count,
         sub_count=sub_count,
+        write_queue=write_queue_metrics(),
     )
 
 
@@ -66,62 +72,61 @@ def admin_notifications_page(request: Request, page: int = 1, db = Depends(get_d
     require_admin(current_user)
     q = (request.query_params.get("q") or "").strip()
     user_id = request.query_params.get("user_id")
-    base_q = db.query(Notification).filter(Notification.is_deleted == False)
+    base_q = (
+        db.query(NotificationReceipt)
+        .join(NotificationMessage, NotificationMessage.id == NotificationReceipt.message_id)
+        .filter(NotificationReceipt.is_deleted == False)
+    )
     if q:
-        base_q = base_q.filter(Notification.content.contains(q))
-    # 先取所有（用于分组统计再分页）
-    all_notifs = base_q.order_by(Notification.created_at.desc()).all()
-    groups = {}
-    for n in all_notifs:
-        # user filter：只保留包含该用户的分组（统计该用户时仍展示整个分组，便于批量操作）
-        if user_id and user_id.isdigit() and n.user_id != int(user_id):
-            continue
-        bid = n.batch_id or f"single-{n.id}"
-        g = groups.get(bid)
-        if not g:
-            groups[bid] = {
-                'batch_id': bid,
-                'title': n.title or '通知',
-                'created_at': n.created_at,
-                'content': n.content,
-                'type': n.type,
-                'items': [],
-                'read_count': 0,
-                'total_count': 0,
-            }
-            g = groups[bid]
-        g['items'].append(n)
-    # 补充统计与用户名
-    rows = []
-    for bid, g in groups.items():
-        g['total_count'] = len(g['items'])
-        g['read_count'] = sum(1 for it in g['items'] if it.read_at is not None)
-        # 已读/未读用户名（全部显示，交给前端换行显示）
-        read_users, unread_users = [], []
-        for it in g['items']:
-            u = db.get(User, it.user_id)
-            name = (u.username if u else f"uid:{it.user_id}")
-            (read_users if it.read_at else unread_users).append(name)
-        rows.append({
-            'batch_id': bid,
-            'title': g['title'],
-            'created_at': g['created_at'],
-            'read_count': g['read_count'],
-            'total_count': g['total_count'],
-            'read_users': read_users,
-            'unread_users': unread_users,
-            'content': g['content'],
-            'type': g['type'],
-        })
-    # 按创建时间排序
-    rows.sort(key=lambda r: r['created_at'], reverse=True)
-    # 分页（对分组后的 rows）
+        base_q = base_q.filter(NotificationMessage.content.contains(q))
+    # user filter：只统计该用户收到的通知
+    if user_id and user_id.isdigit():
+        base_q = base_q.filter(NotificationReceipt.user_id == int(user_id))
+    # 每条通知正文一组：同一 batch_id 的发布只有一条正文
+    groups_q = (
+        base_q.with_entities(
+            NotificationMessage.id.label('message_id'),
+            func.count(NotificationReceipt.id).label('total_count'),
+            func.count(NotificationReceipt.read_at).label('read_count'),
+        )
+        .group_by(NotificationMessage.id)
+    )
     page = max(1, int(page or 1))
     page_size = 10
-    total = len(rows)
-    paged = rows[(page-1)*page_size: page*page_size]
+    total = groups_q.order_by(None).count()
+    # 按创建时间排序后在数据库侧分页
+    groups = groups_q.order_by(func.max(NotificationMessage.created_at).desc(), NotificationMessage.id.desc()).offset((page-1)*page_size).limit(page_size).all()
+    message_ids = [g.message_id for g in groups]
+    messages = {m.id: m for m in db.query(NotificationMessage).filter(NotificationMessage.id.in_(message_ids))} if groups else {}
+    # 已读/未读用户名：只针对当前页的分组，一次 IN 查询取回（全部显示，交给前端换行显示）
+    names = {mid: ([], []) for mid in message_ids}
+    if groups:
+        member_rows = (
+            base_q.outerjoin(User, User.id == NotificationReceipt.user_id)
+            .filter(NotificationReceipt.message_id.in_(message_ids))
+            .with_entities(NotificationReceipt.message_id, NotificationReceipt.user_id, NotificationReceipt.read_at, User.username)
+            .order_by(NotificationReceipt.id.asc())
+            .all()
+        )
+        for mid, uid, read_at, username in member_rows:
+            read_users, unread_users = names[mid]
+            (read_users if read_at else unread_users).append(username or f"uid:{uid}")
+    paged = []
+    for g in groups:
+        m = messages[g.message_id]
+        paged.append({
+            'batch_id': message_group_key(m),
+            'title': m.title or '通知',
+            'created_at': m.created_at,
+            'read_count': int(g.read_count or 0),
+            'total_count': int(g.total_count or 0),
+            'read_users': names[g.message_id][0],
+            'unread_users': names[g.message_id][1],
+            'content': m.content,
+            'type': m.type,
+        })
     users = db.query(User).filter(User.is_deleted == False).all()
-    total_pages = (total + 10 - 1) // 10
+    total_pages = (total + page_size - 1) // page_size
     return render_template(
         "admin_notifications.html",
         title="通知管理",
@@ -153,33 +158,42 @@ def admin_notifications_create_page(request: Request, db = Depends(get_db), curr
     )
 
 @router.post("/admin/notifications/create")
-def admin_notifications_create(title: str = Form(...), content: str = Form(...), user_ids: str = Form(""), send_email: int = Form(0), background_tasks: BackgroundTasks = None, db = Depends(get_db), current_user = Depends(get_current_user)):
-    """发布通知：若未选择具体成员则广播。使用 batch_id 进行分组。"""
+def admin_notifications_create(title: str = Form(...), content: str = Form(...), user_ids: str = Form(""), audience: str = Form("all"), role: str = Form(""), send_email: int = Form(0), background_tasks: BackgroundTasks = None, db = Depends(get_db), current_user = Depends(get_current_user)):
+    """发布通知：按发送范围（全部 / 主队 / 子队 / 角色 / 指定成员）广播，使用 batch_id 进行分组。
+    选择了具体成员时优先按成员发送；回执由一条 INSERT ... SELECT 写入。
+    """
     require_admin(current_user)
     title_clean = (title or '').strip()
     text = (content or '').strip()
     if not title_clean or not text:
         return RedirectResponse("/admin/notifications/create?msg=标题和内容不能为空", status_code=302)
-    all_users = db.query(User).filter(User.is_deleted == False, User.is_active == True).all()
     ids = [int(i) for i in (user_ids or '').split(',') if i.strip().isdigit()]
-    target_users = all_users if not ids else [u for u in all_users if u.id in ids]
-    if ids and not target_users:
-        return RedirectResponse("/admin/notifications/create?msg=成员选择无效", status_code=302)
+    try:
+        conds = audience_filter('ids' if ids else (audience or 'all').strip(), role=(role or '').strip(), user_ids=ids)
+    except ValueError as e:
+        return RedirectResponse(f"/admin/notifications/create?msg={e}", status_code=302)
     batch_id = f"b{int(datetime.now(TZ).timestamp())}_{uuid.uuid4().hex[:8]}"
-    for u in target_users:
-        db.add(Notification(user_id=u.id, type='system', title=title_clean, content=text, batch_id=batch_id))
-        if send_email and u.email:
-            if background_tasks is not None:
-                background_tasks.add_task(_bg_send_email, u.email, title_clean, text)
-            else:
-                # 没有 FastAPI 的 BackgroundTasks 注入时，使用线程后台发送，避免阻塞请求
-                try:
-                    import threading
-                    threading.Thread(target=_bg_send_email, args=(u.email, title_clean, text), daemon=True).start()
-                except Exception:
-                    pass
-    db.commit()
-    return RedirectResponse(f"/admin/notifications?msg=已发布{len(target_users)}条" + ("(含邮件)" if send_email else ""), status_code=302)
+
+    def write(db):
+        msg, count = broadcast_notification(db, conds, 'system', title_clean, text, batch_id=batch_id)
+        # 邮件只取收件人的邮箱一列
+        emails = [e for (e,) in db.query(User.email).filter(*conds, User.email != None, User.email != '')] if (count and send_email) else []
+        return count, emails
+
+    count, emails = run_write(db, write)
+    if not count:
+        return RedirectResponse("/admin/notifications/create?msg=" + ("成员选择无效" if ids else "该范围内没有成员"), status_code=302)
+    for addr in emails:
+        if background_tasks is not None:
+            background_tasks.add_task(_bg_send_email, addr, title_clean, text)
+        else:
+            # 没有 FastAPI 的 BackgroundTasks 注入时，使用线程后台发送，避免阻塞请求
+            try:
+                import threading
+                threading.Thread(target=_bg_send_email, args=(addr, title_clean, text), daemon=True).start()
+            except Exception:
+                pass
+    return RedirectResponse(f"/admin/notifications?msg=已发布{count}条" + ("(含邮件)" if send_email else ""), status_code=302)
 
 @router.get("/admin/notifications/{batch_id}", response_class=HTMLResponse)
 def admin_notifications_detail(batch_id: str, request: Request = None, db = Depends(get_db), current_user = Depends(get_current_user)):
@@ -187,36 +201,28 @@ def admin_notifications_detail(batch_id: str, request: Request = None, db = Depe
     require_admin(current_user)
     if batch_id == 'create':  # 防止与创建路径冲突
         raise HTTPException(404, "无效通知标识")
-    notifs = db.query(Notification).filter(Notification.batch_id == batch_id, Notification.is_deleted == False).order_by(Notification.created_at.asc()).all()
-    # 兼容单条通知（无 batch_id），形如 single-<id>
-    if not notifs and batch_id.startswith("single-"):
-        try:
-            nid = int(batch_id.split("-", 1)[1])
-        except Exception:
-            nid = None
-        if nid:
-            one = db.get(Notification, nid)
-            if one and not one.is_deleted:
-                notifs = [one]
-    if not notifs:
+    msg = find_message(db, batch_id)
+    rows = (
+        receipts_of(db, msg).outerjoin(User, User.id == NotificationReceipt.user_id)
+        .with_entities(NotificationReceipt.user_id, NotificationReceipt.read_at, User.username)
+        .order_by(NotificationReceipt.id.asc())
+        .all()
+    ) if msg else []
+    if not rows:
         raise HTTPException(404, "通知分组不存在")
-    title = notifs[0].title or "通知"
-    content = notifs[0].content
     read_users, unread_users = [], []
-    for n in notifs:
-        u = db.get(User, n.user_id)
-        name = (u.username if u else f"uid:{n.user_id}")
-        (read_users if n.read_at else unread_users).append(name)
+    for uid, read_at, username in rows:
+        (read_users if read_at else unread_users).append(username or f"uid:{uid}")
     return render_template(
         "admin_notifications_detail.html",
         title=f"通知阅读明细",
         current_user=current_user,
         batch_id=batch_id,
-        notif_title=title,
-        notif_content=content,
+        notif_title=msg.title or "通知",
+        notif_content=msg.content,
         read_users=read_users,
         unread_users=unread_users,
-        total=len(notifs),
+        total=len(rows),
         read=len(read_users)
     )
 
@@ -226,26 +232,14 @@ def admin_notifications_edit_page(batch_id: str, request: Request = None, db = D
     require_admin(current_user)
     if batch_id == 'create':
         raise HTTPException(404, "无效通知标识")
-    notifs = db.query(Notification).filter(Notification.batch_id == batch_id, Notification.is_deleted == False).order_by(Notification.created_at.desc()).all()
-    # 兼容 single-<id>
-    single_mode = False
-    if not notifs and batch_id.startswith("single-"):
-        try:
-            nid = int(batch_id.split("-", 1)[1])
-        except Exception:
-            nid = None
-        if nid:
-            one = db.get(Notification, nid)
-            if one and not one.is_deleted:
-                notifs = [one]
-                single_mode = True
-    if not notifs:
+    msg = find_message(db, batch_id)
+    if not msg or not receipts_of(db, msg).first():
         raise HTTPException(404, "通知分组不存在")
     # 收件人用户名列表
-    usernames = []
-    for n in notifs:
-        u = db.get(User, n.user_id)
-        if u: usernames.append(u.username)
+    usernames = [
+        name for (name,) in receipts_of(db, msg).join(User, User.id == NotificationReceipt.user_id)
+        .with_entities(User.username).order_by(NotificationReceipt.id.desc())
+    ]
     users = db.query(User).filter(User.is_deleted == False, User.is_active == True).order_by(User.username.asc()).all()
     return render_template(
         "admin_notifications_edit.html",
@@ -254,8 +248,8 @@ def admin_notifications_edit_page(batch_id: str, request: Request = None, db = D
         batch_id=batch_id,
         users=users,
         usernames=usernames,
-        title_value=(notifs[0].title or ""),
-        content_value=(notifs[0].content or "")
+        title_value=(msg.title or ""),
+        content_value=(msg.content or "")
     )
 
 
@@ -271,22 +265,14 @@ def admin_notifications_edit(batch_id: str, title: str = Form(""), content: str
     text = (content or '').strip()
     if not text:
         return RedirectResponse("/admin/notifications?msg=内容不能为空", status_code=302)
-    notifs = db.query(Notification).filter(Notification.batch_id == batch_id, Notification.is_deleted == False).all()
-    if not notifs and batch_id.startswith("single-"):
-        try:
-            nid = int(batch_id.split("-", 1)[1])
-        except Exception:
-            nid = None
-        if nid:
-            one = db.get(Notification, nid)
-            if one and not one.is_deleted:
-                notifs = [one]
-    if not notifs:
+    msg = find_message(db, batch_id)
+    if not msg or not receipts_of(db, msg).first():
         raise HTTPException(404, "分组不存在")
-    for n in notifs:
-        if title_clean:
-            n.title = title_clean
-        n.content = text
+    # 正文只有一份，整组编辑即一行更新
+    if title_clean:
+        msg.title = title_clean
+    msg.content = text
+    invalidate_unread(db)
     db.commit()
     return RedirectResponse("/admin/notifications?msg=已批量保存", status_code=302)
 
@@ -297,20 +283,9 @@ def admin_notifications_delete(batch_id: str, db = Depends(get_db), current_user
     require_admin(current_user)
     if batch_id == 'create':
         return RedirectResponse("/admin/notifications?msg=无效通知标识", status_code=302)
-    notifs = db.query(Notification).filter(Notification.batch_id == batch_id, Notification.is_deleted == False).all()
-    if not notifs and batch_id.startswith("single-"):
-        try:
-            nid = int(batch_id.split("-", 1)[1])
-        except Exception:
-            nid = None
-        if nid:
-            one = db.get(Notification, nid)
-            if one and not one.is_deleted:
-                notifs = [one]
-    if not notifs:
+    msg = find_message(db, batch_id)
+    if not msg or not set_receipts_deleted(db, msg, True):
         return RedirectResponse("/admin/notifications?msg=分组不存在或已删除", status_code=302)
-    for n in notifs:
-        n.is_deleted = True
     db.commit()
     return RedirectResponse("/admin/notifications?msg=已批量删除", status_code=302)
 
@@ -367,6 +342,19 @@ def admin_delete_event_type(type_id: int, db = Depends(get_db), current_user = D
     return RedirectResponse("/admin/types?msg=已移入垃圾箱", status_code=302)
 
 
+def _parse_review_cursor(raw: Optional[str]):
+    """解析审核中心的分页游标 "<created_at ISO>_<id>"，无效时返回 None。"""
+    if not raw:
+        return None
+    try:
+        ts, sid = raw.rsplit("_", 1)
+        # 查询串中未编码的 "+" 会被解码为空格（时区偏移）
+        ts = ts.strip().replace(" ", "+")
+        return datetime.fromisoformat(ts), int(sid)
+    except Exception:
+        return None
+
+
 @router.get("/admin/review", response_class=HTMLResponse)
 def admin_review_list(request: Request, page: int = 1, db = Depends(get_db), current_user = Depends(get_current_user)):
     require_admin_or_reviewer(current_user)
@@ -374,58 +362,63 @@ def admin_review_list(request: Request, page: int = 1, db = Depends(get_db), cur
     event_id = request.query_params.get("event_id")
     q = (request.query_params.get("q") or "").strip()
     status = (request.query_params.get("status") or "unreviewed").strip()  # default 显示未审核
+    if status not in ('all', 'reviewed', 'unreviewed'):
+        # 兜底：未知状态按未审核处理
+        status = 'unreviewed'
     base_q = db.query(Submission).filter(Submission.is_deleted == False)
     if event_id and event_id.isdigit():
         base_q = base_q.filter(Submission.event_id == int(event_id))
-    # 先按时间排序取全量（便于基于“审核状态”的过滤），再进行内存分页
-    subs_all = base_q.order_by(Submission.created_at.desc()).all()
-    rows_all = []
-    for s in subs_all:
-        if q and s.user and (q.lower() not in s.user.username.lower()):
-            continue
-        total_items = len(s.items)
-        pending = sum(1 for it in s.items if not it.approved)
-        ok = sum(1 for it in s.items if it.approved and not it.revoked)
-        rev = sum(1 for it in s.items if it.revoked)
-        manual_set = (getattr(s, 'manual_points', None) is not None)
-        # 已审核判定：
-        # - 若存在条目，则“无待审”即视为已审核（无论通过或撤销都算处理过）；
-        # - 若不存在条目（活动没有题目等），只有设置了手动分数才视为已审核；否则为未审核。
-        # - 业务变更：被驳回的提交也视为“已审核”；当成员重新编辑后会清除驳回标记并重新进入“未审核”。
-        is_reviewed = getattr(s, 'rejected', False) or (total_items > 0 and pending == 0) or (total_items == 0 and manual_set)
-        # 分数：仅非驳回且视为“已审核”的显示分数，否则为 None
-        pts = compute_submission_points(s) if (is_reviewed and not getattr(s, 'rejected', False)) else None
-        rows_all.append({
+    # 已审核判定（review_state 由写操作维护）：
+    # - 若存在条目，则“无待审”即视为已审核（无论通过或撤销都算处理过）；
+    # - 若不存在条目（活动没有题目等），只有设置了手动分数才视为已审核；否则为未审核。
+    # - 业务变更：被驳回的提交也视为“已审核”；当成员重新编辑后会清除驳回标记并重新进入“未审核”。
+    if status == 'reviewed':
+        base_q = base_q.filter(Submission.review_state.in_(('reviewed', 'rejected')))
+    elif status == 'unreviewed':
+        base_q = base_q.filter(Submission.review_state == 'pending')
+    if q:
+        base_q = base_q.join(User, User.id == Submission.user_id).filter(func.lower(User.username).contains(q.lower(), autoescape=True))
+    page_size = 10
+    page = max(1, int(page or 1))
+    total_subs = cached_count(db, ('admin_review', status, event_id if event_id and event_id.isdigit() else None, q.lower()), base_q)
+    total_pages = (total_subs + page_size - 1) // page_size
+    # 键集分页：按 (created_at, id) 倒序；“下一页”链接携带本页末行的游标（after），“上一页”携带首行的游标（before），
+    # 直接从该位置继续读取，翻页期间有新提交也不会错位；末页从队尾倒序读取。其余跳页（无游标）退回 OFFSET
+    list_q = with_submission_relations(base_q, with_items=False)
+    newest_first = (Submission.created_at.desc(), Submission.id.desc())
+    oldest_first = (Submission.created_at.asc(), Submission.id.asc())
+    after = _parse_review_cursor(request.query_params.get("after")) if page > 1 else None
+    before = _parse_review_cursor(request.query_params.get("before")) if not after else None
+    if after:
+        c_at, c_id = after
+        subs = list_q.filter(or_(Submission.created_at < c_at, and_(Submission.created_at == c_at, Submission.id < c_id))).order_by(*newest_first).limit(page_size).all()
+    elif before:
+        c_at, c_id = before
+        subs = list_q.filter(or_(Submission.created_at > c_at, and_(Submission.created_at == c_at, Submission.id > c_id))).order_by(*oldest_first).limit(page_size).all()[::-1]
+    elif page > 1 and page == total_pages:
+        subs = list_q.order_by(*oldest_first).limit(total_subs - (page - 1) * page_size).all()[::-1]
+    else:
+        subs = list_q.order_by(*newest_first).offset((page - 1) * page_size).limit(page_size).all()
+    rows = []
+    for s in subs:
+        rows.append({
             "sub_id": s.id,
             "created_at": s.created_at,
             "username": s.user.username if s.user else "—",
             "event_name": s.event.name if s.event else "—",
-            "pending": pending,
-            "ok": ok,
-            "rev": rev,
+            "pending": s.pending_count,
+            "ok": s.ok_count,
+            "rev": s.revoked_count,
             "rejected": getattr(s, 'rejected', False),
-            "reviewed": is_reviewed,
-            "points": pts,
+            "reviewed": s.review_state in ('reviewed', 'rejected'),
+            # 分数：仅非驳回且视为“已审核”的显示分数，否则为 None
+            "points": s.points_cached if s.review_state == 'reviewed' else None,
         })
-    # 基于审核状态过滤
-    if status == 'reviewed':
-        rows_filtered = [r for r in rows_all if r['reviewed']]
-    elif status == 'unreviewed':
-        rows_filtered = [r for r in rows_all if not r['reviewed']]
-    elif status == 'all':
-        rows_filtered = rows_all
-    else:
-        # 兜底：未知状态按未审核处理
-        rows_filtered = [r for r in rows_all if not r['reviewed']]
-    # 排序与分页
-    rows_filtered.sort(key=lambda r: r["created_at"], reverse=True)
-    page_size = 10
-    page = max(1, int(page or 1))
-    total_subs = len(rows_filtered)
-    total_pages = (total_subs + page_size - 1) // page_size
-    start = (page - 1) * page_size
-    end = start + page_size
-    rows = rows_filtered[start:end]
+    def _cursor(s):
+        return f"{s.created_at.isoformat()}_{s.id}" if s.created_at else None
+
+    next_cursor = _cursor(subs[-1]) if subs and page < total_pages else None
+    prev_cursor = _cursor(subs[0]) if subs and page > 1 else None
     # 事件选择下拉按照与“活动管理”相同的优先级排序
     events = db.query(Event).filter(Event.is_deleted == False).all()
     now = datetime.now(TZ)
@@ -460,7 +453,7 @@ def admin_review_list(request: Request, page: int = 1, db = Depends(get_db), cur
 
     events.sort(key=sort_key)
     eid = int(event_id) if event_id and event_id.isdigit() else None
-    return render_template("admin_review.html", title="审核中心", current_user=current_user, rows=rows, events=events, event_id=eid, q=q, status=status, page=page, total_pages=total_pages, total=total_subs)
+    return render_template("admin_review.html", title="审核中心", current_user=current_user, rows=rows, events=events, event_id=eid, q=q, status=status, page=page, total_pages=total_pages, total=total_subs, next_cursor=next_cursor, prev_cursor=prev_cursor)
 
 
 @router.get("/admin/review/{sub_id}", response_class=HTMLResponse)
@@ -469,7 +462,7 @@ def admin_review_detail(sub_id: int, request: Request, db = Depends(get_db), cur
     sub = db.get(Submission, sub_id)
     if not sub or sub.is_deleted:
         raise HTTPException(404, "提交不存在")
-    items = db.query(SubmissionItem).filter(SubmissionItem.submission_id == sub_id).all()
+    items = db.query(SubmissionItem).options(selectinload(SubmissionItem.challenge)).filter(SubmissionItem.submission_id == sub_id).all()
     return render_template("admin_review_detail.html", title="审核提交", current_user=current_user, sub=sub, user=sub.user, event=sub.event, items=items)
 
 
@@ -483,6 +476,8 @@ def admin_review_approve_all(sub_id: int, db = Depends(get_db), current_user = D
     for it in items:
         if not it.approved:
             it.approved = True
+    if sub:
+        refresh_for_submissions(db, [sub])
     db.commit()
     return RedirectResponse(f"/admin/review/{sub_id}?msg=全部通过", status_code=302)
 
@@ -498,6 +493,7 @@ def admin_review_approve_event_all(event_id: int, db = Depends(get_db), current_
     )
     for it in items:
         it.approved = True
+    refresh_for_query(db, db.query(Submission).filter(Submission.event_id == event_id, Submission.is_deleted == False))
     db.commit()
     return RedirectResponse(f"/admin/review?event_id={event_id}&msg=已通过该活动全部待审", status_code=302)
 
@@ -511,10 +507,15 @@ def admin_toggle_approve(item_id: int, db = Depends(get_db), current_user = Depe
     # 驳回状态下禁止操作
     if it.submission and getattr(it.submission, 'rejected', False):
         return RedirectResponse(f"/admin/review/{it.submission_id}?msg=该提交已被驳回，不能操作条目", status_code=302)
-    it.approved = not it.approved
-    if not it.approved:
-        it.revoked = False
-    db.commit()
+
+    def write(db):
+        it = db.get(SubmissionItem, item_id)
+        it.approved = not it.approved
+        if not it.approved:
+            it.revoked = False
+        refresh_for_submissions(db, [it.submission])
+
+    run_write(db, write)
     return RedirectResponse(f"/admin/review/{it.submission_id}?msg=已切换通过状态", status_code=302)
 
 
@@ -526,9 +527,14 @@ def admin_toggle_revoke(item_id: int, db = Depends(get_db), current_user = Depen
         raise HTTPException(404, "条目不存在")
     if it.submission and getattr(it.submission, 'rejected', False):
         return RedirectResponse(f"/admin/review/{it.submission_id}?msg=该提交已被驳回，不能操作条目", status_code=302)
-    if it.approved:
-        it.revoked = not it.revoked
-    db.commit()
+
+    def write(db):
+        it = db.get(SubmissionItem, item_id)
+        if it.approved:
+            it.revoked = not it.revoked
+        refresh_for_submissions(db, [it.submission])
+
+    run_write(db, write)
     return RedirectResponse(f"/admin/review/{it.submission_id}?msg=已切换撤销状态", status_code=302)
 
 
@@ -539,6 +545,7 @@ def admin_delete_submission(sub_id: int, db = Depends(get_db), current_user = De
     if not sub or sub.is_deleted:
         return RedirectResponse("/admin/review?msg=提交不存在或已删除", status_code=302)
     sub.is_deleted = True
+    refresh_for_submissions(db, [sub])
     db.commit()
     return RedirectResponse("/admin/review?msg=提交已移入垃圾箱", status_code=302)
 
@@ -571,7 +578,8 @@ def admin_reject_submission(sub_id: int, reason: str = Form(""), background_task
     ch_part = (" · ".join(ch_names)) if ch_names else "提交"
     title = f"提交被驳回 - {event_name}"
     content = f"您的提交 {event_name} 已被驳回。\n\n理由：\n{r}"
-    db.add(Notification(user_id=sub.user_id, type='rejection', title=title, content=content, related_id=sub.id))
+    create_notification(db, [sub.user_id], 'rejection', title, content, related_id=sub.id)
+    refresh_for_submissions(db, [sub])
     # 邮件通知（同步，可失败）
     if sub.user and sub.user.email:
         if background_tasks is not None:
@@ -606,7 +614,6 @@ def admin_reject_apply(sub_id: int, reason: str = Form(...), background_tasks: B
         return RedirectResponse("/admin/review?msg=提交不存在或已删除", status_code=302)
     if getattr(sub, 'rejected', False):
         return RedirectResponse(f"/admin/review/{sub_id}?msg=已处于驳回状态", status_code=302)
-    from ..models import Notification
     from ..utils import now_tokyo
     reason_clean = (reason or '').strip() or '未填写理由'
     sub.rejected = True
@@ -627,7 +634,8 @@ def admin_reject_apply(sub_id: int, reason: str = Form(...), background_tasks: B
     ch_part = (" · ".join(ch_names)) if ch_names else "提交"
     title = f"提交被驳回 - {event_name}"
     content = f"您的提交 {event_name} 已被驳回。\n\n理由：\n{reason_clean}"
-    db.add(Notification(user_id=sub.user_id, type='rejection', title=title, content=content, related_id=sub.id))
+    create_notification(db, [sub.user_id], 'rejection', title, content, related_id=sub.id)
+    refresh_for_submissions(db, [sub])
     if sub.user and sub.user.email:
         if background_tasks is not None:
             background_tasks.add_task(_bg_send_email, sub.user.email, title, content)
@@ -656,9 +664,8 @@ def admin_unreject_submission(sub_id: int, db = Depends(get_db), current_user =
     sub.rejected_at = None
     sub.rejected_by_id = None
     # 将相关驳回通知软删除
-    notifs = db.query(Notification).filter(Notification.type == 'rejection', Notification.related_id == sub_id, Notification.is_deleted == False).all()
-    for n in notifs:
-        n.is_deleted = True
+    delete_related_notices(db, 'rejection', sub_id, sub.user_id)
+    refresh_for_submissions(db, [sub])
     db.commit()
     return RedirectResponse(f"/admin/review/{sub_id}?msg=已取消驳回", status_code=302)
 
@@ -778,6 +785,8 @@ def admin_update_event(event_id: int, name: str = Form(...), start: str = Form("
     evt.allow_wp_only = bool(int(allow_wp_only))
     evt.event_type_id = int(event_type_id) if event_type_id else None
     evt.remark = (remark or '').strip() or None
+    # 权重变化影响该活动下全部提交的积分
+    refresh_for_query(db, db.query(Submission).filter(Submission.event_id == event_id))
     db.commit()
     return RedirectResponse("/admin/events?msg=已保存", status_code=302)
 
@@ -813,7 +822,7 @@ def admin_event_detail(event_id: int, request: Request, db = Depends(get_db), cu
         raise HTTPException(404, "活动不存在")
     # 改为“按提交列一行”视图
     subs = (
-        db.query(Submission)
+        with_submission_relations(db.query(Submission))
         .filter(Submission.event_id == event_id, Submission.is_deleted == False)
         .order_by(Submission.created_at.desc())
         .all()
@@ -821,11 +830,9 @@ def admin_event_detail(event_id: int, request: Request, db = Depends(get_db), cu
     rows = []
     for s in subs:
         total_items = len(s.items)
-        count_ok = sum(1 for it in s.items if it.approved and not it.revoked)
-        count_pending = sum(1 for it in s.items if not it.approved)
-        count_revoked = sum(1 for it in s.items if it.revoked)
         manual_set = (getattr(s, 'manual_points', None) is not None)
-        is_reviewed = (total_items > 0 and count_pending == 0) or (total_items == 0 and manual_set)
+        # 此页口径不把驳回视为已审核
+        is_reviewed = (total_items > 0 and s.pending_count == 0) or (total_items == 0 and manual_set)
         ch_names = []
         for it in s.items:
             try:
@@ -837,10 +844,10 @@ def admin_event_detail(event_id: int, request: Request, db = Depends(get_db), cu
             "sub_id": s.id,
             "created_at": s.created_at,
             "username": s.user.username if s.user else "—",
-            "points": compute_submission_points(s),
-            "count_ok": count_ok,
-            "count_pending": count_pending,
-            "count_revoked": count_revoked,
+            "points": s.points_cached,
+            "count_ok": s.ok_count,
+            "count_pending": s.pending_count,
+            "count_revoked": s.revoked_count,
             "reviewed": is_reviewed,
             "challenges": ch_names,
         })
@@ -913,6 +920,7 @@ def admin_update_challenge(event_id: int, ch_id: int, name: str = Form(...), cat
     ch.name = (name or '').strip() or ch.name
     ch.category = (category or '').strip() or ch.category
     ch.base_score = int(base_score)
+    refresh_for_query(db, db.query(Submission).join(SubmissionItem, SubmissionItem.submission_id == Submission.id).filter(SubmissionItem.challenge_id == ch_id))
     db.commit()
     return RedirectResponse(f"/admin/events/{event_id}/challenges?msg=分值已更新", status_code=302)
 
@@ -933,6 +941,7 @@ def admin_set_submission_points(sub_id: int, manual_points: float = Form(None),
             sub.manual_points = float(manual_points)
         except Exception:
             sub.manual_points = None
+    refresh_for_submissions(db, [sub])
     db.commit()
     return RedirectResponse(f"/admin/review/{sub_id}?msg=分数已更新", status_code=302)
 
@@ -969,7 +978,7 @@ def admin_announcements(request: Request, db = Depends(get_db), current_user = D
 @router.post("/admin/announcements/create")
 def admin_create_announcement(title: str = Form(...), content: str = Form(""), visible: int = Form(1), db = Depends(get_db), current_user = Depends(get_current_user)):
     require_admin(current_user)
-    ann = Announcement(title=title.strip(), content=content or "", visible=bool(int(visible)))
+    ann = Announcement(title=title.strip(), content=content or "", content_html=prerender_html(content), visible=bool(int(visible)))
     db.add(ann); db.commit()
     return RedirectResponse("/admin/announcements?msg=已创建", status_code=302)
 
@@ -982,6 +991,7 @@ def admin_update_announcement(ann_id: int, title: str = Form(...), content: str
         raise HTTPException(404, "公告不存在")
     ann.title = title.strip()
     ann.content = content or ""
+    ann.content_html = prerender_html(content)
     ann.visible = bool(int(visible))
     ann.updated_at = datetime.now(TZ)
     db.commit()
@@ -1128,6 +1138,16 @@ def admin_rules_save(rules_md: str = Form(""), db = Depends(get_db), current_use
         db.add(s)
     else:
         s.value = rules_md or ''
+    # 同时保存渲染好的 HTML，规则页无需再渲染
+    html = prerender_html(rules_md)
+    h = db.get(Setting, RULES_HTML_KEY)
+    if html is None:
+        if h:
+            db.delete(h)
+    elif h:
+        h.value = html
+    else:
+        db.add(Setting(key=RULES_HTML_KEY, value=html))
     db.commit()
     return RedirectResponse("/admin/rules?msg=已保存", status_code=302)
 
@@ -1139,28 +1159,32 @@ def admin_trash(request: Request, db = Depends(get_db), current_user = Depends(g
     trashed_events = db.query(Event).filter(Event.is_deleted == True).order_by(Event.id.desc()).all()
     trashed_challenges = db.query(Challenge).filter(Challenge.is_deleted == True).order_by(Challenge.id.desc()).all()
     trashed_anns = db.query(Announcement).filter(Announcement.is_deleted == True).order_by(Announcement.id.desc()).all()
-    trashed_subs = db.query(Submission).filter(Submission.is_deleted == True).order_by(Submission.id.desc()).all()
+    trashed_subs = with_submission_relations(db.query(Submission).filter(Submission.is_deleted == True)).order_by(Submission.id.desc()).all()
     trashed_users = db.query(User).filter(User.is_deleted == True).order_by(User.username.asc()).all()
     trashed_adjs = db.query(PointAdjustment).filter(PointAdjustment.is_deleted == True).order_by(PointAdjustment.created_at.desc()).all()
     # 通知（垃圾箱）：按 batch 分组
-    trashed_notifs_q = db.query(Notification).filter(Notification.is_deleted == True).order_by(Notification.created_at.desc()).all()
-    notif_groups = {}
-    for n in trashed_notifs_q:
-        bid = n.batch_id or f"single-{n.id}"
-        g = notif_groups.get(bid)
-        if not g:
-            notif_groups[bid] = {
-                'batch_id': bid,
-                'title': n.title or '通知',
-                'created_at': n.created_at,
-                'total_count': 0,
-                'read_count': 0,
-            }
-            g = notif_groups[bid]
-        g['total_count'] += 1
-        if n.read_at is not None:
-            g['read_count'] += 1
-    trashed_notifs = sorted(list(notif_groups.values()), key=lambda r: r['created_at'], reverse=True)
+    trashed_groups = (
+        db.query(
+            NotificationMessage,
+            func.count(NotificationReceipt.id),
+            func.count(NotificationReceipt.read_at),
+        )
+        .join(NotificationReceipt, NotificationReceipt.message_id == NotificationMessage.id)
+        .filter(NotificationReceipt.is_deleted == True)
+        .group_by(NotificationMessage.id)
+        .order_by(NotificationMessage.created_at.desc(), NotificationMessage.id.desc())
+        .all()
+    )
+    trashed_notifs = [
+        {
+            'batch_id': message_group_key(m),
+            'title': m.title or '通知',
+            'created_at': m.created_at,
+            'total_count': int(total or 0),
+            'read_count': int(read or 0),
+        }
+        for m, total, read in trashed_groups
+    ]
     # build username mapping for adjustments
     user_ids = list({a.user_id for a in trashed_adjs})
     users_map = {u.id: u.username for u in db.query(User).filter(User.id.in_(user_ids)).all()} if user_ids else {}
@@ -1185,6 +1209,7 @@ def trash_restore_adjustment(adj_id: int, db = Depends(get_db), current_user = D
     if not adj:
         raise HTTPException(404, "调整不存在")
     adj.is_deleted = False
+    refresh_for_adjustment(db, adj)
     db.commit()
     return RedirectResponse("/admin/trash?msg=已恢复积分调整", status_code=302)
 
@@ -1195,6 +1220,7 @@ def trash_purge_adjustment(adj_id: int, db = Depends(get_db), current_user = Dep
     if not adj:
         raise HTTPException(404, "调整不存在")
     db.delete(adj)
+    refresh_for_adjustment(db, adj)
     db.commit()
     return RedirectResponse("/admin/trash?msg=已彻底删除积分调整", status_code=302)
 
@@ -1202,23 +1228,26 @@ def trash_purge_adjustment(adj_id: int, db = Depends(get_db), current_user = Dep
 @router.post("/admin/trash/notification/{batch_id}/restore")
 def trash_restore_notification(batch_id: str, db = Depends(get_db), current_user = Depends(get_current_user)):
     require_admin(current_user)
-    notifs = db.query(Notification).filter(Notification.batch_id == batch_id, Notification.is_deleted == True).all()
-    if not notifs:
+    msg = find_message(db, batch_id)
+    if not msg or not set_receipts_deleted(db, msg, False):
         return RedirectResponse("/admin/trash?msg=该通知组不存在或已恢复", status_code=302)
-    for n in notifs:
-        n.is_deleted = False
     db.commit()
     return RedirectResponse("/admin/trash?msg=已恢复通知组", status_code=302)
 
 
+def _purge_preview(counts) -> RedirectResponse:
+    return RedirectResponse(f"/admin/trash?msg=预览（未做修改）：{describe(counts)}", status_code=302)
+
+
 @router.post("/admin/trash/notification/{batch_id}/purge")
-def trash_purge_notification(batch_id: str, db = Depends(get_db), current_user = Depends(get_current_user)):
+def trash_purge_notification(batch_id: str, dry_run: int = Form(0), db = Depends(get_db), current_user = Depends(get_current_user)):
     require_admin(current_user)
-    notifs = db.query(Notification).filter(Notification.batch_id == batch_id, Notification.is_deleted == True).all()
-    if not notifs:
+    msg = find_message(db, batch_id)
+    counts = purge_notification(db, msg.id, dry_run=bool(dry_run)) if msg else {}
+    if not counts.get('notification_receipts'):
         return RedirectResponse("/admin/trash?msg=该通知组不存在", status_code=302)
-    for n in notifs:
-        db.delete(n)
+    if dry_run:
+        return _purge_preview(counts)
     db.commit()
     return RedirectResponse("/admin/trash?msg=已彻底删除通知组", status_code=302)
 
@@ -1235,22 +1264,14 @@ def trash_restore_event(event_id: int, db = Depends(get_db), current_user = Depe
 
 
 @router.post("/admin/trash/event/{event_id}/purge")
-def trash_purge_event(event_id: int, db = Depends(get_db), current_user = Depends(get_current_user)):
+def trash_purge_event(event_id: int, dry_run: int = Form(0), db = Depends(get_db), current_user = Depends(get_current_user)):
     require_admin(current_user)
-    evt = db.get(Event, event_id)
-    if not evt:
+    if not db.get(Event, event_id):
         raise HTTPException(404, "活动不存在")
-    # 删除关联提交与题目后，删除活动
-    items = db.query(SubmissionItem).join(Submission, Submission.id == SubmissionItem.submission_id).filter(Submission.event_id == event_id).all()
-    for it in items:
-        db.delete(it)
-    subs = db.query(Submission).filter(Submission.event_id == event_id).all()
-    for s in subs:
-        db.delete(s)
-    chs = db.query(Challenge).filter(Challenge.event_id == event_id).all()
-    for ch in chs:
-        db.delete(ch)
-    db.delete(evt)
+    # 批量删除条目、提交与题目后删除活动
+    counts = purge_event(db, event_id, dry_run=bool(dry_run))
+    if dry_run:
+        return _purge_preview(counts)
     db.commit()
     return RedirectResponse("/admin/trash?msg=已彻底删除活动", status_code=302)
 
@@ -1267,12 +1288,14 @@ def trash_restore_challenge(ch_id: int, db = Depends(get_db), current_user = Dep
 
 
 @router.post("/admin/trash/challenge/{ch_id}/purge")
-def trash_purge_challenge(ch_id: int, db = Depends(get_db), current_user = Depends(get_current_user)):
+def trash_purge_challenge(ch_id: int, dry_run: int = Form(0), db = Depends(get_db), current_user = Depends(get_current_user)):
     require_admin(current_user)
-    ch = db.get(Challenge, ch_id)
-    if not ch:
+    if not db.get(Challenge, ch_id):
         raise HTTPException(404, "题目不存在")
-    db.delete(ch)
+    # 引用该题目的条目一并删除，相关提交重新计分
+    counts = purge_challenge(db, ch_id, dry_run=bool(dry_run))
+    if dry_run:
+        return _purge_preview(counts)
     db.commit()
     return RedirectResponse("/admin/trash?msg=已彻底删除题目", status_code=302)
 
@@ -1306,21 +1329,19 @@ def trash_restore_submission(sub_id: int, db = Depends(get_db), current_user = D
     if not sub:
         raise HTTPException(404, "提交不存在")
     sub.is_deleted = False
+    refresh_for_submissions(db, [sub])
     db.commit()
     return RedirectResponse("/admin/trash?msg=已恢复提交", status_code=302)
 
 
 @router.post("/admin/trash/submission/{sub_id}/purge")
-def trash_purge_submission(sub_id: int, db = Depends(get_db), current_user = Depends(get_current_user)):
+def trash_purge_submission(sub_id: int, dry_run: int = Form(0), db = Depends(get_db), current_user = Depends(get_current_user)):
     require_admin(current_user)
-    sub = db.get(Submission, sub_id)
-    if not sub:
+    if not db.get(Submission, sub_id):
         raise HTTPException(404, "提交不存在")
-    # 删除关联的 items 再删提交
-    items = db.query(SubmissionItem).filter(SubmissionItem.submission_id == sub_id).all()
-    for it in items:
-        db.delete(it)
-    db.delete(sub)
+    counts = purge_submission(db, sub_id, dry_run=bool(dry_run))
+    if dry_run:
+        return _purge_preview(counts)
     db.commit()
     return RedirectResponse("/admin/trash?msg=已彻底删除提交", status_code=302)
 
@@ -1351,7 +1372,9 @@ def admin_create_adjustment(user_id: int = Form(...), amount: float = Form(...),
     if not u or u.is_deleted:
         raise HTTPException(404, "用户不存在")
     adj = PointAdjustment(user_id=u.id, amount=float(amount), reason=reason or "", year=int(year), month=int(month), created_by_id=current_user.id)
-    db.add(adj); db.commit()
+    db.add(adj)
+    refresh_for_adjustment(db, adj)
+    db.commit()
     return RedirectResponse(f"/admin/adjustments?year={year}&month={month}&msg=已添加", status_code=302)
 
 
@@ -1362,6 +1385,7 @@ def admin_delete_adjustment(adj_id: int, db = Depends(get_db), current_user = De
     if not adj:
         raise HTTPException(404, "记录不存在")
     adj.is_deleted = True
+    refresh_for_adjustment(db, adj)
     db.commit()
     return RedirectResponse(f"/admin/adjustments?year={adj.year}&month={adj.month}&msg=已移入垃圾箱", status_code=302)
 
@@ -1388,27 +1412,28 @@ def admin_user_detail(uid: int, request: Request, page: int = 1, db = Depends(ge
         raise HTTPException(404, "用户不存在")
     page_size = 10
     page = max(1, int(page or 1))
-    # 全量查询（不分页）用于统计
     all_subs_q = db.query(Submission).filter(Submission.user_id == uid, Submission.is_deleted == False)
     total_subs = all_subs_q.count()
-    all_subs = all_subs_q.all()
-    # 全量统计（不随分页变化）
-    total_items = sum(len(s.items) for s in all_subs)
-    approved = sum(1 for s in all_subs for it in s.items if it.approved and not it.revoked)
-    pending = sum(1 for s in all_subs for it in s.items if not it.approved)
-    revoked = sum(1 for s in all_subs for it in s.items if it.revoked)
+    # 全量统计（不随分页变化）：直接在 SQL 中聚合，不加载全部提交
+    total_items, approved, pending, revoked = (
+        db.query(
+            func.count(SubmissionItem.id),
+            func.sum(case((and_(SubmissionItem.approved == True, or_(SubmissionItem.revoked == False, SubmissionItem.revoked == None)), 1), else_=0)),
+            func.sum(case((or_(SubmissionItem.approved == False, SubmissionItem.approved == None), 1), else_=0)),
+            func.sum(case((SubmissionItem.revoked == True, 1), else_=0)),
+        )
+        .join(Submission, Submission.id == SubmissionItem.submission_id)
+        .filter(Submission.user_id == uid, Submission.is_deleted == False)
+        .one()
+    )
+    approved, pending, revoked = int(approved or 0), int(pending or 0), int(revoked or 0)
     # 当前页数据
-    base_q = db.query(Submission).filter(Submission.user_id == uid, Submission.is_deleted == False).order_by(Submission.created_at.desc())
-    subs = base_q.offset((page-1)*page_size).limit(page_size).all()
+    base_q = all_subs_q.order_by(Submission.created_at.desc())
+    subs = with_submission_relations(base_q).offset((page-1)*page_size).limit(page_size).all()
     rows = []
     for s in subs:
-        total_items_s = len(s.items)
-        pending_s = sum(1 for it in s.items if not it.approved)
-        ok_s = sum(1 for it in s.items if it.approved and not it.revoked)
-        rev_s = sum(1 for it in s.items if it.revoked)
-        manual_set = (getattr(s, 'manual_points', None) is not None)
-        is_reviewed = getattr(s, 'rejected', False) or (total_items_s > 0 and pending_s == 0) or (total_items_s == 0 and manual_set)
-        pts = compute_submission_points(s) if (is_reviewed and not getattr(s, 'rejected', False)) else None
+        is_reviewed = s.review_state in ('reviewed', 'rejected')
+        pts = s.points_cached if s.review_state == 'reviewed' else None
         ch_names = []
         try:
             for it in s.items:
@@ -1424,9 +1449,9 @@ def admin_user_detail(uid: int, request: Request, page: int = 1, db = Depends(ge
             "reviewed": is_reviewed,
             "points": pts,
             "challenges": ch_names,
-            "pending": pending_s,
-            "ok": ok_s,
-            "rev": rev_s,
+            "pending": s.pending_count,
+            "ok": s.ok_count,
+            "rev": s.revoked_count,
         })
     total_pages = (total_subs + page_size - 1) // page_size
     return render_template("admin_user_detail.html", title=f"成员详情 — {u.username}", current_user=current_user, user=u, subs=subs, total_items=total_items, approved=approved, pending=pending, revoked=revoked, rows=rows, page=page, total_pages=total_pages, total=total_subs)
@@ -1497,6 +1522,8 @@ def admin_update_user(uid: int, role: str = Form(...), team_type: str = Form(...
     u.team_type = team_type if team_type in ("main", "sub") else u.team_type
     if show_on_leaderboard is not None:
         u.show_on_leaderboard = bool(int(show_on_leaderboard))
+    # 角色/队伍/可见性决定是否上榜
+    bump_score_version(db)
     db.commit()
     return RedirectResponse("/admin/users?msg=已更新", status_code=302)
 
@@ -1523,6 +1550,7 @@ def admin_delete_user(uid: int, db = Depends(get_db), current_user = Depends(get
     if not u or u.is_deleted:
         return RedirectResponse("/admin/users?msg=用户不存在或已在垃圾箱", status_code=302)
     u.is_deleted = True
+    bump_score_version(db)
     db.commit()
     return RedirectResponse("/admin/users?msg=已移入垃圾箱", status_code=302)
 
@@ -1534,43 +1562,32 @@ def trash_restore_user(uid: int, db = Depends(get_db), current_user = Depends(ge
     if not u:
         raise HTTPException(404, "用户不存在")
     u.is_deleted = False
+    bump_score_version(db)
     db.commit()
     return RedirectResponse("/admin/trash?msg=已恢复成员", status_code=302)
 
 
 @router.post("/admin/trash/user/{uid}/purge")
-def trash_purge_user(uid: int, db = Depends(get_db), current_user = Depends(get_current_user)):
+def trash_purge_user(uid: int, dry_run: int = Form(0), db = Depends(get_db), current_user = Depends(get_current_user)):
     require_admin(current_user)
     u = db.get(User, uid)
     if not u:
         raise HTTPException(404, "用户不存在")
-    # 删除头像文件
+    avatar = u.avatar_filename
+    # 批量删除提交、条目、积分调整与通知回执，其他记录中对该成员的引用置空，最后删除成员
+    counts = purge_user(db, uid, dry_run=bool(dry_run))
+    if dry_run:
+        return _purge_preview(counts)
+    db.commit()
+    # 提交后再删除头像文件
     from pathlib import Path
     from ..config import IMAGE_DIR
     import os
     try:
-        if u.avatar_filename:
-            os.remove(Path(IMAGE_DIR) / u.avatar_filename)
+        if avatar:
+            os.remove(Path(IMAGE_DIR) / avatar)
     except Exception:
         pass
-    # 解除外键依赖并删除相关数据
-    # 1) 删除该用户的提交及条目
-    subs = db.query(Submission).filter(Submission.user_id == uid).all()
-    for s in subs:
-        items = db.query(SubmissionItem).filter(SubmissionItem.submission_id == s.id).all()
-        for it in items:
-            db.delete(it)
-        db.delete(s)
-    # 2) 删除该用户作为被调整者的积分调整；将其作为创建者的记录 creator 置空
-    adjs_user = db.query(PointAdjustment).filter(PointAdjustment.user_id == uid).all()
-    for a in adjs_user:
-        db.delete(a)
-    adjs_created = db.query(PointAdjustment).filter(PointAdjustment.created_by_id == uid).all()
-    for a in adjs_created:
-        a.created_by_id = None
-    # 3) 最后删除用户
-    db.delete(u)
-    db.commit()
     return RedirectResponse("/admin/trash?msg=已彻底删除成员", status_code=302)
 
 
@@ -1,8 +1,10 @@
 from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.responses import HTMLResponse, RedirectResponse
+from sqlalchemy.orm import contains_eager
 
-from ..deps import get_db, get_current_user, render_template, require_login
-from ..models import Notification, Submission
+from ..deps import get_current_user, get_db, get_write_db, render_template, require_login
+from ..models import NotificationMessage, NotificationReceipt, Submission, User
+from ..notify import mark_read
 from ..utils import md_to_html
 
 router = APIRouter()
@@ -14,15 +16,16 @@ def notifications_inbox(request: Request, status: str = "unread", page: int = 1,
     page = max(1, int(page or 1))
     page_size = 10  # 固定每页10条
     # 过滤掉被删除的通知；删除后仅在垃圾箱显示
-    q = db.query(Notification).filter(Notification.user_id == current_user.id, Notification.is_deleted == False)
+    q = db.query(NotificationReceipt).filter(NotificationReceipt.user_id == current_user.id, NotificationReceipt.is_deleted == False)
     if status == 'unread':
-        q = q.filter(Notification.read_at == None)
+        q = q.filter(NotificationReceipt.read_at == None)
     elif status == 'read':
-        q = q.filter(Notification.read_at != None)
+        q = q.filter(NotificationReceipt.read_at != None)
     total = q.count()
     # 全局未读数量用于“全部标记为已读”按钮显示控制
-    unread_total = db.query(Notification).filter(Notification.user_id == current_user.id, Notification.is_deleted == False, Notification.read_at == None).count()
-    rows = q.order_by(Notification.created_at.desc()).offset((page - 1) * page_size).limit(page_size).all()
+    unread_total = int(current_user.unread_notifications or 0)
+    # 正文随回执一并 JOIN 读取（见 NotificationReceipt.message）
+    rows = q.join(NotificationMessage, NotificationMessage.id == NotificationReceipt.message_id).options(contains_eager(NotificationReceipt.message)).order_by(NotificationMessage.created_at.desc(), NotificationReceipt.id.desc()).offset((page - 1) * page_size).limit(page_size).all()
     items = [
         {
             'id': n.id,
@@ -45,19 +48,23 @@ def notifications_inbox(request: Request, status: str = "unread", page: int = 1,
         page_size=page_size,
         total=total,
         unread_total=unread_total,
+        unread_count=unread_total,
     )
 
 
 @router.get("/notifications/{nid}", response_class=HTMLResponse)
-def notification_detail(nid: int, request: Request, db = Depends(get_db), current_user = Depends(get_current_user)):
+def notification_detail(nid: int, request: Request, db = Depends(get_write_db)):
+    # 打开即标记已读，需使用主库；当前用户也从主库会话读取
+    uid = request.session.get("user_id")
+    current_user = db.get(User, uid) if uid else None
     require_login(current_user)
-    n = db.get(Notification, nid)
+    n = db.get(NotificationReceipt, nid)
     if not n or n.is_deleted or n.user_id != current_user.id:
         raise HTTPException(404, "通知不存在")
     # 打开即标记已读
     if n.read_at is None:
         from ..utils import now_tokyo
-        n.read_at = now_tokyo(); db.commit()
+        mark_read(db, n, now_tokyo()); db.commit()
     # 组装辅助信息（如是驳回通知）
     sub = None
     event_name = None
@@ -6,9 +6,16 @@ from fastapi.responses import RedirectResponse, HTMLResponse
 from ..deps import get_db, get_current_user, render_template, require_login
 from ..models import User
 from ..config import MAX_AVATAR_SIZE, IMAGE_DIR
+from ..writer import run_write_async, run_write
 
 router = APIRouter()
 
+
+def _set_avatar(user_id: int, filename):
+    def write(db):
+        db.get(User, user_id).avatar_filename = filename
+    return write
+
 @router.get("/profile", response_class=HTMLResponse)
 def profile_page(request: Request, current_user = Depends(get_current_user)):
     require_login(current_user)
@@ -61,8 +68,7 @@ async def upload_avatar(request: Request, file: UploadFile = File(...), db = Dep
             f.write(data)
     except Exception:
         return RedirectResponse("/profile?msg=保存失败(权限或磁盘)", status_code=302)
-    current_user.avatar_filename = safe_name
-    db.add(current_user); db.commit()
+    await run_write_async(db, _set_avatar(current_user.id, safe_name))
     return RedirectResponse("/profile?msg=头像已更新", status_code=302)
 
 
@@ -78,8 +84,7 @@ def clear_avatar(request: Request, db = Depends(get_db), current_user = Depends(
             os.remove(Path(IMAGE_DIR) / old_name)
         except Exception:
             pass
-    current_user.avatar_filename = None
-    db.add(current_user); db.commit()
+    run_write(db, _set_avatar(current_user.id, None))
     return RedirectResponse("/profile?msg=头像已清除", status_code=302)
 
 
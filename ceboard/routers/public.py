@@ -3,10 +3,12 @@ from typing import Optional
 
 from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.responses import HTMLResponse
+from sqlalchemy.orm import selectinload
 
 from ..deps import get_db, get_current_user, render_template
 from ..models import Event, Submission, SubmissionItem, User, Announcement, Setting
-from ..utils import leaderboard_month_and_total, md_to_html, compute_submission_points
+from ..utils import RULES_HTML_KEY, month_ts_range, stored_html, with_submission_relations
+from ..scores import cached_leaderboard, get_score_version, user_points
 from ..config import TZ,VERSION
 
 
@@ -19,8 +21,10 @@ def index(request: Request, year: Optional[int] = None, month: Optional[int] = N
     year = int(year or now.year)
     month = int(month or now.month)
 
-    main_rows = leaderboard_month_and_total(db, year, month, team_type="main")
-    sub_rows = leaderboard_month_and_total(db, year, month, team_type="sub")
+    # 积分仅在审核等写操作后变化：读一次版本号，两个榜单都命中缓存时无需重新汇总
+    version = get_score_version(db)
+    main_rows = cached_leaderboard(db, year, month, team_type="main", version=version)
+    sub_rows = cached_leaderboard(db, year, month, team_type="sub", version=version)
 
     events = db.query(Event).filter(Event.is_active == True, Event.is_deleted == False).all()
     anns = (
@@ -45,12 +49,13 @@ def index(request: Request, year: Optional[int] = None, month: Optional[int] = N
 
 @router.get("/rules", response_class=HTMLResponse)
 def rules_page(request: Request, db = Depends(get_db), current_user = Depends(get_current_user)):
-    # 规则内容支持管理员编辑，存储于 settings.rules_md
+    # 规则内容支持管理员编辑，存储于 settings.rules_md，保存时渲染的 HTML 存于 settings.rules_html
     rules_md = None
     s = db.get(Setting, 'rules_md')
     if s:
         rules_md = s.value
-    rules_html = md_to_html(rules_md) if rules_md else None
+    h = db.get(Setting, RULES_HTML_KEY) if rules_md else None
+    rules_html = stored_html(h.value if h else None, rules_md) if rules_md else None
     return render_template("rules.html", title="战队规则", current_user=current_user, rules_html=rules_html)
 
 
@@ -59,13 +64,13 @@ def submission_detail(sub_id: int, request: Request, db = Depends(get_db), curre
     sub = db.get(Submission, sub_id)
     if not sub or sub.is_deleted:
         raise HTTPException(404, "提交不存在")
-    items = db.query(SubmissionItem).filter(SubmissionItem.submission_id == sub_id).all()
+    items = db.query(SubmissionItem).options(selectinload(SubmissionItem.challenge)).filter(SubmissionItem.submission_id == sub_id).all()
     # 普通成员查看他人提交时不展示 WP 与外链
     can_view_wp = False
     if current_user:
         if current_user.id == sub.user_id or current_user.role in ("admin", "reviewer"):
             can_view_wp = True
-    wp_html = md_to_html(sub.wp_md) if (sub.wp_md and can_view_wp) else None
+    wp_html = stored_html(sub.wp_html, sub.wp_md) if (sub.wp_md and can_view_wp) else None
     return render_template(
         "submission_detail.html",
         title="提交详情",
@@ -84,7 +89,7 @@ def announcement_detail(ann_id: int, request: Request, db = Depends(get_db), cur
     ann = db.get(Announcement, ann_id)
     if not ann or ann.is_deleted or not ann.visible:
         raise HTTPException(404, "公告不存在或不可见")
-    content_html = md_to_html(ann.content)
+    content_html = stored_html(ann.content_html, ann.content)
     return render_template("announcement_detail.html", title=ann.title, current_user=current_user, ann=ann, content_html=content_html)
 
 
@@ -97,29 +102,21 @@ def user_profile(uid: int, request: Request, year: Optional[int] = None, month:
     year = int(year or now.year)
     month = int(month or now.month)
 
-    start = datetime(year, month, 1, tzinfo=TZ)
-    end = datetime(year + 1, 1, 1, tzinfo=TZ) if month == 12 else datetime(year, month + 1, 1, tzinfo=TZ)
+    start, end = month_ts_range(year, month)
 
     subs_month = (
-        db.query(Submission)
+        with_submission_relations(db.query(Submission))
         .filter(Submission.user_id == uid)
         .filter(Submission.is_deleted == False)
-        .filter(Submission.created_at >= start, Submission.created_at < end)
+        .filter(Submission.created_ts >= start, Submission.created_ts < end)
         .all()
     )
-    subs_total = db.query(Submission).filter(Submission.user_id == uid, Submission.is_deleted == False).all()
-
-    def sum_points(subs):
-        return sum(compute_submission_points(s) for s in subs)
+    month_points, total_points = user_points(db, uid, year, month)
 
     details = []
     for s in subs_month:
-        count_ok = sum(1 for it in s.items if it.approved and not it.revoked)
-        count_pending = sum(1 for it in s.items if not it.approved)
-        count_revoked = sum(1 for it in s.items if it.revoked)
-        manual_set = (getattr(s, 'manual_points', None) is not None)
-        reviewed = getattr(s, 'rejected', False) or (len(s.items) > 0 and count_pending == 0) or (len(s.items) == 0 and manual_set)
-        pts = compute_submission_points(s) if (reviewed and not getattr(s, 'rejected', False)) else None
+        reviewed = s.review_state in ('reviewed', 'rejected')
+        pts = s.points_cached if s.review_state == 'reviewed' else None
         # 展示本次提交涉及的题目名称（不暴露 WP）
         ch_names = []
         for it in s.items:
@@ -132,9 +129,9 @@ def user_profile(uid: int, request: Request, year: Optional[int] = None, month:
             "sub_id": s.id,
             "created_at": s.created_at,
             "event_name": s.event.name if s.event else "—",
-            "count_ok": count_ok,
-            "count_pending": count_pending,
-            "count_revoked": count_revoked,
+            "count_ok": s.ok_count,
+            "count_pending": s.pending_count,
+            "count_revoked": s.revoked_count,
             "points": pts,
             "reviewed": reviewed,
             "wp_url": s.wp_url,
@@ -150,8 +147,8 @@ def user_profile(uid: int, request: Request, year: Optional[int] = None, month:
         user=u,
         year=year,
         month=month,
-        month_points=sum_points(subs_month),
-        total_points=sum_points(subs_total),
+        month_points=month_points,
+        total_points=total_points,
         details=details,
     )
 
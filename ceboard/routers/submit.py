@@ -3,8 +3,11 @@ from fastapi.responses import RedirectResponse, HTMLResponse
 
 from ..deps import get_db, get_current_user, require_login, render_template, await_form
 from ..models import Event, Challenge, Submission, SubmissionItem
-from ..utils import compute_submission_points, now_tokyo
-from ..models import Notification
+from ..utils import now_tokyo, prerender_html_async, with_submission_relations
+from ..models import NotificationReceipt
+from ..notify import mark_all_read, mark_read
+from ..scores import refresh_for_submissions
+from ..writer import run_write_async
 
 
 router = APIRouter()
@@ -40,15 +43,20 @@ async def submit_event_action(event_id: int, request: Request, db = Depends(get_
     if wp_url and not (wp_url.lower().startswith("http://") or wp_url.lower().startswith("https://")):
         wp_url = None
     wp_md = form.get("wp_md") or None
+    # 渲染可能耗时数秒，不在事件循环中执行
+    wp_html = await prerender_html_async(wp_md)
 
-    sub = Submission(user_id=current_user.id, event_id=event_id, wp_url=wp_url, wp_md=wp_md)
-    db.add(sub); db.flush()
+    user_id = current_user.id
 
-    for ch in db.query(Challenge).filter(Challenge.event_id == event_id).all():
-        if form.get(f"ch_{ch.id}") is not None:
-            db.add(SubmissionItem(submission_id=sub.id, challenge_id=ch.id, approved=False, revoked=False))
+    def write(db):
+        sub = Submission(user_id=user_id, event_id=event_id, wp_url=wp_url, wp_md=wp_md, wp_html=wp_html)
+        db.add(sub); db.flush()
+        for ch in db.query(Challenge).filter(Challenge.event_id == event_id).all():
+            if form.get(f"ch_{ch.id}") is not None:
+                db.add(SubmissionItem(submission_id=sub.id, challenge_id=ch.id, approved=False, revoked=False))
+        refresh_for_submissions(db, [sub])
 
-    db.commit()
+    await run_write_async(db, write)
     return RedirectResponse("/submit?msg=提交成功，等待管理员审核后计分", status_code=302)
 
 
@@ -61,10 +69,10 @@ def delete_own_submission(sub_id: int, db = Depends(get_db), current_user = Depe
     if sub.user_id != current_user.id:
         return RedirectResponse(f"/submission/{sub_id}?msg=无权限", status_code=302)
     # 仅在未通过前允许删除：没有已通过且未撤销的条目，且未设置人工分
-    approved_any = any(it.approved and not it.revoked for it in sub.items)
-    if approved_any or (sub.manual_points is not None):
+    if sub.ok_count or (sub.manual_points is not None):
         return RedirectResponse(f"/submission/{sub_id}?msg=已通过或已评分，不能删除", status_code=302)
     sub.is_deleted = True
+    refresh_for_submissions(db, [sub])
     db.commit()
     return RedirectResponse("/submit?msg=已删除（移入垃圾箱）", status_code=302)
 
@@ -112,7 +120,9 @@ async def edit_rejected_submission_action(sub_id: int, request: Request, db = De
     sub.rejected_by_id = None
     sub.wp_url = wp_url
     sub.wp_md = wp_md
+    sub.wp_html = await prerender_html_async(wp_md)
     sub.manual_points = None
+    refresh_for_submissions(db, [sub])
     db.commit()
     return RedirectResponse(f"/submission/{sub.id}?msg=已更新，等待重新审核", status_code=302)
 
@@ -124,28 +134,23 @@ def my_submissions_page(request: Request, page: int = 1, db = Depends(get_db), c
     page = max(1, int(page or 1))
     base_q = db.query(Submission).filter(Submission.user_id == current_user.id, Submission.is_deleted == False).order_by(Submission.created_at.desc())
     total = base_q.count()
-    subs = base_q.offset((page-1)*page_size).limit(page_size).all()
+    subs = with_submission_relations(base_q, with_items=False).offset((page-1)*page_size).limit(page_size).all()
     rows = []
     for s in subs:
-        total_items = len(s.items)
-        pending_items = sum(1 for it in s.items if not it.approved)
-        ok_items = sum(1 for it in s.items if it.approved and not it.revoked)
-        rev_items = sum(1 for it in s.items if it.revoked)
-        manual_set = (getattr(s, 'manual_points', None) is not None)
         # 状态与后台审核页保持一致：
         # 已审核 = 被驳回 或 (有条目且全部处理完) 或 (无条目但人工分已设置)
-        reviewed = getattr(s, 'rejected', False) or (total_items > 0 and pending_items == 0) or (total_items == 0 and manual_set)
+        reviewed = s.review_state in ('reviewed', 'rejected')
         # 若被驳回则分数不显示（前端也可判断，这里预先处理方便模板显示）
-        points_val = compute_submission_points(s) if (reviewed and not getattr(s, 'rejected', False)) else None
+        points_val = s.points_cached if s.review_state == 'reviewed' else None
         rows.append({
             'id': s.id,
             'created_at': s.created_at,
             'event_name': s.event.name if s.event else '—',
             'points': points_val,
             'rejected': getattr(s, 'rejected', False),
-            'pending_items': pending_items,
-            'ok_items': ok_items,
-            'rev_items': rev_items,
+            'pending_items': s.pending_count,
+            'ok_items': s.ok_count,
+            'rev_items': s.revoked_count,
             'reviewed': reviewed,
         })
     total_pages = (total + page_size - 1) // page_size
@@ -156,11 +161,11 @@ def my_submissions_page(request: Request, page: int = 1, db = Depends(get_db), c
 def mark_notification_read(notif_id: int, request: Request, db = Depends(get_db), current_user = Depends(get_current_user)):
     """标记单条通知为已读。仅允许通知所属用户操作。"""
     require_login(current_user)
-    notif = db.get(Notification, notif_id)
+    notif = db.get(NotificationReceipt, notif_id)
     if not notif or notif.is_deleted or notif.user_id != current_user.id:
         return RedirectResponse("/profile?msg=通知不存在或无权限", status_code=302)
     if notif.read_at is None:
-        notif.read_at = now_tokyo()
+        mark_read(db, notif, now_tokyo())
         db.commit()
     # 尝试跳回 Referer，否则首页
     ref = request.headers.get("referer") or "/"
@@ -171,10 +176,7 @@ def mark_notification_read(notif_id: int, request: Request, db = Depends(get_db)
 def mark_all_notifications_read(request: Request, db = Depends(get_db), current_user = Depends(get_current_user)):
     """将当前用户所有未读通知全部标记为已读。"""
     require_login(current_user)
-    notifs = db.query(Notification).filter(Notification.user_id == current_user.id, Notification.is_deleted == False, Notification.read_at == None).all()
-    ts = now_tokyo()
-    for n in notifs:
-        n.read_at = ts
+    mark_all_read(db, current_user.id, now_tokyo())
     db.commit()
     ref = request.headers.get("referer") or "/"
     return RedirectResponse(ref, status_code=302)
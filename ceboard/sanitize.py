@@ -0,0 +1,163 @@
+"""Markdown 渲染结果的 HTML 清洗。
+
+白名单（标签、属性、链接协议）只在这里定义一次，由可替换的后端执行：
+- bleach：纯 Python 实现；
+- nh3：Rust ammonia 的绑定，结果同样严格，速度快一个数量级以上。
+
+SANITIZER 环境变量在启动时选择后端（auto / nh3 / bleach，auto 优先 nh3），sanitize 即所选后端；
+两者都未安装时 sanitize 为 None，md_to_html 退回转义后的 <pre>。
+XSS_SAMPLES 与 unsafe_parts 是各后端共用的检查样例与判定，供 python -m ceboard.manage check-sanitizer 与测试使用。
+"""
+import re
+from html.parser import HTMLParser
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .config import SANITIZER
+
+try:
+    import bleach
+except Exception:  # bleach not installed in current env
+    bleach = None
+try:
+    import nh3
+except Exception:
+    nh3 = None
+
+Sanitizer = Callable[[str], str]
+
+ALLOWED_TAGS = frozenset([
+    'a', 'p', 'ul', 'ol', 'li', 'strong', 'em', 'blockquote',
+    'pre', 'code', 'hr', 'br',
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+    'table', 'thead', 'tbody', 'tr', 'th', 'td', 'img',
+])
+ALLOWED_ATTRS = {
+    'a': ['href', 'title', 'target', 'rel'],
+    'th': ['colspan', 'rowspan'],
+    'td': ['colspan', 'rowspan'],
+    # keep code/class if using future highlighters
+    'code': ['class'],
+    'pre': ['class'],
+    'img': ['src', 'alt', 'title', 'width', 'height'],
+}
+ALLOWED_PROTOCOLS = frozenset(['http', 'https', 'mailto'])
+
+
+def _bleach_clean(html: str) -> str:
+    return bleach.clean(
+        html,
+        tags=ALLOWED_TAGS,
+        attributes=ALLOWED_ATTRS,
+        protocols=ALLOWED_PROTOCOLS,
+        strip=True,
+    )
+
+
+def _nh3_clean(html: str) -> str:
+    # rel 在白名单内，需关闭 ammonia 自动添加的 rel（两者同时设置会报错）
+    return nh3.clean(
+        html,
+        tags=set(ALLOWED_TAGS),
+        attributes={k: set(v) for k, v in ALLOWED_ATTRS.items()},
+        url_schemes=set(ALLOWED_PROTOCOLS),
+        link_rel=None,
+    )
+
+
+def available_backends() -> Dict[str, Sanitizer]:
+    """已安装的后端：{名称: 清洗函数}。"""
+    backends = {}
+    if nh3 is not None:
+        backends["nh3"] = _nh3_clean
+    if bleach is not None:
+        backends["bleach"] = _bleach_clean
+    return backends
+
+
+def get_sanitizer(name: str = "auto") -> Optional[Sanitizer]:
+    """按名称取后端；auto 取第一个可用的（nh3 优先）。指定的后端未安装时退回 auto。"""
+    backends = available_backends()
+    if name in backends:
+        return backends[name]
+    return next(iter(backends.values()), None)
+
+
+def backend_name(fn: Optional[Sanitizer]) -> str:
+    for name, b in available_backends().items():
+        if b is fn:
+            return name
+    return "none"
+
+
+sanitize: Optional[Sanitizer] = get_sanitizer(SANITIZER)
+
+
+# 清洗后端的一致性样例：经 Markdown 渲染后清洗，输出中不得出现白名单以外的标签、属性或链接协议
+XSS_SAMPLES = [
+    "<script>alert(1)</script>",
+    "<img src=x onerror=alert(1)>",
+    "<img src=\"javascript:alert(1)\">",
+    "[x](javascript:alert(1))",
+    "[x](JaVaScRiPt:alert(1))",
+    "[x](&#106;avascript:alert(1))",
+    "[x](data:text/html;base64,PHNjcmlwdD5hbGVydCgxKTwvc2NyaXB0Pg==)",
+    "<a href=\"vbscript:msgbox(1)\">x</a>",
+    "<a href=\"java\tscript:alert(1)\">x</a>",
+    "<svg/onload=alert(1)>",
+    "<iframe src=\"https://example.com\"></iframe>",
+    "<object data=\"x.swf\"></object><embed src=\"x.swf\">",
+    "<style>body{display:none}</style>",
+    "<div style=\"background:url(javascript:alert(1))\">x</div>",
+    "<p onclick=\"alert(1)\">x</p>",
+    "<a href=\"https://ok\" onmouseover=\"alert(1)\">x</a>",
+    "<form action=\"https://evil\"><input name=q><button>x</button></form>",
+    "<math><mi xlink:href=\"javascript:alert(1)\">x</mi></math>",
+    "<scr<script>ipt>alert(1)</script>",
+    "<!--<script>alert(1)</script>-->",
+    "<meta http-equiv=\"refresh\" content=\"0;url=javascript:alert(1)\">",
+    "<base href=\"https://evil/\">",
+    "<table><tr><td background=\"javascript:alert(1)\">x</td></tr></table>",
+    "```\n<script>alert(1)</script>\n```",
+    "`<img src=x onerror=alert(1)>`",
+    "<a href=\"mailto:a@b.c\">ok</a> <a href=\"https://ok/\" title=\"t\">ok</a>",
+    "<a href=\"https://ok/\" rel=\"nofollow noopener\" target=\"_blank\">ok</a> [plain](https://ok/)",
+]
+
+Tag = Tuple[str, Dict[str, Optional[str]]]
+
+
+def start_tags(html: str) -> List[Tag]:
+    """html 中依次出现的开始标签：[(标签, {属性: 值})]。"""
+    tags: List[Tag] = []
+
+    class P(HTMLParser):
+        def handle_starttag(self, tag, attrs):
+            tags.append((tag, dict(attrs)))
+
+    P(convert_charrefs=True).feed(html)
+    return tags
+
+
+def url_scheme(value: str) -> Optional[str]:
+    """浏览器解析 URL 时得到的协议（小写），相对地址为 None：
+    去掉首尾空白与控制字符、删除其中的制表符和换行后再判断。
+    """
+    v = re.sub(r"[\t\n\r]", "", value.strip("".join(map(chr, range(33)))))
+    m = re.match(r"([a-zA-Z][a-zA-Z0-9+.-]*):", v)
+    return m.group(1).lower() if m else None
+
+
+def unsafe_parts(html: str) -> list:
+    """html 中不在白名单内的标签 / 属性 / 链接协议。"""
+    found = []
+    for tag, attrs in start_tags(html):
+        if tag not in ALLOWED_TAGS:
+            found.append(f"<{tag}>")
+        for name, value in attrs.items():
+            if name not in ALLOWED_ATTRS.get(tag, []):
+                found.append(f"{tag}[{name}]")
+            elif name in ("href", "src") and value:
+                scheme = url_scheme(value)
+                if scheme is not None and scheme not in ALLOWED_PROTOCOLS:
+                    found.append(f"{tag}[{name}={value}]")
+    return found
@@ -0,0 +1,239 @@
+"""提交计分列、user_month_scores 物化表的维护与积分榜缓存。
+
+写操作在 commit 之前调用 refresh_* 系列函数：先用一条 UPDATE 重算受影响提交的
+points_cached / ok_count / pending_count / revoked_count / review_state，再更新对应的月度汇总行，
+全部与源数据在同一事务内提交；rebuild_* 从源表全量重建（python -m ceboard.manage rebuild-scores）。
+
+积分榜结果按 (year, month, team_type) 缓存在进程内，并以 settings.score_version 作为版本号：
+所有影响积分榜的写操作都会递增该版本，多个 worker 通过同一张表判断缓存是否失效。
+"""
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import Integer, Text, and_, case, cast, func, update
+
+from .config import TZ
+from .models import PointAdjustment, Setting, Submission, UserMonthScore
+from .utils import (
+    approved_base_scalar, approved_count_scalar, event_weight_scalar, item_count_scalar, leaderboard_month_and_total,
+    month_ts_range, pending_count_scalar, review_state_sql, revoked_count_scalar, submission_points_sql,
+)
+
+MonthKey = Tuple[int, int, int]  # (user_id, year, month)
+
+SCORE_VERSION_KEY = "score_version"
+LEADERBOARD_CACHE_SIZE = 64
+
+_leaderboard_cache: Dict[Tuple[int, int, str], Tuple[int, List[Dict[str, float]]]] = {}
+_count_cache: Dict[tuple, Tuple[int, int]] = {}
+_cache_lock = threading.Lock()
+
+
+def get_score_version(db) -> int:
+    v = db.query(Setting.value).filter(Setting.key == SCORE_VERSION_KEY).scalar()
+    try:
+        return int(v or 0)
+    except Exception:
+        return 0
+
+
+def bump_score_version(db) -> None:
+    """在当前事务内用一条 UPDATE 原子递增积分版本号（随写操作一同提交）。
+    该行由迁移写入（见 migrations.ensure_settings），这里不做插入，避免并发的首次写入主键冲突。
+    """
+    updated = (
+        db.query(Setting)
+        .filter(Setting.key == SCORE_VERSION_KEY)
+        .update({Setting.value: cast(cast(Setting.value, Integer) + 1, Text)}, synchronize_session=False)
+    )
+    if not updated:
+        raise RuntimeError("settings 中缺少 score_version，请先执行数据库迁移")
+
+
+def cached_leaderboard(db, year: int, month: int, team_type: str, version: Optional[int] = None) -> List[Dict[str, float]]:
+    """带版本校验的 leaderboard_month_and_total；version 可由调用方预先读取以便多次复用。
+    先读版本再计算，计算期间若有新写入，缓存的结果只会比版本号更新，下次读取即失效重算。
+    """
+    if version is None:
+        version = get_score_version(db)
+    key = (int(year), int(month), team_type)
+    with _cache_lock:
+        hit = _leaderboard_cache.get(key)
+    if hit and hit[0] == version:
+        return hit[1]
+    rows = leaderboard_month_and_total(db, year, month, team_type)
+    with _cache_lock:
+        _leaderboard_cache.pop(key, None)
+        _leaderboard_cache[key] = (version, rows)
+        while len(_leaderboard_cache) > LEADERBOARD_CACHE_SIZE:
+            _leaderboard_cache.pop(next(iter(_leaderboard_cache)))
+    return rows
+
+
+def cached_count(db, key: tuple, q, version: Optional[int] = None) -> int:
+    """带版本校验的 q.count()。提交的新增、删除、恢复与审核状态变化都会经 refresh_* 递增版本号，
+    因此以 score_version 作为提交类计数（如审核中心的筛选总数）的失效依据。
+    """
+    if version is None:
+        version = get_score_version(db)
+    with _cache_lock:
+        hit = _count_cache.get(key)
+    if hit and hit[0] == version:
+        return hit[1]
+    n = q.order_by(None).count()
+    with _cache_lock:
+        _count_cache.pop(key, None)
+        _count_cache[key] = (version, n)
+        while len(_count_cache) > LEADERBOARD_CACHE_SIZE:
+            _count_cache.pop(next(iter(_count_cache)))
+    return n
+
+
+def month_of(dt: Optional[datetime]) -> Tuple[int, int]:
+    """提交时间所属的（东京时间）年月。SQLite 读回的时间不带时区，按 TZ 本地时间处理。"""
+    if dt is None:
+        dt = datetime.now(TZ)
+    elif dt.tzinfo is not None:
+        dt = dt.astimezone(TZ)
+    return dt.year, dt.month
+
+
+def refresh_submission_stats(db, where=None) -> None:
+    """按条目、人工分、驳回状态与活动权重，用一条 UPDATE 重算提交的计分列；where 为空时重算全部。"""
+    db.flush()
+    item_count, pending = item_count_scalar(), pending_count_scalar()
+    stmt = update(Submission).values(
+        points_cached=submission_points_sql(approved_base_scalar(), event_weight_scalar()),
+        ok_count=approved_count_scalar(),
+        pending_count=pending,
+        revoked_count=revoked_count_scalar(),
+        review_state=review_state_sql(item_count, pending),
+    )
+    if where is not None:
+        stmt = stmt.where(where)
+    db.execute(stmt.execution_options(synchronize_session=False))
+    # 会话中已加载的提交对象需重新读取计分列
+    for obj in list(db.identity_map.values()):
+        if isinstance(obj, Submission):
+            db.expire(obj, ['points_cached', 'ok_count', 'pending_count', 'revoked_count', 'review_state'])
+
+
+def refresh_user_month(db, user_id: int, year: int, month: int) -> None:
+    """从提交计分列与积分调整重新计算某成员某月的汇总行；全部为零时删除该行。"""
+    db.flush()
+    start, end = month_ts_range(year, month)
+    sub_count, points, approved = (
+        db.query(
+            func.count(Submission.id),
+            func.sum(Submission.points_cached),
+            func.sum(Submission.ok_count),
+        )
+        .filter(Submission.user_id == user_id, Submission.is_deleted == False)
+        .filter(Submission.created_ts >= start, Submission.created_ts < end)
+        .one()
+    )
+    adj_count, adj_points = (
+        db.query(func.count(PointAdjustment.id), func.sum(PointAdjustment.amount))
+        .filter(PointAdjustment.user_id == user_id, PointAdjustment.is_deleted == False)
+        .filter(PointAdjustment.year == year, PointAdjustment.month == month)
+        .one()
+    )
+    row = db.get(UserMonthScore, (user_id, year, month))
+    if not sub_count and not adj_count:
+        if row is not None:
+            db.delete(row)
+        return
+    if row is None:
+        row = UserMonthScore(user_id=user_id, year=year, month=month)
+        db.add(row)
+    row.points = float(points or 0.0)
+    row.approved_count = int(approved or 0)
+    row.submission_count = int(sub_count or 0)
+    row.adjust_points = float(adj_points or 0.0)
+    row.adjust_count = int(adj_count or 0)
+
+
+def refresh_keys(db, keys: Iterable[MonthKey]) -> None:
+    for uid, y, m in sorted(set(keys)):
+        refresh_user_month(db, uid, y, m)
+    bump_score_version(db)
+
+
+def submission_keys(subs: Iterable[Submission]) -> Set[MonthKey]:
+    return {(s.user_id, *month_of(s.created_at)) for s in subs}
+
+
+def query_keys(q) -> Set[MonthKey]:
+    """从 Submission 查询中收集受影响的（成员, 年, 月），只取两列，不加载整行。"""
+    return {(uid, *month_of(ts)) for uid, ts in q.with_entities(Submission.user_id, Submission.created_at).distinct()}
+
+
+def refresh_for_submissions(db, subs: Iterable[Submission]) -> None:
+    db.flush()
+    subs = list(subs)
+    refresh_submission_stats(db, Submission.id.in_([s.id for s in subs]))
+    refresh_keys(db, submission_keys(subs))
+
+
+def refresh_for_query(db, q) -> None:
+    """q 为 Submission 查询；适合活动权重、题目分值等影响多条提交的变更。"""
+    db.flush()
+    refresh_submission_stats(db, Submission.id.in_(q.with_entities(Submission.id).scalar_subquery()))
+    refresh_keys(db, query_keys(q))
+
+
+def refresh_for_adjustment(db, adj: PointAdjustment) -> None:
+    db.flush()
+    refresh_keys(db, [(adj.user_id, adj.year, adj.month)])
+
+
+def rebuild_user_month_scores(db) -> int:
+    """重算全部提交计分列，再清空并全量重建 user_month_scores，返回写入行数。"""
+    refresh_submission_stats(db)
+    db.query(UserMonthScore).delete(synchronize_session=False)
+    acc = {}
+
+    def slot(key):
+        if key not in acc:
+            acc[key] = UserMonthScore(user_id=key[0], year=key[1], month=key[2], points=0.0, approved_count=0, submission_count=0, adjust_points=0.0, adjust_count=0)
+        return acc[key]
+
+    sub_rows = (
+        db.query(Submission.user_id, Submission.created_at, Submission.points_cached, Submission.ok_count)
+        .filter(Submission.is_deleted == False)
+        .yield_per(1000)
+    )
+    for uid, created_at, pts, approved in sub_rows:
+        r = slot((uid, *month_of(created_at)))
+        r.points += float(pts or 0.0)
+        r.approved_count += int(approved or 0)
+        r.submission_count += 1
+    adj_rows = (
+        db.query(PointAdjustment.user_id, PointAdjustment.year, PointAdjustment.month, func.count(PointAdjustment.id), func.sum(PointAdjustment.amount))
+        .filter(PointAdjustment.is_deleted == False)
+        .group_by(PointAdjustment.user_id, PointAdjustment.year, PointAdjustment.month)
+        .all()
+    )
+    for uid, y, m, cnt, amt in adj_rows:
+        r = slot((uid, y, m))
+        r.adjust_count = int(cnt or 0)
+        r.adjust_points = float(amt or 0.0)
+    db.add_all(acc.values())
+    bump_score_version(db)
+    db.flush()
+    return len(acc)
+
+
+def user_points(db, user_id: int, year: int, month: int) -> Tuple[float, float]:
+    """某成员的（本月提交积分, 累计提交积分），不含积分调整，与个人主页口径一致。"""
+    is_month = and_(UserMonthScore.year == year, UserMonthScore.month == month)
+    month_pts, total_pts = (
+        db.query(
+            func.sum(case((is_month, UserMonthScore.points), else_=0.0)),
+            func.sum(UserMonthScore.points),
+        )
+        .filter(UserMonthScore.user_id == user_id)
+        .one()
+    )
+    return float(month_pts or 0.0), float(total_pts or 0.0)
@@ -1,15 +1,18 @@
+import hashlib
+import threading
+from collections import OrderedDict
 from datetime import datetime
 from typing import Optional, Dict, List
 import markdown as mdlib
-try:
-    import bleach
-except Exception:  # bleach not installed in current env
-    bleach = None
+from fastapi.concurrency import run_in_threadpool
 
-from .config import TZ
+from .config import MD_CACHE_SIZE, TZ
 from html import escape
-from .models import Submission, User
-from sqlalchemy import or_
+from .models import Announcement, Setting, Submission, User, epoch_of
+from .render_pool import render_in_pool, render_in_pool_async, use_render_pool
+from .sanitize import sanitize
+from sqlalchemy import and_, case, func, insert, or_, select, update
+from sqlalchemy.orm import joinedload, selectinload
 import smtplib
 from email.message import EmailMessage
 
@@ -27,6 +30,12 @@ def month_range(year: int, month: int):
     return start, end
 
 
+def month_ts_range(year: int, month: int):
+    """month_range 对应的 UTC 时间戳区间 [start, end)，用于 created_ts 列的范围查询。"""
+    start, end = month_range(year, month)
+    return epoch_of(start), epoch_of(end)
+
+
 def compute_submission_points(sub: Submission) -> float:
     """Return points for a submission.
     If manual_points is set, use it directly (already considered by reviewer);
@@ -51,47 +60,132 @@ def compute_submission_points(sub: Submission) -> float:
     return total * float(sub.event.weight or 1.0)
 
 
+def approved_base_scalar():
+    """关联到外层 Submission 的已通过且未撤销条目 base_score 合计（题目已彻底删除的条目不计）。"""
+    from .models import Submission, SubmissionItem, Challenge
+    return (
+        select(func.sum(Challenge.base_score))
+        .select_from(SubmissionItem)
+        .join(Challenge, Challenge.id == SubmissionItem.challenge_id)
+        .where(SubmissionItem.submission_id == Submission.id)
+        .where(SubmissionItem.approved == True)
+        .where(or_(SubmissionItem.revoked == False, SubmissionItem.revoked == None))
+        .correlate(Submission)
+        .scalar_subquery()
+    )
+
+
+def _item_count_scalar(*conds):
+    from .models import Submission, SubmissionItem
+    return (
+        select(func.count(SubmissionItem.id))
+        .where(SubmissionItem.submission_id == Submission.id, *conds)
+        .correlate(Submission)
+        .scalar_subquery()
+    )
+
+
+def item_count_scalar():
+    return _item_count_scalar()
+
+
+def approved_count_scalar():
+    """已通过且未撤销条目数（不要求题目仍存在，与列表页 count_ok 一致）。"""
+    from .models import SubmissionItem
+    return _item_count_scalar(SubmissionItem.approved == True, or_(SubmissionItem.revoked == False, SubmissionItem.revoked == None))
+
+
+def pending_count_scalar():
+    from .models import SubmissionItem
+    return _item_count_scalar(or_(SubmissionItem.approved == False, SubmissionItem.approved == None))
+
+
+def revoked_count_scalar():
+    from .models import SubmissionItem
+    return _item_count_scalar(SubmissionItem.revoked == True)
+
+
+def event_weight_scalar():
+    """提交所属活动的计分权重（weight 为空或 0 时按 1.0）；活动不存在时为 NULL。"""
+    from .models import Submission, Event
+    return (
+        select(case((or_(Event.weight == None, Event.weight == 0), 1.0), else_=Event.weight))
+        .where(Event.id == Submission.event_id)
+        .correlate(Submission)
+        .scalar_subquery()
+    )
+
+
+def submission_points_sql(base_total, weight):
+    """compute_submission_points 的 SQL 表达式版本，口径保持一致：
+    驳回或活动缺失记 0；manual_points 优先；否则 SUM(base_score) * weight。
+    base_total / weight 分别取 approved_base_scalar() / event_weight_scalar()。
+    """
+    from .models import Submission
+    return case(
+        (Submission.rejected == True, 0.0),
+        (weight == None, 0.0),
+        (Submission.manual_points != None, Submission.manual_points),
+        else_=func.coalesce(base_total, 0) * weight,
+    )
+
+
+def review_state_sql(item_count, pending_count):
+    """审核状态：rejected（被驳回）| reviewed（有条目且无待审，或无条目但已设人工分）| pending。"""
+    from .models import Submission
+    return case(
+        (Submission.rejected == True, 'rejected'),
+        (and_(item_count > 0, pending_count == 0), 'reviewed'),
+        (and_(item_count == 0, Submission.manual_points != None), 'reviewed'),
+        else_='pending',
+    )
+
+
+def with_submission_relations(q, with_items: bool = True):
+    """为提交列表预加载 items→challenge、user、event，避免在循环里逐行懒加载（N+1）。
+    无论返回多少行，额外查询数恒定（items 与 challenge 各一次 IN 查询，user/event 随主查询 JOIN）。
+    只用到统计列（ok_count 等）而不展示题目名时可传 with_items=False。
+    count() 请在加 options 之前的查询上调用。
+    """
+    from .models import SubmissionItem
+    opts = [joinedload(Submission.user), joinedload(Submission.event)]
+    if with_items:
+        opts.append(selectinload(Submission.items).selectinload(SubmissionItem.challenge))
+    return q.options(*opts)
+
+
 def leaderboard_month_and_total(db, year: int, month: int, team_type: str) -> List[Dict[str, float]]:
-    from .models import Submission, User, PointAdjustment
-    start, end = month_range(year, month)
+    """从 user_month_scores 汇总本月/上月/累计积分。
+    提交积分只统计未删除且未隐藏的成员；积分调整沿用原口径，对同队成员一律计入。
+    """
+    from .models import User, UserMonthScore as S
     # previous month range
     if month == 1:
         prev_year, prev_month = year - 1, 12
     else:
         prev_year, prev_month = year, month - 1
-    prev_start, prev_end = month_range(prev_year, prev_month)
-
-    subs_month = (
-        db.query(Submission)
-        .join(User, Submission.user_id == User.id)
-    .filter(User.team_type == team_type)
-    .filter(User.role == 'member')
-    .filter(User.is_deleted == False)
-    .filter(or_(User.show_on_leaderboard == True, User.show_on_leaderboard == None))
-        .filter(Submission.is_deleted == False)
-        .filter(Submission.created_at >= start, Submission.created_at < end)
-        .all()
-    )
-    subs_total = (
-        db.query(Submission)
-        .join(User, Submission.user_id == User.id)
-    .filter(User.team_type == team_type)
-    .filter(User.role == 'member')
-    .filter(User.is_deleted == False)
-    .filter(or_(User.show_on_leaderboard == True, User.show_on_leaderboard == None))
-        .filter(Submission.is_deleted == False)
-        .all()
-    )
-    # previous month submissions
-    subs_prev = (
-        db.query(Submission)
-        .join(User, Submission.user_id == User.id)
-    .filter(User.team_type == team_type)
-    .filter(User.role == 'member')
-    .filter(User.is_deleted == False)
-    .filter(or_(User.show_on_leaderboard == True, User.show_on_leaderboard == None))
-        .filter(Submission.is_deleted == False)
-        .filter(Submission.created_at >= prev_start, Submission.created_at < prev_end)
+    is_month = and_(S.year == year, S.month == month)
+    is_prev = and_(S.year == prev_year, S.month == prev_month)
+
+    agg_rows = (
+        db.query(
+            S.user_id,
+            User.username,
+            User.is_deleted,
+            User.show_on_leaderboard,
+            func.sum(case((is_month, S.points), else_=0.0)),
+            func.sum(case((is_prev, S.points), else_=0.0)),
+            func.sum(S.points),
+            func.sum(S.submission_count),
+            func.sum(case((is_month, S.adjust_points), else_=0.0)),
+            func.sum(case((is_prev, S.adjust_points), else_=0.0)),
+            func.sum(S.adjust_points),
+            func.sum(S.adjust_count),
+        )
+        .join(User, S.user_id == User.id)
+        .filter(User.team_type == team_type)
+        .filter(User.role == 'member')
+        .group_by(S.user_id, User.username, User.is_deleted, User.show_on_leaderboard)
         .all()
     )
 
@@ -100,69 +194,20 @@ def leaderboard_month_and_total(db, year: int, month: int, team_type: str) -> Li
     total_by_user: Dict[int, float] = {}
     names: Dict[int, str] = {}
 
-    for s in subs_month:
-        pts = compute_submission_points(s)
-        month_by_user[s.user_id] = month_by_user.get(s.user_id, 0.0) + pts
-        if s.user_id not in names:
-            u = db.get(User, s.user_id); names[s.user_id] = u.username if u else f"uid:{s.user_id}"
-
-    for s in subs_total:
-        pts = compute_submission_points(s)
-        total_by_user[s.user_id] = total_by_user.get(s.user_id, 0.0) + pts
-        if s.user_id not in names:
-            u = db.get(User, s.user_id); names[s.user_id] = u.username if u else f"uid:{s.user_id}"
-
-    for s in subs_prev:
-        pts = compute_submission_points(s)
-        prev_by_user[s.user_id] = prev_by_user.get(s.user_id, 0.0) + pts
-        if s.user_id not in names:
-            u = db.get(User, s.user_id); names[s.user_id] = u.username if u else f"uid:{s.user_id}"
-
-    # apply monthly adjustments
-    adjs_month = (
-        db.query(PointAdjustment)
-        .join(User, PointAdjustment.user_id == User.id)
-    .filter(User.team_type == team_type)
-    .filter(User.role == 'member')
-        .filter(PointAdjustment.is_deleted == False)
-        .filter(PointAdjustment.year == year, PointAdjustment.month == month)
-        .all()
-    )
-    for a in adjs_month:
-        month_by_user[a.user_id] = month_by_user.get(a.user_id, 0.0) + float(a.amount)
-        if a.user_id not in names:
-            u = db.get(User, a.user_id); names[a.user_id] = u.username if u else f"uid:{a.user_id}"
-
-    # apply previous month's adjustments
-    adjs_prev = (
-        db.query(PointAdjustment)
-        .join(User, PointAdjustment.user_id == User.id)
-        .filter(User.team_type == team_type)
-        .filter(User.role == 'member')
-        .filter(PointAdjustment.is_deleted == False)
-        .filter(PointAdjustment.year == prev_year, PointAdjustment.month == prev_month)
-        .all()
-    )
-    for a in adjs_prev:
-        prev_by_user[a.user_id] = prev_by_user.get(a.user_id, 0.0) + float(a.amount)
-        if a.user_id not in names:
-            u = db.get(User, a.user_id); names[a.user_id] = u.username if u else f"uid:{a.user_id}"
-
-    # total adjustments across all months contribute to total_points
-    adjs_total = (
-        db.query(PointAdjustment)
-        .join(User, PointAdjustment.user_id == User.id)
-        .filter(User.team_type == team_type)
-        .filter(User.role == 'member')
-        .filter(PointAdjustment.is_deleted == False)
-        .all()
-    )
-    for a in adjs_total:
-        total_by_user[a.user_id] = total_by_user.get(a.user_id, 0.0) + float(a.amount)
-        if a.user_id not in names:
-            u = db.get(User, a.user_id); names[a.user_id] = u.username if u else f"uid:{a.user_id}"
-
-    user_ids = set(names.keys()) | set(month_by_user.keys()) | set(prev_by_user.keys()) | set(total_by_user.keys())
+    for uid, username, is_deleted, show, m_pts, p_pts, t_pts, sub_count, m_adj, p_adj, t_adj, adj_count in agg_rows:
+        visible = (is_deleted == False) and (show is None or show == True)
+        if visible and sub_count:
+            names[uid] = username
+            month_by_user[uid] = float(m_pts or 0.0)
+            prev_by_user[uid] = float(p_pts or 0.0)
+            total_by_user[uid] = float(t_pts or 0.0)
+        if adj_count:
+            names[uid] = username
+            month_by_user[uid] = month_by_user.get(uid, 0.0) + float(m_adj or 0.0)
+            prev_by_user[uid] = prev_by_user.get(uid, 0.0) + float(p_adj or 0.0)
+            total_by_user[uid] = total_by_user.get(uid, 0.0) + float(t_adj or 0.0)
+
+    user_ids = set(names.keys())
     rows = [
         {
             "user_id": uid,
@@ -173,103 +218,172 @@ def leaderboard_month_and_total(db, year: int, month: int, team_type: str) -> Li
         }
         for uid in user_ids
     ]
-    rows.sort(key=lambda r: (r["month_points"], r["total_points"]), reverse=True)
+    # 同分按 user_id 排列，顺序不依赖 SQL 分组或集合的遍历顺序
+    rows.sort(key=lambda r: (-r["month_points"], -r["total_points"], r["user_id"]))
     return rows
 
 
 def leaderboard_count_approved(db, year: int, month: int, team_type: str) -> List[Dict[str, float]]:
     """基于通过题目数量的排行榜（不使用积分），排除管理员账号。"""
-    from .models import Submission, User
-    start, end = month_range(year, month)
-
-    subs_month = (
-        db.query(Submission)
-        .join(User, Submission.user_id == User.id)
-        .filter(User.team_type == team_type)
-        .filter(User.role == 'member')
-        .filter(User.is_deleted == False)
-        .filter(Submission.is_deleted == False)
-        .filter(Submission.created_at >= start, Submission.created_at < end)
-        .all()
-    )
-    subs_total = (
-        db.query(Submission)
-        .join(User, Submission.user_id == User.id)
+    from .models import User, UserMonthScore as S
+    is_month = and_(S.year == year, S.month == month)
+
+    agg_rows = (
+        db.query(
+            S.user_id,
+            User.username,
+            func.sum(case((is_month, S.approved_count), else_=0)),
+            func.sum(S.approved_count),
+        )
+        .join(User, S.user_id == User.id)
         .filter(User.team_type == team_type)
         .filter(User.role == 'member')
         .filter(User.is_deleted == False)
-        .filter(Submission.is_deleted == False)
+        .filter(S.submission_count > 0)
+        .group_by(S.user_id, User.username)
         .all()
     )
-
-    month_by_user: Dict[int, int] = {}
-    total_by_user: Dict[int, int] = {}
-    names: Dict[int, str] = {}
-
-    def count_ok(sub):
-        return sum(1 for it in sub.items if it.approved and not it.revoked)
-
-    for s in subs_month:
-        month_by_user[s.user_id] = month_by_user.get(s.user_id, 0) + count_ok(s)
-        if s.user_id not in names:
-            u = db.get(User, s.user_id); names[s.user_id] = u.username if u else f"uid:{s.user_id}"
-
-    for s in subs_total:
-        total_by_user[s.user_id] = total_by_user.get(s.user_id, 0) + count_ok(s)
-        if s.user_id not in names:
-            u = db.get(User, s.user_id); names[s.user_id] = u.username if u else f"uid:{s.user_id}"
-
-    user_ids = set(names.keys()) | set(month_by_user.keys()) | set(total_by_user.keys())
     rows = [
         {
             "user_id": uid,
-            "username": names.get(uid, f"uid:{uid}"),
-            "month_count": int(month_by_user.get(uid, 0)),
-            "total_count": int(total_by_user.get(uid, 0)),
+            "username": username,
+            "month_count": int(m_cnt or 0),
+            "total_count": int(t_cnt or 0),
         }
-        for uid in user_ids
+        for uid, username, m_cnt, t_cnt in agg_rows
     ]
-    rows.sort(key=lambda r: (r["month_count"], r["total_count"]), reverse=True)
+    rows.sort(key=lambda r: (-r["month_count"], -r["total_count"], r["user_id"]))
     return rows
 
 
-def md_to_html(md_text: Optional[str]) -> str:
-    """Render markdown to sanitized HTML to prevent XSS.
+def render_markdown(md_text: Optional[str]) -> str:
+    """Render markdown to sanitized HTML to prevent XSS (uncached; callers use md_to_html).
     Allowed tags are restricted; script/style/event handlers are stripped.
     Images are intentionally disallowed; links are preserved with safe protocols.
     """
     if not md_text:
         return ""
     raw_html = mdlib.markdown(md_text, extensions=["fenced_code", "tables"]) or ""
-    if bleach is None:
-        # Safe fallback: show raw markdown as escaped preformatted text
-        from html import escape
-        return f"<pre class='md-fallback'>{escape(md_text)}</pre>"
-    allowed_tags = set([
-        'a', 'p', 'ul', 'ol', 'li', 'strong', 'em', 'blockquote',
-        'pre', 'code', 'hr', 'br',
-        'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
-        'table', 'thead', 'tbody', 'tr', 'th', 'td', 'img'
-    ])
-    allowed_attrs = {
-        'a': ['href', 'title', 'target', 'rel'],
-        'th': ['colspan', 'rowspan'],
-        'td': ['colspan', 'rowspan'],
-        # keep code/class if using future highlighters
-        'code': ['class'],
-        'pre': ['class'],
-        'img': ['src', 'alt', 'title', 'width', 'height'],
-    }
-    cleaned = bleach.clean(
-        raw_html,
-        tags=allowed_tags,
-        attributes=allowed_attrs,
-        protocols=['http', 'https', 'mailto'],
-        strip=True,
-    )
-    # Optional: ensure external links have rel noopener
+    if sanitize is None:
+        return _md_fallback(md_text)
+    # Allow-list and backend live in sanitize.py.
     # We avoid linkify to keep code blocks intact.
-    return cleaned
+    return sanitize(raw_html)
+
+
+def _md_fallback(md_text: str) -> str:
+    # Safe fallback: show raw markdown as escaped preformatted text
+    return f"<pre class='md-fallback'>{escape(md_text)}</pre>"
+
+
+_md_cache: "OrderedDict[str, str]" = OrderedDict()
+_md_lock = threading.Lock()
+
+
+def _md_key(md_text: str) -> str:
+    return hashlib.sha256(md_text.encode("utf-8")).hexdigest()
+
+
+def _cache_get(key: str) -> Optional[str]:
+    with _md_lock:
+        html = _md_cache.get(key)
+        if html is not None:
+            _md_cache.move_to_end(key)
+        return html
+
+
+def _cache_put(key: str, html: Optional[str]) -> None:
+    if html is not None and MD_CACHE_SIZE > 0:
+        with _md_lock:
+            _md_cache[key] = html
+            while len(_md_cache) > MD_CACHE_SIZE:
+                _md_cache.popitem(last=False)
+
+
+def _render_cached(md_text: str) -> Optional[str]:
+    """Cached render; large texts go to the render process pool when enabled (None on timeout, not cached).
+    Blocks the calling thread: use from sync routes / worker threads, and _render_cached_async from async code.
+    """
+    key = _md_key(md_text)
+    html = _cache_get(key)
+    if html is None:
+        html = render_in_pool(md_text) if use_render_pool(md_text) else render_markdown(md_text)
+        _cache_put(key, html)
+    return html
+
+
+async def _render_cached_async(md_text: str) -> Optional[str]:
+    """_render_cached for async code: the pool is awaited, small texts render in the threadpool."""
+    key = _md_key(md_text)
+    html = _cache_get(key)
+    if html is None:
+        if use_render_pool(md_text):
+            html = await render_in_pool_async(md_text)
+        else:
+            html = await run_in_threadpool(render_markdown, md_text)
+        _cache_put(key, html)
+    return html
+
+
+def md_to_html(md_text: Optional[str]) -> str:
+    """render_markdown with a bounded in-process LRU keyed by the SHA-256 of the markdown text,
+    so repeated views of the same WP / announcement / notification skip markdown and sanitization.
+    Texts of MD_RENDER_THRESHOLD or more are rendered in the render process pool when enabled;
+    if that times out the escaped source is shown instead.
+    """
+    if not md_text:
+        return ""
+    html = _render_cached(md_text)
+    return html if html is not None else _md_fallback(md_text)
+
+
+def prerender_html(md_text: Optional[str]) -> Optional[str]:
+    """保存时写入 *_html 列的 HTML；无法清洗（未安装清洗库）时返回 None，读取时再按需渲染。"""
+    if not md_text or sanitize is None:
+        return None
+    return _render_cached(md_text)
+
+
+async def prerender_html_async(md_text: Optional[str]) -> Optional[str]:
+    """prerender_html 的 async 版本，供 async 路由在保存前调用（渲染不占用事件循环）。"""
+    if not md_text or sanitize is None:
+        return None
+    return await _render_cached_async(md_text)
+
+
+def stored_html(html: Optional[str], md_text: Optional[str]) -> str:
+    """优先使用保存时渲染好的 HTML，缺失时（旧数据）现场渲染但不写回：GET 页面不写库，
+    缺失的 HTML 由迁移或 python -m ceboard.manage render-markdown 补齐。"""
+    return html if html is not None else md_to_html(md_text)
+
+
+RULES_HTML_KEY = "rules_html"
+
+
+def prerender_stored_html(db, force: bool = False) -> int:
+    """为 submissions.wp_html、announcements.content_html 与规则（settings.rules_html）写入渲染好的 HTML，返回写入条数。
+    db 可以是 Session 或 Connection；force=False 只补齐缺失的，更换 Markdown 扩展或清洗规则后用 force=True 全部重写。
+    """
+    n = 0
+    for model, md_col, html_col in ((Submission, Submission.wp_md, Submission.wp_html), (Announcement, Announcement.content, Announcement.content_html)):
+        q = select(model.id, md_col).where(md_col != None, md_col != "")
+        if not force:
+            q = q.where(html_col == None)
+        for row_id, md_text in db.execute(q).all():
+            html = prerender_html(md_text)
+            if html is not None:
+                db.execute(update(model).where(model.id == row_id).values({html_col: html}).execution_options(synchronize_session=False))
+                n += 1
+    rules_md = db.execute(select(Setting.value).where(Setting.key == "rules_md")).scalar()
+    has_rules_html = db.execute(select(Setting.key).where(Setting.key == RULES_HTML_KEY)).first() is not None
+    html = prerender_html(rules_md)
+    if html is not None and (force or not has_rules_html):
+        if has_rules_html:
+            db.execute(update(Setting).where(Setting.key == RULES_HTML_KEY).values(value=html).execution_options(synchronize_session=False))
+        else:
+            db.execute(insert(Setting).values(key=RULES_HTML_KEY, value=html))
+        n += 1
+    return n
 
 
 def _wrap_email_html(subject: str, body_md: str) -> str:
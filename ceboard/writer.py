@@ -0,0 +1,183 @@
+"""可选的写操作串行化（WRITE_QUEUE=1 开启）。
+
+开启后，接入的写路由把“写入函数”放入有界队列，由单独的写线程依次执行：写线程每次最多取
+WRITE_BATCH_SIZE 个任务，在同一个事务中为每个任务建立 SAVEPOINT，最后一次提交，
+某个任务出错只回滚它自己的部分。读请求不经过队列，仍在各自的会话中并发执行。
+队列已满时等待 WRITE_QUEUE_TIMEOUT 秒，仍无法入队则返回 503。
+
+写入函数形如 fn(db) -> 结果：db 为写线程的会话，函数内按 id 重新读取需要修改的对象，
+不要调用 db.commit()；返回值在事务提交后交给调用方，应为 id、字符串等普通值（ORM 对象提交后即过期）。
+未开启时 run_write 直接用请求的会话执行并提交，行为与原先一致。
+"""
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from .config import WRITE_BATCH_SIZE, WRITE_QUEUE_ENABLED, WRITE_QUEUE_SIZE, WRITE_QUEUE_TIMEOUT
+from .database import SessionLocal, engine
+
+WriteFn = Callable[[Any], Any]
+
+_queue: "queue.Queue" = queue.Queue(maxsize=max(1, WRITE_QUEUE_SIZE))
+_STOP = object()
+_thread: Optional[threading.Thread] = None
+_thread_lock = threading.Lock()
+
+_metrics_lock = threading.Lock()
+_metrics = {
+    'jobs': 0,  # 已执行的任务数
+    'failed': 0,  # 出错的任务数（含整批提交失败）
+    'rejected': 0,  # 队列已满被拒绝的任务数
+    'batches': 0,  # 提交次数
+    'max_depth': 0,  # 出现过的最大排队数
+    'wait_total': 0.0,  # 任务从入队到开始执行的累计等待（秒）
+    'wait_max': 0.0,
+}
+
+
+def _record(**kw) -> None:
+    with _metrics_lock:
+        for k, v in kw.items():
+            if k in ('max_depth', 'wait_max'):
+                _metrics[k] = max(_metrics[k], v)
+            else:
+                _metrics[k] += v
+
+
+def write_queue_metrics() -> Dict[str, Any]:
+    """写队列的运行指标（管理员面板展示）。"""
+    with _metrics_lock:
+        m = dict(_metrics)
+    jobs = m['jobs']
+    return {
+        'enabled': WRITE_QUEUE_ENABLED,
+        'depth': _queue.qsize(),
+        'max_depth': m['max_depth'],
+        'capacity': _queue.maxsize,
+        'jobs': jobs,
+        'failed': m['failed'],
+        'rejected': m['rejected'],
+        'batches': m['batches'],
+        'avg_batch': (jobs / m['batches']) if m['batches'] else 0.0,
+        'avg_wait_ms': (m['wait_total'] / jobs * 1000) if jobs else 0.0,
+        'max_wait_ms': m['wait_max'] * 1000,
+    }
+
+
+def _begin_write(db) -> None:
+    # pysqlite 在 SAVEPOINT 之前不会自动 BEGIN，这里显式开启事务；IMMEDIATE 同时提前拿到写锁
+    if engine.dialect.name == "sqlite":
+        db.connection().exec_driver_sql("BEGIN IMMEDIATE")
+
+
+def _run_batch(batch: List[Tuple[WriteFn, Future, float]]) -> None:
+    done: List[Tuple[Future, Any]] = []
+    failed = 0
+    now = time.monotonic()
+    db = SessionLocal()
+    try:
+        _begin_write(db)
+        for fn, fut, enqueued in batch:
+            if not fut.set_running_or_notify_cancel():
+                continue
+            wait = now - enqueued
+            _record(wait_total=wait, wait_max=wait)
+            try:
+                with db.begin_nested():
+                    result = fn(db)
+                done.append((fut, result))
+            except BaseException as e:
+                failed += 1
+                fut.set_exception(e)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        failed += len(done)
+        for fut, _ in done:
+            fut.set_exception(e)
+        done = []
+    finally:
+        db.close()
+    _record(jobs=len(batch), failed=failed, batches=1)
+    for fut, result in done:
+        fut.set_result(result)
+
+
+def _writer_loop() -> None:
+    while True:
+        job = _queue.get()
+        if job is _STOP:
+            return
+        batch = [job]
+        stop = False
+        while len(batch) < WRITE_BATCH_SIZE:
+            try:
+                job = _queue.get_nowait()
+            except queue.Empty:
+                break
+            if job is _STOP:
+                stop = True
+                break
+            batch.append(job)
+        _run_batch(batch)
+        if stop:
+            return
+
+
+def start_writer() -> None:
+    """启动写线程（未开启写队列时不做任何事）；可重复调用。"""
+    global _thread
+    if not WRITE_QUEUE_ENABLED:
+        return
+    with _thread_lock:
+        if _thread is None or not _thread.is_alive():
+            _thread = threading.Thread(target=_writer_loop, name="ceboard-writer", daemon=True)
+            _thread.start()
+
+
+def stop_writer(timeout: float = 10.0) -> None:
+    """处理完已入队的任务后停止写线程。"""
+    global _thread
+    with _thread_lock:
+        t, _thread = _thread, None
+    if t is not None and t.is_alive():
+        _queue.put(_STOP)
+        t.join(timeout)
+
+
+def submit_write(fn: WriteFn) -> Future:
+    """把写入函数放入队列，返回 Future；队列已满且超时仍无法入队时抛出 503。"""
+    start_writer()
+    fut: Future = Future()
+    try:
+        _queue.put((fn, fut, time.monotonic()), timeout=WRITE_QUEUE_TIMEOUT)
+    except queue.Full:
+        _record(rejected=1)
+        raise HTTPException(503, "系统繁忙，请稍后重试")
+    _record(max_depth=_queue.qsize())
+    return fut
+
+
+def run_write(db, fn: WriteFn) -> Any:
+    """执行写入并提交，返回 fn 的结果：开启写队列时交给写线程，否则在 db 上执行并提交。"""
+    if not WRITE_QUEUE_ENABLED:
+        result = fn(db)
+        db.commit()
+        return result
+    return submit_write(fn).result()
+
+
+async def run_write_async(db, fn: WriteFn) -> Any:
+    """run_write 的协程版本（async 路由使用），等待写线程时不阻塞事件循环。"""
+    if not WRITE_QUEUE_ENABLED:
+        result = fn(db)
+        db.commit()
+        return result
+    loop = asyncio.get_running_loop()
+    fut = await loop.run_in_executor(None, submit_write, fn)
+    return await asyncio.wrap_future(fut)
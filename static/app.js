@@ -0,0 +1,45 @@
+// 高亮当前所在页面的导航项（而不是按使用次数加深颜色）
+const navLinks = document.querySelectorAll('header .nav a');
+navLinks.forEach(a => {
+  const href = a.getAttribute('href') || '';
+  const path = window.location.pathname;
+  if (href === path || (href !== '/' && path.startsWith(href))) {
+    a.classList.add('active');
+  }
+});
+// Mobile nav toggle
+const mobileBtn = document.getElementById('mobileMenuBtn');
+const mainNav = document.getElementById('mainNav');
+if (mobileBtn && mainNav){
+  mobileBtn.addEventListener('click', (e)=>{
+    e.stopPropagation();
+    mainNav.classList.toggle('open');
+  });
+  document.addEventListener('click', ()=>{ mainNav.classList.remove('open'); });
+}
+// Avatar dropdown
+const trigger = document.getElementById('userTrigger');
+const dropdown = document.getElementById('userDropdown');
+if (trigger && dropdown){
+  trigger.addEventListener('click', (e)=>{
+    e.stopPropagation();
+    dropdown.style.display = dropdown.style.display === 'block' ? 'none' : 'block';
+  });
+  document.addEventListener('click', ()=>{ dropdown.style.display='none'; });
+}
+
+// Auto add data-labels for card tables (mobile)
+const enhanceCardTables = ()=>{
+  document.querySelectorAll('table.table-cards').forEach(tbl => {
+    const headers = Array.from(tbl.querySelectorAll('thead th')).map(th => th.textContent.trim());
+    tbl.querySelectorAll('tbody tr').forEach(tr => {
+      Array.from(tr.children).forEach((td, i) => {
+        if (!td.getAttribute('data-label') && headers[i]){
+          td.setAttribute('data-label', headers[i]);
+        }
+      });
+    });
+  });
+};
+enhanceCardTables();
+// Notifications merged in user dropdown (already handled by trigger logic)
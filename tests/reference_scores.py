@@ -0,0 +1,190 @@
+"""积分榜的参考实现：原样保留改为 user_month_scores 汇总之前的逐条计算版本（来自 ceboard/utils.py），
+仅把模块内的相对导入改为 ceboard 包导入，用于校验新实现的结果。
+"""
+from typing import Dict, List
+
+from sqlalchemy import or_
+
+from ceboard.utils import compute_submission_points, month_range
+
+
+def leaderboard_month_and_total(db, year: int, month: int, team_type: str) -> List[Dict[str, float]]:
+    from ceboard.models import Submission, User, PointAdjustment
+    start, end = month_range(year, month)
+    # previous month range
+    if month == 1:
+        prev_year, prev_month = year - 1, 12
+    else:
+        prev_year, prev_month = year, month - 1
+    prev_start, prev_end = month_range(prev_year, prev_month)
+
+    subs_month = (
+        db.query(Submission)
+        .join(User, Submission.user_id == User.id)
+    .filter(User.team_type == team_type)
+    .filter(User.role == 'member')
+    .filter(User.is_deleted == False)
+    .filter(or_(User.show_on_leaderboard == True, User.show_on_leaderboard == None))
+        .filter(Submission.is_deleted == False)
+        .filter(Submission.created_at >= start, Submission.created_at < end)
+        .all()
+    )
+    subs_total = (
+        db.query(Submission)
+        .join(User, Submission.user_id == User.id)
+    .filter(User.team_type == team_type)
+    .filter(User.role == 'member')
+    .filter(User.is_deleted == False)
+    .filter(or_(User.show_on_leaderboard == True, User.show_on_leaderboard == None))
+        .filter(Submission.is_deleted == False)
+        .all()
+    )
+    # previous month submissions
+    subs_prev = (
+        db.query(Submission)
+        .join(User, Submission.user_id == User.id)
+    .filter(User.team_type == team_type)
+    .filter(User.role == 'member')
+    .filter(User.is_deleted == False)
+    .filter(or_(User.show_on_leaderboard == True, User.show_on_leaderboard == None))
+        .filter(Submission.is_deleted == False)
+        .filter(Submission.created_at >= prev_start, Submission.created_at < prev_end)
+        .all()
+    )
+
+    month_by_user: Dict[int, float] = {}
+    prev_by_user: Dict[int, float] = {}
+    total_by_user: Dict[int, float] = {}
+    names: Dict[int, str] = {}
+
+    for s in subs_month:
+        pts = compute_submission_points(s)
+        month_by_user[s.user_id] = month_by_user.get(s.user_id, 0.0) + pts
+        if s.user_id not in names:
+            u = db.get(User, s.user_id); names[s.user_id] = u.username if u else f"uid:{s.user_id}"
+
+    for s in subs_total:
+        pts = compute_submission_points(s)
+        total_by_user[s.user_id] = total_by_user.get(s.user_id, 0.0) + pts
+        if s.user_id not in names:
+            u = db.get(User, s.user_id); names[s.user_id] = u.username if u else f"uid:{s.user_id}"
+
+    for s in subs_prev:
+        pts = compute_submission_points(s)
+        prev_by_user[s.user_id] = prev_by_user.get(s.user_id, 0.0) + pts
+        if s.user_id not in names:
+            u = db.get(User, s.user_id); names[s.user_id] = u.username if u else f"uid:{s.user_id}"
+
+    # apply monthly adjustments
+    adjs_month = (
+        db.query(PointAdjustment)
+        .join(User, PointAdjustment.user_id == User.id)
+    .filter(User.team_type == team_type)
+    .filter(User.role == 'member')
+        .filter(PointAdjustment.is_deleted == False)
+        .filter(PointAdjustment.year == year, PointAdjustment.month == month)
+        .all()
+    )
+    for a in adjs_month:
+        month_by_user[a.user_id] = month_by_user.get(a.user_id, 0.0) + float(a.amount)
+        if a.user_id not in names:
+            u = db.get(User, a.user_id); names[a.user_id] = u.username if u else f"uid:{a.user_id}"
+
+    # apply previous month's adjustments
+    adjs_prev = (
+        db.query(PointAdjustment)
+        .join(User, PointAdjustment.user_id == User.id)
+        .filter(User.team_type == team_type)
+        .filter(User.role == 'member')
+        .filter(PointAdjustment.is_deleted == False)
+        .filter(PointAdjustment.year == prev_year, PointAdjustment.month == prev_month)
+        .all()
+    )
+    for a in adjs_prev:
+        prev_by_user[a.user_id] = prev_by_user.get(a.user_id, 0.0) + float(a.amount)
+        if a.user_id not in names:
+            u = db.get(User, a.user_id); names[a.user_id] = u.username if u else f"uid:{a.user_id}"
+
+    # total adjustments across all months contribute to total_points
+    adjs_total = (
+        db.query(PointAdjustment)
+        .join(User, PointAdjustment.user_id == User.id)
+        .filter(User.team_type == team_type)
+        .filter(User.role == 'member')
+        .filter(PointAdjustment.is_deleted == False)
+        .all()
+    )
+    for a in adjs_total:
+        total_by_user[a.user_id] = total_by_user.get(a.user_id, 0.0) + float(a.amount)
+        if a.user_id not in names:
+            u = db.get(User, a.user_id); names[a.user_id] = u.username if u else f"uid:{a.user_id}"
+
+    user_ids = set(names.keys()) | set(month_by_user.keys()) | set(prev_by_user.keys()) | set(total_by_user.keys())
+    rows = [
+        {
+            "user_id": uid,
+            "username": names.get(uid, f"uid:{uid}"),
+            "month_points": float(month_by_user.get(uid, 0.0)),
+            "prev_month_points": float(prev_by_user.get(uid, 0.0)),
+            "total_points": float(total_by_user.get(uid, 0.0)),
+        }
+        for uid in user_ids
+    ]
+    rows.sort(key=lambda r: (r["month_points"], r["total_points"]), reverse=True)
+    return rows
+
+
+def leaderboard_count_approved(db, year: int, month: int, team_type: str) -> List[Dict[str, float]]:
+    """基于通过题目数量的排行榜（不使用积分），排除管理员账号。"""
+    from ceboard.models import Submission, User
+    start, end = month_range(year, month)
+
+    subs_month = (
+        db.query(Submission)
+        .join(User, Submission.user_id == User.id)
+        .filter(User.team_type == team_type)
+        .filter(User.role == 'member')
+        .filter(User.is_deleted == False)
+        .filter(Submission.is_deleted == False)
+        .filter(Submission.created_at >= start, Submission.created_at < end)
+        .all()
+    )
+    subs_total = (
+        db.query(Submission)
+        .join(User, Submission.user_id == User.id)
+        .filter(User.team_type == team_type)
+        .filter(User.role == 'member')
+        .filter(User.is_deleted == False)
+        .filter(Submission.is_deleted == False)
+        .all()
+    )
+
+    month_by_user: Dict[int, int] = {}
+    total_by_user: Dict[int, int] = {}
+    names: Dict[int, str] = {}
+
+    def count_ok(sub):
+        return sum(1 for it in sub.items if it.approved and not it.revoked)
+
+    for s in subs_month:
+        month_by_user[s.user_id] = month_by_user.get(s.user_id, 0) + count_ok(s)
+        if s.user_id not in names:
+            u = db.get(User, s.user_id); names[s.user_id] = u.username if u else f"uid:{s.user_id}"
+
+    for s in subs_total:
+        total_by_user[s.user_id] = total_by_user.get(s.user_id, 0) + count_ok(s)
+        if s.user_id not in names:
+            u = db.get(User, s.user_id); names[s.user_id] = u.username if u else f"uid:{s.user_id}"
+
+    user_ids = set(names.keys()) | set(month_by_user.keys()) | set(total_by_user.keys())
+    rows = [
+        {
+            "user_id": uid,
+            "username": names.get(uid, f"uid:{uid}"),
+            "month_count": int(month_by_user.get(uid, 0)),
+            "total_count": int(total_by_user.get(uid, 0)),
+        }
+        for uid in user_ids
+    ]
+    rows.sort(key=lambda r: (r["month_count"], r["total_count"]), reverse=True)
+    return rows
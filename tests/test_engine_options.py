@@ -0,0 +1,58 @@
+"""engine_options 按方言生成的连接参数，以及（设置了 DATABASE_URL 时）PostgreSQL 上的实际会话设置。"""
+import pytest
+from sqlalchemy import create_engine, text
+
+from ceboard.config import (DB_MAX_OVERFLOW, DB_POOL_PRE_PING, DB_POOL_RECYCLE, DB_POOL_SIZE, DB_POOL_TIMEOUT,
+                            DB_STATEMENT_TIMEOUT, DB_TIMEZONE)
+from ceboard.config import _database_url
+from ceboard.database import engine_options
+
+POOL_OPTIONS = {
+    "pool_size": DB_POOL_SIZE,
+    "max_overflow": DB_MAX_OVERFLOW,
+    "pool_timeout": DB_POOL_TIMEOUT,
+    "pool_recycle": DB_POOL_RECYCLE,
+    "pool_pre_ping": DB_POOL_PRE_PING,
+}
+
+
+def test_sqlite_options():
+    assert engine_options("sqlite:///x.db") == {"connect_args": {"check_same_thread": False}}
+
+
+@pytest.mark.parametrize("url", ["postgresql://u:p@db/ceboard", "postgresql+psycopg2://u:p@db/ceboard", "postgresql+psycopg://u:p@db/ceboard"])
+def test_postgresql_options(url):
+    opts = engine_options(url)
+    assert {k: opts[k] for k in POOL_OPTIONS} == POOL_OPTIONS
+    options = opts["connect_args"]["options"].split()
+    assert f"timezone={DB_TIMEZONE}" in options
+    assert (f"statement_timeout={DB_STATEMENT_TIMEOUT}" in options) == (DB_STATEMENT_TIMEOUT > 0)
+
+
+@pytest.mark.parametrize("url, expected", [
+    ("postgres://u:p@db/ceboard", "postgresql+psycopg2://u:p@db/ceboard"),
+    ("postgresql://u:p@db/ceboard", "postgresql+psycopg2://u:p@db/ceboard"),
+    ("postgresql+psycopg://u:p@db/ceboard", "postgresql+psycopg://u:p@db/ceboard"),
+    ("sqlite:///x.db", "sqlite:///x.db"),
+    (None, None),
+])
+def test_database_url_driver(url, expected):
+    assert _database_url(url) == expected
+
+
+def test_other_server_databases_get_pool_only():
+    assert engine_options("mysql://u:p@db/ceboard") == POOL_OPTIONS
+
+
+def test_postgresql_session_settings(pg_url):
+    """只读检查：连接后会话时区与语句超时已按 engine_options 设置。"""
+    pg_engine = create_engine(pg_url, **engine_options(pg_url))
+    try:
+        with pg_engine.connect() as conn:
+            assert conn.execute(text("SHOW TimeZone")).scalar() == DB_TIMEZONE
+            timeout_ms = conn.execute(text(
+                "SELECT setting::int FROM pg_settings WHERE name = 'statement_timeout'"
+            )).scalar()
+            assert timeout_ms == max(DB_STATEMENT_TIMEOUT, 0)
+    finally:
+        pg_engine.dispose()
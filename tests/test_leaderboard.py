@@ -0,0 +1,61 @@
+"""user_month_scores 汇总出的排行榜与原先逐条计算的版本（tests/reference_scores.py）逐行一致。"""
+import pytest
+
+from ceboard import models as M
+from ceboard.scores import cached_leaderboard, rebuild_user_month_scores, refresh_for_submissions
+from ceboard.utils import leaderboard_count_approved, leaderboard_month_and_total
+from conftest import NOW, seed_data
+import reference_scores
+
+# 排序键（与 utils 中的排序一致）
+POINT_KEYS = ("month_points", "total_points")
+COUNT_KEYS = ("month_count", "total_count")
+MONTHS = [(NOW.year, NOW.month), (NOW.year, NOW.month - 1), (NOW.year, NOW.month - 3), (NOW.year + 1, 1)]
+
+
+def _assert_same_rows(got, expected, keys):
+    """完整比较每一行（user_id、username 与各项数值）及排名顺序。
+    参考实现中同分成员的先后取决于集合的遍历顺序，新实现按 user_id 排列；因此排名按分数逐位比较，
+    同分成员比较集合，并要求新实现的同分成员按 user_id 升序。
+    """
+    assert len(got) == len(expected)
+    assert [r[k] for r in got for k in keys] == pytest.approx([r[k] for r in expected for k in keys])
+    by_id = {r["user_id"]: r for r in expected}
+    assert by_id.keys() == {r["user_id"] for r in got}
+    for r in got:
+        assert r.keys() == by_id[r["user_id"]].keys()
+        assert r == pytest.approx(by_id[r["user_id"]]), r["user_id"]
+    for a, b in zip(got, got[1:]):
+        if all(a[k] == b[k] for k in keys):
+            assert a["user_id"] < b["user_id"]
+
+
+def _assert_matches_reference(db):
+    for year, month in MONTHS:
+        for team in ("main", "sub"):
+            _assert_same_rows(leaderboard_month_and_total(db, year, month, team),
+                              reference_scores.leaderboard_month_and_total(db, year, month, team), POINT_KEYS)
+            _assert_same_rows(leaderboard_count_approved(db, year, month, team),
+                              reference_scores.leaderboard_count_approved(db, year, month, team), COUNT_KEYS)
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3, 4])
+def test_leaderboard_matches_reference(db, seed):
+    seed_data(db, seed=seed)
+    _assert_matches_reference(db)
+
+
+def test_leaderboard_after_incremental_refresh(db):
+    """审核改动走增量刷新后，缓存的排行榜、全量重建与参考实现三者一致。"""
+    seed_data(db, seed=5)
+    items = db.query(M.SubmissionItem).order_by(M.SubmissionItem.id).limit(30).all()
+    for it in items:
+        it.approved, it.revoked = not it.approved, False
+    subs = db.query(M.Submission).filter(M.Submission.id.in_({it.submission_id for it in items})).all()
+    refresh_for_submissions(db, subs)
+    db.commit()
+    _assert_matches_reference(db)
+    incremental = cached_leaderboard(db, NOW.year, NOW.month, "main")
+    rebuild_user_month_scores(db)
+    db.commit()
+    _assert_same_rows(incremental, leaderboard_month_and_total(db, NOW.year, NOW.month, "main"), POINT_KEYS)
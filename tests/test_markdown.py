@@ -0,0 +1,79 @@
+"""Markdown 渲染：进程池不阻塞事件循环；缺失的预渲染 HTML 查看时现场渲染、不写回。"""
+import asyncio
+
+import pytest
+
+from ceboard import models as M
+from ceboard import render_pool
+from ceboard.render_pool import render_in_pool, render_in_pool_async
+from ceboard.utils import prerender_html_async, prerender_stored_html, render_markdown
+
+WP = "# 标题\n\n**粗体** <script>alert(1)</script>\n\n" + "- 条目\n" * 200
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    """开启一个工作进程的渲染池，较短的文本也交给进程池。"""
+    monkeypatch.setattr(render_pool, "MD_RENDER_WORKERS", 1)
+    monkeypatch.setattr(render_pool, "MD_RENDER_THRESHOLD", 100)
+    yield
+    render_pool.shutdown_render_pool()
+
+
+def test_render_in_pool_refuses_to_block_the_event_loop():
+    async def call():
+        return render_in_pool(WP)
+    with pytest.raises(RuntimeError):
+        asyncio.run(call())
+
+
+def test_render_in_pool_async_yields_to_the_loop(pool):
+    async def main():
+        ticks = 0
+        done = asyncio.Event()
+
+        async def ticker():
+            nonlocal ticks
+            while not done.is_set():
+                ticks += 1
+                await asyncio.sleep(0.001)
+
+        t = asyncio.create_task(ticker())
+        html = await render_in_pool_async(WP)
+        done.set()
+        await t
+        return html, ticks
+
+    html, ticks = asyncio.run(main())
+    assert html == render_markdown(WP)
+    # 首次调用要启动工作进程，等待期间事件循环继续运行其他任务
+    assert ticks > 1
+
+
+def test_prerender_html_async_uses_pool(pool, monkeypatch):
+    calls = []
+
+    async def fake_pool(md_text):
+        calls.append(md_text)
+        return "<p>pool</p>"
+
+    monkeypatch.setattr("ceboard.utils.render_in_pool_async", fake_pool)
+    assert asyncio.run(prerender_html_async(WP + "x")) == "<p>pool</p>"
+    assert calls == [WP + "x"]
+
+
+def test_view_renders_missing_wp_html_without_saving(client, seeded):
+    """GET 页面现场渲染缺失的 wp_html 但不写库；render-markdown 的 prerender_stored_html 负责补齐。"""
+    admin = seeded.query(M.User).filter(M.User.username == "admin").one()
+    sub = M.Submission(user_id=admin.id, event_id=seeded.query(M.Event.id).first()[0], wp_md=WP, wp_html=None)
+    seeded.add(sub)
+    seeded.commit()
+    r = client.get(f"/submission/{sub.id}")
+    assert r.status_code == 200
+    assert "<script>" not in r.text and "<strong>粗体</strong>" in r.text
+    seeded.expire_all()
+    assert seeded.get(M.Submission, sub.id).wp_html is None
+    assert prerender_stored_html(seeded) >= 1
+    seeded.commit()
+    seeded.expire_all()
+    assert seeded.get(M.Submission, sub.id).wp_html == render_markdown(WP)
@@ -0,0 +1,44 @@
+"""迁移步骤：在已建好的库上重复执行时的效果。"""
+from sqlalchemy import inspect, select, text
+
+from ceboard.database import Base, engine
+from ceboard.migrations import _TS_TABLES, step_created_ts, step_drop_unused_ts_indexes
+from ceboard.models import epoch_of
+
+UNUSED_TS_INDEXES = {
+    "submission_items": "ix_submission_items_ts",
+    "notification_messages": "ix_notification_messages_ts",
+    "point_adjustments": "ix_point_adjustments_ts",
+}
+
+
+def _index_names(conn, table):
+    return {ix["name"] for ix in inspect(conn).get_indexes(table)}
+
+
+def test_drop_unused_ts_indexes(db):
+    with engine.begin() as conn:
+        for table, name in UNUSED_TS_INDEXES.items():
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} (created_ts)"))
+        step_drop_unused_ts_indexes(conn)
+        for table, name in UNUSED_TS_INDEXES.items():
+            assert name not in _index_names(conn, table)
+        # 仍被按月查询使用的提交时间戳索引保留
+        assert {"ix_submissions_user_ts", "ix_submissions_live_ts"} <= _index_names(conn, "submissions")
+
+
+def test_created_ts_backfill(seeded):
+    """step_created_ts 按 created_at 回填缺失的 created_ts（SQLite 按本地时间文本换算，PostgreSQL 取 epoch），与 epoch_of 一致。"""
+    tables = [Base.metadata.tables[name] for name in _TS_TABLES]
+    expected = {
+        t.name: {row_id: epoch_of(created_at) for row_id, created_at in seeded.execute(select(t.c.id, t.c.created_at))}
+        for t in tables
+    }
+    seeded.close()
+    with engine.begin() as conn:
+        for t in tables:
+            conn.execute(t.update().values(created_ts=None))
+        step_created_ts(conn)
+        for t in tables:
+            got = dict(conn.execute(select(t.c.id, t.c.created_ts)).all())
+            assert expected[t.name] and got == expected[t.name], t.name
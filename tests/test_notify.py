@@ -0,0 +1,52 @@
+"""通知的集合写入：广播的 INSERT ... SELECT 回执与未读计数列。"""
+import pytest
+
+from ceboard import models as M
+from ceboard.notify import audience_filter, broadcast_notification, mark_all_read, recount_unread
+from conftest import NOW
+
+
+def _unread(db):
+    db.expire_all()
+    return {u.id: u.unread_notifications or 0 for u in db.query(M.User)}
+
+
+@pytest.mark.parametrize("audience, role", [("all", None), ("main", None), ("role", "reviewer")])
+def test_broadcast_reaches_the_audience(seeded, audience, role):
+    db = seeded
+    expected = {
+        u.id for u in db.query(M.User)
+        if not u.is_deleted and u.is_active and (audience == "all" or u.team_type == audience or u.role == role)
+    }
+    before = _unread(db)
+    msg, n = broadcast_notification(db, audience_filter(audience, role=role), "system", "广播", "内容", batch_id="bc")
+    db.commit()
+    receipts = db.query(M.NotificationReceipt).filter(M.NotificationReceipt.message_id == msg.id).all()
+    assert n == len(receipts) == len(expected)
+    assert {r.user_id for r in receipts} == expected
+    assert all(r.read_at is None and not r.is_deleted for r in receipts)
+    after = _unread(db)
+    assert after == {uid: c + (uid in expected) for uid, c in before.items()}
+    # 增量维护的计数与从回执表重算的结果一致
+    recount_unread(db)
+    db.commit()
+    assert _unread(db) == after
+
+
+def test_broadcast_without_recipients_writes_nothing(seeded):
+    db = seeded
+    msg, n = broadcast_notification(db, audience_filter("ids", user_ids=[-1]), "system", "广播", "内容")
+    assert (msg, n) == (None, 0)
+    assert db.query(M.NotificationMessage).filter(M.NotificationMessage.title == "广播").count() == 0
+
+
+def test_mark_all_read(seeded):
+    db = seeded
+    user = db.query(M.User).order_by(M.User.unread_notifications.desc(), M.User.id).first()
+    unread = user.unread_notifications
+    assert unread
+    assert mark_all_read(db, user.id, NOW) == unread
+    db.commit()
+    assert _unread(db)[user.id] == 0
+    recount_unread(db, M.User.id == user.id)
+    assert _unread(db)[user.id] == 0
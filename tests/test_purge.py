@@ -0,0 +1,113 @@
+"""垃圾箱的彻底删除：影响范围、dry_run 预览与删除后的积分。"""
+import pytest
+
+from ceboard import models as M
+from ceboard.notify import set_receipts_deleted
+from ceboard.purge import purge_challenge, purge_event, purge_notification, purge_submission, purge_user
+from ceboard.scores import rebuild_user_month_scores
+from ceboard.utils import leaderboard_month_and_total
+from conftest import NOW
+
+
+def _referenced_challenge(db):
+    """被至少两个提交引用、且其中有已通过条目的题目。"""
+    rows = (
+        db.query(M.SubmissionItem.challenge_id)
+        .filter(M.SubmissionItem.approved == True)
+        .group_by(M.SubmissionItem.challenge_id)
+        .order_by(M.SubmissionItem.challenge_id)
+        .all()
+    )
+    for (ch_id,) in rows:
+        if db.query(M.SubmissionItem).filter(M.SubmissionItem.challenge_id == ch_id).count() >= 2:
+            return ch_id
+    pytest.skip("样本中没有被多个提交引用的题目")
+
+
+def _stats(db):
+    return {s.id: (s.points_cached, s.ok_count) for s in db.query(M.Submission).order_by(M.Submission.id)}
+
+
+def _assert_scores_consistent(db):
+    """增量维护的计分列与月度汇总和全量重建的结果一致。"""
+    stats = _stats(db)
+    board = leaderboard_month_and_total(db, NOW.year, NOW.month, "main")
+    rebuild_user_month_scores(db)
+    db.flush()
+    db.expire_all()
+    assert _stats(db) == stats
+    assert leaderboard_month_and_total(db, NOW.year, NOW.month, "main") == board
+
+
+def test_purge_challenge_keeps_submissions(seeded):
+    db = seeded
+    ch_id = _referenced_challenge(db)
+    sub_ids = {i for (i,) in db.query(M.SubmissionItem.submission_id).filter(M.SubmissionItem.challenge_id == ch_id)}
+    n_items = db.query(M.SubmissionItem).filter(M.SubmissionItem.challenge_id == ch_id).count()
+    other_items = db.query(M.SubmissionItem).filter(M.SubmissionItem.challenge_id != ch_id).count()
+
+    assert purge_challenge(db, ch_id, dry_run=True) == {"submission_items": n_items, "challenges": 1}
+    assert purge_challenge(db, ch_id) == {"submission_items": n_items, "challenges": 1}
+    db.commit()
+
+    assert db.get(M.Challenge, ch_id) is None
+    # 引用该题目的条目删除，所属提交与其他条目保留
+    assert db.query(M.SubmissionItem).filter(M.SubmissionItem.challenge_id == ch_id).count() == 0
+    assert db.query(M.SubmissionItem).count() == other_items
+    assert db.query(M.Submission).filter(M.Submission.id.in_(sub_ids)).count() == len(sub_ids)
+    _assert_scores_consistent(db)
+
+
+def test_purge_event_and_submission(seeded):
+    db = seeded
+    event_id = db.query(M.Submission.event_id).order_by(M.Submission.id).first()[0]
+    n_subs = db.query(M.Submission).filter(M.Submission.event_id == event_id).count()
+    preview = purge_event(db, event_id, dry_run=True)
+    assert preview["submissions"] == n_subs and preview["events"] == 1
+    assert purge_event(db, event_id) == preview
+    db.commit()
+    assert db.query(M.Submission).filter(M.Submission.event_id == event_id).count() == 0
+    assert db.query(M.Challenge).filter(M.Challenge.event_id == event_id).count() == 0
+
+    sub = db.query(M.Submission).order_by(M.Submission.id).first()
+    n_items = len(sub.items)
+    assert purge_submission(db, sub.id) == {"submission_items": n_items, "submissions": 1}
+    db.commit()
+    _assert_scores_consistent(db)
+
+
+def test_purge_user(seeded):
+    db = seeded
+    user = db.query(M.User).filter(M.User.role != "admin").order_by(M.User.id).first()
+    uid = user.id
+    n_subs = db.query(M.Submission).filter(M.Submission.user_id == user.id).count()
+    n_receipts = db.query(M.NotificationReceipt).filter(M.NotificationReceipt.user_id == user.id).count()
+    preview = purge_user(db, user.id, dry_run=True)
+    assert preview["submissions"] == n_subs and preview["notification_receipts"] == n_receipts and preview["users"] == 1
+    assert purge_user(db, user.id) == preview
+    db.commit()
+    for model in (M.Submission, M.PointAdjustment, M.NotificationReceipt, M.UserMonthScore):
+        assert db.query(model).filter(model.user_id == uid).count() == 0
+    assert db.query(M.User).filter(M.User.id == uid).count() == 0
+    _assert_scores_consistent(db)
+
+
+def test_purge_notification_keeps_live_receipts(seeded):
+    db = seeded
+    msg = db.query(M.NotificationMessage).order_by(M.NotificationMessage.id).first()
+    msg_id = msg.id
+    receipts = db.query(M.NotificationReceipt).filter(M.NotificationReceipt.message_id == msg_id).order_by(M.NotificationReceipt.id).all()
+    receipts[0].is_deleted = True
+    db.commit()
+    # 还有未删除的回执：只删除已删除的回执，正文保留
+    assert purge_notification(db, msg_id, dry_run=True) == {"notification_receipts": 1, "notification_messages": int(len(receipts) == 1)}
+    purge_notification(db, msg_id)
+    db.commit()
+    assert db.query(M.NotificationReceipt).filter(M.NotificationReceipt.message_id == msg_id).count() == len(receipts) - 1
+    # 全部回执进入垃圾箱后连同正文一起删除
+    if len(receipts) > 1:
+        set_receipts_deleted(db, msg, True)
+        db.commit()
+        assert purge_notification(db, msg_id) == {"notification_receipts": len(receipts) - 1, "notification_messages": 1}
+        db.commit()
+    assert db.query(M.NotificationMessage).filter(M.NotificationMessage.id == msg_id).count() == 0
@@ -0,0 +1,49 @@
+"""页面的 SQL 语句数预算：语句数固定，不随数据量增长（防止 N+1 回归）。"""
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from ceboard import models as M
+from conftest import admin_client, reset_db, seed_data
+
+# 首次访问（缓存为空）时允许的语句数上限；页面新增查询时需有意识地调整
+BUDGETS = {
+    "/": 7,
+    "/admin/review": 6,
+    "/user/{uid}": 5,
+}
+
+
+@contextmanager
+def count_queries():
+    """统计期间在所有引擎（读写及只读）上执行的语句。"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(Engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(Engine, "before_cursor_execute", before_cursor_execute)
+
+
+def _page_statements(db, path, n_subs):
+    reset_db()
+    seed_data(db, n_subs=n_subs)
+    uid = db.query(M.User.id).filter(M.User.role == "member", M.User.is_deleted == False).order_by(M.User.id).first()[0]
+    with admin_client() as c, count_queries() as statements:
+        r = c.get(path.format(uid=uid))
+    assert r.status_code == 200
+    return statements
+
+
+@pytest.mark.parametrize("path", sorted(BUDGETS))
+def test_page_query_budget(db, path):
+    small = _page_statements(db, path, n_subs=40)
+    large = _page_statements(db, path, n_subs=400)
+    assert len(large) <= BUDGETS[path], "\n".join(large)
+    assert len(large) == len(small), "\n".join(large)
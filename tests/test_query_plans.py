@@ -0,0 +1,57 @@
+"""高频页面与积分函数实际执行的 SQL 的执行计划（SQLite）：记录语句后逐条 EXPLAIN，大表不做全表扫描。"""
+import html
+import re
+
+import pytest
+
+from ceboard import models as M
+from ceboard import notify, scores
+from ceboard.database import engine
+from ceboard.manage import capture_statements, explain_statements, hot_path_samples, run_hot_paths
+
+pytestmark = pytest.mark.skipif(engine.dialect.name != "sqlite", reason="EXPLAIN QUERY PLAN 仅适用于 SQLite")
+
+
+def _hot_urls(client, db):
+    """首页、个人主页、提交详情、通知、审核中心（含键集翻页）与管理页面。"""
+    sub = db.query(M.Submission).filter(M.Submission.is_deleted == False).order_by(M.Submission.id).first()
+    member = db.query(M.User).filter(M.User.is_deleted == False, M.User.role == "member").order_by(M.User.id).first()
+    r = client.get("/admin/review?status=all")
+    next_url = html.unescape(re.search(r'<a href="(/admin/review\?[^"]*)" aria-label="下一页"', r.text).group(1))
+    return [
+        "/", f"/user/{member.id}", f"/submission/{sub.id}", "/notifications", "/my/submissions",
+        "/admin/review", "/admin/review?status=all", next_url, "/admin/review?status=all&page=3",
+        f"/admin/review/{sub.id}", "/admin/advanced", f"/admin/users/{member.id}", "/admin/adjustments",
+    ]
+
+
+def _assert_plans_ok(db, statements):
+    results = explain_statements(db, statements)
+    assert results
+    bad = [(" ".join(stmt.split()), details, problems) for stmt, details, problems in results if problems]
+    assert bad == []
+
+
+def test_route_plans(client, seeded):
+    urls = _hot_urls(client, seeded)
+    # 排行榜与未读预览有进程内缓存，清空后才会真正查询
+    scores._leaderboard_cache.clear()
+    scores._count_cache.clear()
+    notify._unread_cache.clear()
+    with capture_statements() as statements:
+        for url in urls:
+            assert client.get(url).status_code == 200, url
+    assert any("user_month_scores" in stmt for stmt, _ in statements)
+    _assert_plans_ok(seeded, statements)
+
+
+def test_score_function_plans(seeded):
+    user, sub = hot_path_samples(seeded)
+    assert user.unread_notifications
+    with capture_statements() as statements:
+        run_hot_paths(seeded, user, sub)
+    try:
+        assert any(stmt.lstrip().startswith("UPDATE") for stmt, _ in statements)
+        _assert_plans_ok(seeded, statements)
+    finally:
+        seeded.rollback()
@@ -0,0 +1,48 @@
+"""审核中心的键集分页：翻页期间插入新提交，上一页 / 下一页的内容保持不变。"""
+import html
+import re
+from datetime import timedelta
+
+from ceboard import models as M
+from conftest import NOW
+
+
+def _page(client, url):
+    r = client.get(url)
+    assert r.status_code == 200
+    ids = [int(x) for x in re.findall(r'href="/admin/review/(\d+)"', r.text)]
+    links = {label: html.unescape(href) for href, label in re.findall(r'<a href="(/admin/review\?[^"]*)" aria-label="(上一页|下一页)"', r.text)}
+    return ids, links
+
+
+def _insert_newer(db, n):
+    member = db.query(M.User).filter(M.User.role == "member").first()
+    event_id = db.query(M.Event.id).first()[0]
+    db.add_all([M.Submission(user_id=member.id, event_id=event_id, created_at=NOW + timedelta(hours=i + 1)) for i in range(n)])
+    db.commit()
+
+
+def test_cursor_pages_stable_across_inserts(client, seeded):
+    page1, links1 = _page(client, "/admin/review?status=all")
+    page2, links2 = _page(client, links1["下一页"])
+    page3, links3 = _page(client, links2["下一页"])
+    assert len(page1) == len(page2) == len(page3) == 10
+    assert not set(page1) & set(page2) and not set(page2) & set(page3)
+
+    # 新提交排在最前，OFFSET 分页会让后续页整体后移
+    _insert_newer(seeded, 3)
+    assert _page(client, links1["下一页"])[0] == page2
+    assert _page(client, links3["上一页"])[0] == page2
+    assert _page(client, links2["上一页"])[0] == page1
+
+
+def test_last_page_reads_from_the_tail(client, seeded):
+    first, _ = _page(client, "/admin/review?status=all")
+    total = seeded.query(M.Submission).filter(M.Submission.is_deleted == False).count()
+    last_page = (total + 9) // 10
+    ids, _ = _page(client, f"/admin/review?status=all&page={last_page}")
+    expected = [
+        sid for (sid,) in seeded.query(M.Submission.id).filter(M.Submission.is_deleted == False)
+        .order_by(M.Submission.created_at.desc(), M.Submission.id.desc()).offset((last_page - 1) * 10)
+    ]
+    assert ids == expected and ids[0] not in first
@@ -0,0 +1,54 @@
+"""HTML 清洗：每个已安装的后端对 XSS 样例都只输出白名单内的标签、属性与链接协议，且各后端同样严格。"""
+import markdown as mdlib
+import pytest
+
+from ceboard.sanitize import XSS_SAMPLES, available_backends, start_tags, unsafe_parts, url_scheme
+from ceboard.utils import render_markdown
+
+BACKENDS = available_backends()
+
+
+def _render(md_text):
+    return mdlib.markdown(md_text, extensions=["fenced_code", "tables"]) or ""
+
+
+def test_some_backend_installed():
+    assert BACKENDS, "未安装 bleach 或 nh3"
+
+
+@pytest.mark.parametrize("backend", sorted(BACKENDS))
+@pytest.mark.parametrize("sample", XSS_SAMPLES)
+def test_backend_strips_unsafe_html(backend, sample):
+    assert unsafe_parts(BACKENDS[backend](_render(sample))) == []
+
+
+@pytest.mark.parametrize("sample", XSS_SAMPLES)
+def test_render_markdown_strips_unsafe_html(sample):
+    assert unsafe_parts(render_markdown(sample)) == []
+
+
+@pytest.mark.parametrize("backend", sorted(BACKENDS))
+def test_backend_keeps_allowed_links(backend):
+    html = BACKENDS[backend](_render("[a](https://example.com/x) [b](mailto:a@b.c)\n\n| x |\n|---|\n| 1 |"))
+    assert 'href="https://example.com/x"' in html
+    assert 'href="mailto:a@b.c"' in html
+    assert "<table>" in html
+
+
+@pytest.mark.skipif(len(BACKENDS) < 2, reason="需要同时安装 bleach 与 nh3")
+@pytest.mark.parametrize("sample", XSS_SAMPLES)
+def test_backends_equally_strict(sample):
+    """bleach 与 nh3 保留相同的标签序列，每个标签的属性与取值（包括 rel、target）也相同；
+    被丢弃元素的文字（bleach 保留 <script> 的文字并转义，nh3 连同内容删除）不比较。
+    唯一允许的差异：一方删除、另一方保留的链接属性必须是相对地址（如含空格的 "java   script:"，浏览器不会当作协议）。
+    """
+    html = _render(sample)
+    a, b = start_tags(BACKENDS["bleach"](html)), start_tags(BACKENDS["nh3"](html))
+    assert [tag for tag, _ in a] == [tag for tag, _ in b]
+    for (tag, attrs_a), (_, attrs_b) in zip(a, b):
+        for name in attrs_a.keys() | attrs_b.keys():
+            va, vb = attrs_a.get(name), attrs_b.get(name)
+            if va == vb:
+                continue
+            kept = va if vb is None else vb if va is None else None
+            assert name in ("href", "src") and kept is not None and url_scheme(kept) is None, (tag, name, va, vb)
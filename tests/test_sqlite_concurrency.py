@@ -0,0 +1,54 @@
+"""SQLite 读写分离：两个引擎都处于 WAL 模式；写连接持有排他锁（BEGIN EXCLUSIVE）期间，只读连接（mode=ro）照常读取且不等待。
+
+回滚日志模式下 EXCLUSIVE 锁会挡住所有读者，因此关闭 WAL（SQLITE_JOURNAL_MODE=DELETE）时本用例失败。
+"""
+import time
+
+import pytest
+from sqlalchemy import text
+
+from ceboard.database import engine, read_engine
+
+pytestmark = pytest.mark.skipif(
+    engine.dialect.name != "sqlite" or read_engine is engine, reason="仅适用于启用读写分离的 SQLite"
+)
+
+
+@pytest.mark.parametrize("eng", [engine, read_engine], ids=["write", "read"])
+def test_journal_mode_is_wal(eng):
+    with eng.connect() as conn:
+        assert conn.execute(text("PRAGMA journal_mode")).scalar().lower() == "wal"
+
+
+def test_read_only_connection_not_blocked_by_writer(seeded):
+    before = seeded.execute(text("SELECT count(*) FROM submissions")).scalar()
+    seeded.close()
+    writer = engine.raw_connection()
+    # 连接在加锁前取出；它们都改过 busy_timeout，用完即丢弃，不放回连接池
+    other = engine.raw_connection()
+    reader = read_engine.raw_connection()
+    try:
+        cur = writer.cursor()
+        cur.execute("BEGIN EXCLUSIVE")
+        cur.execute("DELETE FROM submissions")
+        # 写锁确实被占用：另一个写连接不等待时立即失败
+        other.cursor().execute("PRAGMA busy_timeout = 0")
+        with pytest.raises(Exception, match="locked"):
+            other.cursor().execute("BEGIN IMMEDIATE")
+        # 读者不等待锁：被挡住时立即报 locked，而不是等满 busy_timeout
+        rcur = reader.cursor()
+        rcur.execute("PRAGMA busy_timeout = 0")
+        started = time.monotonic()
+        rcur.execute("SELECT count(*) FROM submissions")
+        seen = rcur.fetchone()[0]
+        elapsed = time.monotonic() - started
+        # 读到写事务开始前的快照
+        assert seen == before
+        assert elapsed < 1.0
+        with pytest.raises(Exception, match="readonly"):
+            rcur.execute("DELETE FROM submissions")
+    finally:
+        other.invalidate()
+        reader.invalidate()
+        writer.rollback()
+        writer.close()